@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import List
+
+from ..core.database import get_db
+from ..services.library_service import LibraryService
+from ..services.watcher_service import WatcherService
+from ..schemas.library_roots import LibraryRoot, LibraryRootCreate, LibraryRootUpdate
+
+libraryRootsRouter = APIRouter()
+
+@libraryRootsRouter.get("/", response_model=List[LibraryRoot], summary="获取所有根目录")
+def get_all_roots(db: Session = Depends(get_db)):
+    """获取所有根目录及其视频数量"""
+    return LibraryService.get_all_roots(db)
+
+@libraryRootsRouter.post("/", response_model=LibraryRoot, summary="添加根目录")
+def create_root(root: LibraryRootCreate, db: Session = Depends(get_db)):
+    """添加根目录，添加后需扫描该根目录以导入视频"""
+    try:
+        created = LibraryService.create_root(db, root.name, root.path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    WatcherService.restart()
+    return created
+
+@libraryRootsRouter.put("/{root_id}", response_model=LibraryRoot, summary="修改根目录")
+def update_root(root_id: int, root: LibraryRootUpdate, db: Session = Depends(get_db)):
+    """修改根目录的名称或路径"""
+    try:
+        updated = LibraryService.update_root(db, root_id, root.name, root.path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not updated:
+        raise HTTPException(status_code=404, detail="根目录不存在")
+    WatcherService.restart()
+    return updated
+
+@libraryRootsRouter.delete("/{root_id}", summary="删除根目录")
+def delete_root(root_id: int, db: Session = Depends(get_db)):
+    """删除根目录及其下的视频记录，不会删除视频文件"""
+    if not LibraryService.delete_root(db, root_id):
+        raise HTTPException(status_code=404, detail="根目录不存在")
+    WatcherService.restart()
+    return {"message": "根目录已删除"}
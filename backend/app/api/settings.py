@@ -2,6 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from ..core.database import get_db
 from ..services.setting_service import SettingService
+from ..services.library_service import LibraryService
+from ..services.watcher_service import WatcherService
 from ..schemas.settings import DirectoryPath, VideosPerPageSetting, SettingUpdate, SettingResponse
 from typing import List, Dict
 
@@ -9,12 +11,18 @@ settingsRouter = APIRouter()
 
 @settingsRouter.post("/root_directory")
 def set_root_directory(directory_data: DirectoryPath, db: Session = Depends(get_db)):
-    SettingService.set_root_directory(db, directory_data.directory_path)
+    # 兼容单根目录的用法：修改第一个根目录，多个根目录通过 /api/library-roots 管理
+    try:
+        LibraryService.set_default_root(db, directory_data.directory_path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    WatcherService.restart()
     return {"message": "Root directory updated successfully"}
 
 @settingsRouter.get("/root_directory")
 def get_root_directory(db: Session = Depends(get_db)):
-    root_dir = SettingService.get_root_directory(db)
+    root = LibraryService.get_default_root(db)
+    root_dir = root.path if root else SettingService.get_root_directory(db)
     return {"root_directory": root_dir}
 
 @settingsRouter.post("/videos_per_page")
@@ -30,11 +38,18 @@ def get_videos_per_page(db: Session = Depends(get_db)):
 @settingsRouter.post("/setting")
 def set_setting(setting_data: SettingUpdate, db: Session = Depends(get_db)):
     # 验证设置键的有效性
-    valid_keys = ["root_directory", "videos_per_page"]
+    valid_keys = ["root_directory", "videos_per_page", "scan_probe_workers", "scan_probe_timeout", "scan_batch_size", "scan_walk_workers", "duplicate_hash_workers", "thumbnail_workers", "thumbnail_queue_size", "thumbnail_backfill", "thumbnail_keyframe_only", "thumbnail_position", "storyboard_frames", "hls_mode", "hls_cache_size"]
     if setting_data.key not in valid_keys:
         raise HTTPException(status_code=400, detail=f"Invalid setting key. Valid keys: {valid_keys}")
     
-    SettingService.set_setting(db, setting_data.key, setting_data.value)
+    if setting_data.key == "root_directory":
+        try:
+            LibraryService.set_default_root(db, setting_data.value)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        WatcherService.restart()
+    else:
+        SettingService.set_setting(db, setting_data.key, setting_data.value)
     return {"message": f"Setting '{setting_data.key}' updated successfully"}
 
 @settingsRouter.get("/setting/{key}")
@@ -1,39 +1,58 @@
-from fastapi import APIRouter, Depends, Query, HTTPException, Request, BackgroundTasks, UploadFile, File, Body
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, UploadFile, File, Body
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, Response
 from sqlalchemy.orm import Session
-from typing import List, Dict
+from typing import List, Dict, Optional
 import os
 import time
 import asyncio
+import json
+import base64
 import logging
-from datetime import datetime
-from ..core.database import get_db
-from ..services.video_service import VideoService
+from ..core.database import get_db, SessionLocal
+from ..core.range_response import serve_file
+from ..services.video_service import VideoService, THUMBNAIL_MIME_TYPES
+from ..services.scan_job_service import ScanJobService
+from ..services.duplicate_service import DuplicateService
 from ..services.tag_service import TagService
+from ..services.library_service import LibraryService
+from ..services.storyboard_service import StoryboardService
+from ..services.remux_service import RemuxService, RemuxError
+from ..services.hls_service import HlsService
+from ..services.thumbnail_service import ThumbnailService, PLACEHOLDER_SVG, PRIORITY_REQUEST, PRIORITY_PAGE, PRIORITY_PREFETCH
 from ..models.video import Video as VideoModel
-from ..models.setting import Setting
 from ..schemas.videos import Video, VideoProgressUpdate, VideoProgress
 from ..schemas.page import Page
 from ..schemas.tags import VideoTagUpdate
-from ..core.scan_status import get_scan_status, reset_scan_status
+from ..schemas.scan_jobs import ScanJob
+from ..schemas.duplicates import DuplicateReport
+from ..core.scan_status import get_scan_status, get_scan_version
 
 logger = logging.getLogger(__name__)
 
 videosRouter = APIRouter()
 
 @videosRouter.get("/scan", summary="异步扫描视频文件")
-def scan_videos(db: Session = Depends(get_db), background_tasks: BackgroundTasks = None):
-    """异步扫描并同步视频文件"""
-    # 重置扫描状态
-    reset_scan_status()
-    
-    # 启动异步扫描任务
-    background_tasks.add_task(VideoService.scan_videos, db)
-    
+def scan_videos(
+    incremental: bool = Query(True, description="增量扫描，只处理新增或变化的文件"),
+    root_id: Optional[int] = Query(None, description="只扫描指定的根目录，为空时扫描全部根目录"),
+    db: Session = Depends(get_db)
+):
+    """异步扫描并同步视频文件，已有扫描任务在执行时不会重复启动"""
+    if root_id is not None and not LibraryService.get_root_by_id(db, root_id):
+        raise HTTPException(status_code=404, detail="根目录不存在")
+    job, started = ScanJobService.start_scan(db, incremental, root_id)
+    if not started:
+        return JSONResponse({
+            "message": "已有扫描任务正在执行",
+            "status": "processing",
+            "job_id": job.id
+        })
+
     # 立即返回响应
     return JSONResponse({
         "message": "视频扫描任务已启动",
-        "status": "processing"
+        "status": "processing",
+        "job_id": job.id
     })
 
 @videosRouter.get("/scan/progress", summary="获取视频扫描进度")
@@ -41,6 +60,146 @@ def get_scan_progress():
     """获取视频扫描进度"""
     return get_scan_status()
 
+# 推送扫描进度时检查状态变化的间隔和心跳间隔（秒）
+SCAN_PUSH_INTERVAL = 0.25
+SCAN_HEARTBEAT_INTERVAL = 15
+
+@videosRouter.get("/scan/progress/stream", summary="推送视频扫描进度")
+async def stream_scan_progress(request: Request):
+    """以 Server-Sent Events 推送扫描进度
+
+    状态变化时推送一条 progress 事件，内容与 /scan/progress 相同，
+    另附耗时、处理速度和预计剩余时间；频繁的计数变化会合并为每 0.25 秒最多一条。
+    """
+    async def event_stream():
+        last_version = None
+        last_sent = time.monotonic()
+        while not await request.is_disconnected():
+            version = get_scan_version()
+            now = time.monotonic()
+            if version != last_version:
+                last_version = version
+                last_sent = now
+                yield f"event: progress\ndata: {json.dumps(get_scan_status(), ensure_ascii=False)}\n\n"
+            elif now - last_sent >= SCAN_HEARTBEAT_INTERVAL:
+                # 心跳注释，避免代理因空闲断开连接
+                last_sent = now
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(SCAN_PUSH_INTERVAL)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@videosRouter.get("/scan/jobs", response_model=List[ScanJob], summary="获取扫描任务列表")
+def list_scan_jobs(limit: int = Query(20, description="返回的记录数"), db: Session = Depends(get_db)):
+    """获取最近的扫描任务"""
+    return [ScanJob.model_validate(job) for job in ScanJobService.list_jobs(db, limit)]
+
+@videosRouter.get("/scan/jobs/{job_id}", response_model=ScanJob, summary="获取扫描任务")
+def get_scan_job(job_id: int, db: Session = Depends(get_db)):
+    """获取扫描任务的阶段和计数"""
+    job = ScanJobService.get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Scan job not found")
+    return ScanJob.model_validate(job)
+
+@videosRouter.post("/scan/jobs/{job_id}/cancel", summary="取消扫描任务")
+def cancel_scan_job(job_id: int, db: Session = Depends(get_db)):
+    """取消扫描任务，已写入的结果会保留"""
+    if not ScanJobService.cancel_scan(db, job_id):
+        raise HTTPException(status_code=409, detail="Scan job is not running")
+    return {"message": "扫描任务正在取消", "job_id": job_id}
+
+@videosRouter.post("/scan/jobs/{job_id}/resume", summary="续扫扫描任务")
+def resume_scan_job(job_id: int, db: Session = Depends(get_db)):
+    """从检查点继续被中断、取消或失败的扫描任务"""
+    job, started = ScanJobService.resume_scan(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Scan job not found")
+    if not started:
+        if job.id != job_id:
+            raise HTTPException(status_code=409, detail=f"Scan job {job.id} is already running")
+        raise HTTPException(status_code=409, detail=f"Scan job in state '{job.state}' cannot be resumed")
+    return {"message": "扫描任务已继续", "job_id": job.id}
+
+@videosRouter.post("/duplicates/scan", summary="查找重复视频")
+def scan_duplicates():
+    """在后台查找重复视频，结果通过 /duplicates 获取"""
+    if not DuplicateService.start():
+        return {"message": "查重任务正在执行", "status": "processing"}
+    return {"message": "查重任务已启动", "status": "processing"}
+
+@videosRouter.get("/duplicates", response_model=DuplicateReport, summary="获取重复视频")
+def get_duplicates():
+    """获取最近一次查重的进度和重复视频组"""
+    return DuplicateService.get_report()
+
+@videosRouter.get("/thumbnails/status", summary="获取缩略图队列状态")
+def get_thumbnail_queue_status():
+    """获取后台缩略图队列的排队、生成中和失败数量，以及打包存储的大小"""
+    return {**ThumbnailService.get_status(), "store": ThumbnailService.get_store_stats()}
+
+@videosRouter.post("/thumbnails/compact", summary="压缩缩略图存储")
+def compact_thumbnail_store(full: bool = Query(False, description="重写整个存储文件以消除碎片，期间会阻塞缩略图写入")):
+    """回收删除缩略图后打包存储中留下的空闲空间"""
+    try:
+        reclaimed = ThumbnailService.compact(full)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to compact thumbnail store: {str(e)}")
+    return {"reclaimed_size": reclaimed, "store": ThumbnailService.get_store_stats()}
+
+# 批量缩略图接口单次最多返回的视频数
+THUMBNAIL_BATCH_LIMIT = 100
+
+@videosRouter.get("/thumbnails/batch", summary="批量获取缩略图")
+def get_thumbnails_batch(
+    request: Request,
+    ids: str = Query(..., description="视频ID列表，逗号分隔"),
+    w: Optional[int] = Query(None, ge=1, le=4096, description="期望的宽度（像素），返回不小于该宽度的最小档位"),
+    db: Session = Depends(get_db)
+):
+    """一次返回一页卡片的缩略图，图片以 data URI 内联在 JSON 中，格式按 Accept 头协商
+
+    只需一次会话和一次查询，取代每张卡片各自请求 /{video_id}/thumbnail。
+    尚未生成的缩略图加入后台队列并列在 pending 中，前端稍后按单张地址重试；
+    最近生成失败的列在 failed 中。
+    """
+    try:
+        video_ids = list(dict.fromkeys(int(video_id) for video_id in ids.split(",") if video_id.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid video ids")
+    if len(video_ids) > THUMBNAIL_BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {THUMBNAIL_BATCH_LIMIT} videos per request")
+
+    width, fmt = _thumbnail_variant(request, w)
+    videos = db.query(VideoModel).filter(VideoModel.id.in_(video_ids)).all() if video_ids else []
+    resolved = ThumbnailService.resolve_variants(videos, width, fmt)
+
+    thumbnails = {}
+    pending = []
+    failed = []
+    for video in videos:
+        if video.id in resolved:
+            data, width, fmt = resolved[video.id]
+            thumbnails[video.id] = {
+                "src": f"data:{THUMBNAIL_MIME_TYPES[fmt]};base64,{base64.b64encode(data).decode('ascii')}",
+                "width": width,
+                "format": fmt,
+            }
+        elif ThumbnailService.has_failed(video.id):
+            failed.append(video.id)
+        else:
+            ThumbnailService.enqueue(video.id, PRIORITY_REQUEST)
+            pending.append(video.id)
+
+    return JSONResponse(
+        content={"thumbnails": thumbnails, "pending": pending, "failed": failed},
+        headers={"Cache-Control": "no-store", "Vary": "Accept"}
+    )
+
 @videosRouter.get("/list", response_model=Page[Video], summary="获取视频列表")
 def get_videos(
     page: int = Query(1, description="页码"),
@@ -59,6 +218,8 @@ def get_videos(
     duration: str = Query(None, description="视频时长"),
     sort_by: str = Query('filename', description="排序字段"),
     seed: int = Query(None, description="随机排序种子"),
+    resolution: str = Query(None, description="分辨率档位：2160p / 1440p / 1080p / 720p / sd"),
+    video_codec: str = Query(None, description="视频编码，如 h264、hevc"),
     db: Session = Depends(get_db)
 ):
     """获取视频列表，兼容前端和后端两种参数格式"""
@@ -94,9 +255,29 @@ def get_videos(
         tags=tag_list,
         duration=final_duration,
         sort_by=final_sort_by,
-        seed=final_seed
+        seed=final_seed,
+        resolution=resolution,
+        video_codec=video_codec
     )
     
+    # 当前页和下一页缺少缩略图的视频提前加入后台生成队列
+    ThumbnailService.prefetch(videos, PRIORITY_PAGE)
+    if final_skip + final_limit < total:
+        next_videos, _ = VideoService.get_videos_by_filters(
+            db,
+            skip=final_skip + final_limit,
+            limit=final_limit,
+            keyword=final_keyword,
+            is_favorite=final_favorite,
+            tags=tag_list,
+            duration=final_duration,
+            sort_by=final_sort_by,
+            seed=final_seed,
+            resolution=resolution,
+            video_codec=video_codec
+        )
+        ThumbnailService.prefetch(next_videos, PRIORITY_PREFETCH)
+
     # 统一返回Page格式
     total_pages = (total + final_limit - 1) // final_limit
     return Page(
@@ -147,239 +328,278 @@ def update_video_web_playable(video_id: int, web_playable: bool, db: Session = D
         raise HTTPException(status_code=500, detail="Failed to update video web playable status")
     return {"message": "Video web playable status updated successfully"}
 
+# 版本化的缩略图地址内容不会变化，可以永久缓存
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+
+def _thumbnail_variant(request: Request, width: Optional[int]) -> tuple:
+    """根据 w 参数和 Accept 头选择缩略图的宽度档位和格式"""
+    width = ThumbnailService.select_width(width)
+    fmt = ThumbnailService.select_format(request.headers.get("accept", ""))
+    return width, fmt
+
+
+def _thumbnail_response(request: Request, video_id: int, db: Session, version: str = None, width: int = None):
+    video = VideoService.get_video_by_id(db, video_id)
+    if not video:
+        raise HTTPException(status_code=404, detail="Video not found")
+
+    if ThumbnailService.is_ready(video):
+        thumbnail_hash = ThumbnailService.ensure_hash(db, video)
+        width, fmt = _thumbnail_variant(request, width)
+        # 上传的缩略图只有默认宽度的 JPEG，缺少的档位回退到主文件
+        data, width, fmt = ThumbnailService.resolve_variant(video.thumbnail_path, width, fmt)
+        etag = ThumbnailService.variant_etag(thumbnail_hash, width, fmt)
+        # 版本号与当前内容一致时可以永久缓存，旧版本或无版本的地址每次都需要验证
+        cache_control = IMMUTABLE_CACHE if version and version == thumbnail_hash else "no-cache"
+        headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept"}
+        if thumbnail_hash and _etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        # 缩略图直接从打包存储的内存映射页中读出，不需要打开文件
+        if data is not None:
+            return Response(content=data, media_type=THUMBNAIL_MIME_TYPES[fmt], headers=headers)
+
+    if ThumbnailService.has_failed(video_id):
+        raise HTTPException(status_code=500, detail="Failed to generate thumbnail")
+
+    ThumbnailService.enqueue(video_id, PRIORITY_REQUEST)
+    # 占位图不能被缓存，生成完成后再次请求即可得到真实缩略图
+    return Response(
+        content=PLACEHOLDER_SVG,
+        media_type="image/svg+xml",
+        headers={"Cache-Control": "no-store", "X-Thumbnail-Status": "pending"}
+    )
+
 @videosRouter.get("/{video_id}/thumbnail", summary="获取视频缩略图")
-def get_video_thumbnail(video_id: int, db: Session = Depends(get_db)):
-    """获取视频缩略图，按需生成"""
-    
+def get_video_thumbnail(
+    video_id: int,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=4096, description="期望的宽度（像素），返回不小于该宽度的最小档位"),
+    db: Session = Depends(get_db)
+):
+    """获取视频缩略图，按 Accept 头协商 AVIF / WebP / JPEG，支持 ETag 协商缓存
+
+    缩略图尚未生成时以最高优先级加入后台队列，立即返回占位图，不在请求中运行 ffmpeg。
+    列表接口返回的 thumbnail_url 带有内容版本号，应优先使用。
+    """
+    return _thumbnail_response(request, video_id, db, width=w)
+
+@videosRouter.get("/{video_id}/thumbnail/{version}", summary="获取指定版本的视频缩略图")
+def get_video_thumbnail_version(
+    video_id: int,
+    version: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=4096, description="期望的宽度（像素），返回不小于该宽度的最小档位")
+):
+    """按内容哈希寻址的缩略图，响应可永久缓存
+
+    版本号即内容哈希，ETag 由版本号、宽度档位和协商出的格式组成，
+    If-None-Match 与之相同时直接返回304，不查询数据库。
+    """
+    etag = ThumbnailService.variant_etag(version, *_thumbnail_variant(request, w))
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": IMMUTABLE_CACHE, "Vary": "Accept"})
+    db = SessionLocal()
+    try:
+        return _thumbnail_response(request, video_id, db, version, w)
+    finally:
+        db.close()
+
+@videosRouter.get("/{video_id}/storyboard", summary="获取视频预览图索引")
+def get_video_storyboard(video_id: int, db: Session = Depends(get_db)):
+    """获取拖动进度条时的预览图索引（WebVTT），尚未生成时加入后台队列并返回202"""
+    video = VideoService.get_video_by_id(db, video_id)
+    if not video:
+        raise HTTPException(status_code=404, detail="Video not found")
+
+    vtt_path = StoryboardService.get_vtt_path(db, video)
+    if vtt_path:
+        return FileResponse(vtt_path, media_type="text/vtt", headers={"Cache-Control": "no-cache"})
+    if StoryboardService.has_failed(video_id):
+        raise HTTPException(status_code=404, detail="Storyboard not available")
+    StoryboardService.enqueue(video_id)
+    return JSONResponse({"message": "预览图正在生成", "status": "processing"}, status_code=202)
+
+@videosRouter.get("/{video_id}/storyboard/{version}/{filename}", summary="获取视频预览拼图")
+def get_video_storyboard_sprite(video_id: int, version: str, filename: str):
+    """预览拼图按版本寻址，内容不会变化，可永久缓存"""
+    sprite_path = StoryboardService.get_sprite_path(video_id, version, filename)
+    if not sprite_path:
+        raise HTTPException(status_code=404, detail="Storyboard not found")
+    return FileResponse(sprite_path, media_type="image/jpeg", headers={"Cache-Control": IMMUTABLE_CACHE})
+
+# 视频文件扩展名对应的 Content-Type
+VIDEO_CONTENT_TYPES = {
+    '.mp4': 'video/mp4',
+    '.avi': 'video/x-msvideo',
+    '.mkv': 'video/x-matroska',
+    '.mov': 'video/quicktime',
+    '.wmv': 'video/x-ms-wmv',
+    '.webm': 'video/webm',
+    '.flv': 'video/x-flv',
+    '.m4v': 'video/x-m4v',
+    '.3gp': 'video/3gpp',
+    '.ts': 'video/mp2t',
+    '.mpg': 'video/mpeg',
+    '.mpeg': 'video/mpeg'
+}
+
+@videosRouter.api_route("/{video_id}/stream", methods=["GET", "HEAD"], summary="流式播放视频")
+def stream_video(video_id: int, request: Request, db: Session = Depends(get_db)):
+    """流式播放视频文件，按 RFC 7233 处理 Range 请求
+
+    定义为同步函数，数据库查询和 stat 在线程池中进行，不阻塞事件循环；
+    返回的响应在事件循环中发送，打开、读取和关闭文件在专用的 I/O 线程池中进行。
+
+    支持 HEAD、后缀区间（bytes=-n）、多区间（multipart/byteranges）、If-Range，
+    以及基于 ETag / Last-Modified 的条件请求。
+    服务器支持 ASGI zero-copy send 扩展时由服务器用 sendfile 直接发送文件区间，
+    否则按块读取发送，均不做额外的限速。
+    """
     # 获取视频信息
     video = VideoService.get_video_by_id(db, video_id)
     if not video:
+        logger.warning(f"Video not found: {video_id}")
         raise HTTPException(status_code=404, detail="Video not found")
-    
-    # 检查是否已有缩略图且文件存在
-    if video.thumbnail_generated and video.thumbnail_path:
-        # 构建缩略图的绝对路径 - 修复路径计算
-        # 从backend目录向上两级到达项目根目录
-        project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-        thumbnail_abs_path = os.path.join(project_root, video.thumbnail_path)
-        if os.path.exists(thumbnail_abs_path):
-            return FileResponse(thumbnail_abs_path)
-    
-    # 按需生成缩略图
+
+    # 获取视频文件完整路径
+    video_path = LibraryService.get_video_path(db, video)
+    if not video_path:
+        logger.error(f"Root directory not configured for video {video_id}")
+        raise HTTPException(status_code=404, detail="Root directory not set")
+
+    # 根据文件扩展名设置Content-Type
+    content_type = VIDEO_CONTENT_TYPES.get(os.path.splitext(video_path)[1].lower(), 'application/octet-stream')
+
+    headers = {
+        "Cache-Control": "public, max-age=31536000",
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Methods": "GET, HEAD, OPTIONS",
+        "Access-Control-Expose-Headers": "Content-Range, Content-Length, Accept-Ranges, ETag",
+    }
     try:
-        # 获取root_directory设置
-        root_dir = db.query(Setting).filter(Setting.key == "root_directory").first()
-        if not root_dir or not root_dir.value:
-            raise HTTPException(status_code=404, detail="Root directory not set")
-        
-        # 构建视频文件的绝对路径
-        video_abs_path = os.path.join(root_dir.value, video.filepath)
-        
-        thumbnail_rel_path = VideoService.generate_thumbnail(video_abs_path)
-        if thumbnail_rel_path:
-            # 构建缩略图的绝对路径用于文件检查和返回 - 修复路径计算
-            # 从backend目录向上两级到达项目根目录
-            project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-            thumbnail_abs_path = os.path.join(project_root, thumbnail_rel_path)
-            
-            if os.path.exists(thumbnail_abs_path):
-                # 更新数据库中的缩略图路径和状态（存储相对路径）
-                video.thumbnail_path = thumbnail_rel_path
-                video.thumbnail_generated = True
-                video.updated_at = datetime.now()
-                db.commit()
-                logger.info(f"Generated thumbnail for video {video_id}: {thumbnail_rel_path}")
-                return FileResponse(thumbnail_abs_path)
-        else:
-            # 标记生成失败，避免重复尝试
-            video.thumbnail_generated = False
-            db.commit()
-            raise HTTPException(status_code=500, detail="Failed to generate thumbnail")
+        return serve_file(request, video_path, content_type, headers)
+    except OSError:
+        logger.error(f"Video file not found at path: {video_path}")
+        raise HTTPException(status_code=404, detail="Video file not found")
+
+
+def _remux_source(
+    video_id: int,
+    start: float = Query(0, ge=0, description="开始位置（秒），拖动进度时用新的位置重新请求"),
+    db: Session = Depends(get_db)
+):
+    """返回可以转封装的视频及其文件路径；作为同步依赖在线程池中执行，数据库查询和文件检查不阻塞事件循环"""
+    video = VideoService.get_video_by_id(db, video_id)
+    if not video:
+        raise HTTPException(status_code=404, detail="Video not found")
+    if not RemuxService.can_remux(video):
+        raise HTTPException(status_code=415, detail=f"Video codec {video.video_codec or 'unknown'} cannot be remuxed to MP4")
+    if video.duration and start >= video.duration:
+        raise HTTPException(status_code=400, detail="start is beyond the end of the video")
+
+    video_path = LibraryService.get_video_path(db, video)
+    if not video_path or not os.path.isfile(video_path):
+        raise HTTPException(status_code=404, detail="Video file not found")
+    return video, video_path
+
+
+@videosRouter.get("/{video_id}/remux", summary="转封装为分片MP4播放")
+async def remux_video(
+    video_id: int,
+    start: float = Query(0, ge=0, description="开始位置（秒），拖动进度时用新的位置重新请求"),
+    source: tuple = Depends(_remux_source)
+):
+    """把 MKV、AVI、TS、FLV 等浏览器不能直接打开的容器实时转封装为分片 MP4
+
+    视频流原样复制，不重新编码，只有浏览器不支持的音频编码会转为 AAC。
+    输出不支持 Range，实际开始位置是 start 之前最近的关键帧。
+    """
+    video, video_path = source
+    try:
+        chunks = await RemuxService.open_stream(video_path, start, video.audio_codec)
+    except RemuxError as e:
+        logger.error(f"Remux failed for video {video_id}: {e}")
+        raise HTTPException(status_code=500, detail="Remux failed")
+
+    headers = {
+        "Cache-Control": "no-store",
+        "Accept-Ranges": "none",
+        "Access-Control-Allow-Origin": "*",
+    }
+    if video.duration:
+        headers["X-Content-Duration"] = f"{video.duration - start:.3f}"
+    return StreamingResponse(chunks, media_type="video/mp4", headers=headers)
+
+
+@videosRouter.get("/{video_id}/playback", summary="获取视频播放方式")
+def get_video_playback(video_id: int, db: Session = Depends(get_db)):
+    """按 hls_mode 设置和视频编码决定播放器使用 HLS 还是直接读取文件"""
+    video = VideoService.get_video_by_id(db, video_id)
+    if not video:
+        raise HTTPException(status_code=404, detail="Video not found")
+    if HlsService.should_use(db, video):
+        return {"type": "hls", "src": f"/api/videos/{video_id}/hls/index.m3u8"}
+    return {"type": "file", "src": f"/api/videos/{video_id}/stream"}
+
+
+def _hls_source(db: Session, video_id: int):
+    """返回可以切片的视频及其文件路径"""
+    video = VideoService.get_video_by_id(db, video_id)
+    if not video:
+        raise HTTPException(status_code=404, detail="Video not found")
+    if not HlsService.can_play(video):
+        raise HTTPException(status_code=415, detail=f"Video codec {video.video_codec or 'unknown'} is not supported by HLS")
+    video_path = LibraryService.get_video_path(db, video)
+    if not video_path or not os.path.isfile(video_path):
+        raise HTTPException(status_code=404, detail="Video file not found")
+    return video, video_path
+
+
+@videosRouter.get("/{video_id}/hls/index.m3u8", summary="获取HLS播放列表")
+def get_hls_playlist(video_id: int, db: Session = Depends(get_db)):
+    """按关键帧切分的 VOD 播放列表，首次请求时需要遍历一次文件的数据包"""
+    video, video_path = _hls_source(db, video_id)
+    try:
+        index = HlsService.get_index(video, video_path)
     except Exception as e:
-        # 标记生成失败
-        video.thumbnail_generated = False
-        db.commit()
-        logger.error(f"Error generating thumbnail for video {video_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to generate thumbnail")
+        logger.error(f"Failed to index keyframes of video {video_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to index keyframes")
+    return Response(
+        content=HlsService.build_playlist(index),
+        media_type="application/vnd.apple.mpegurl",
+        headers={"Cache-Control": "no-cache"}
+    )
+
 
-@videosRouter.get("/{video_id}/stream", summary="流式播放视频")
-async def stream_video(video_id: int, request: Request, db: Session = Depends(get_db)):
-    """流式播放视频文件，支持自适应分块传输和网络拥塞控制"""
+@videosRouter.get("/{video_id}/hls/{version}/{filename}", summary="获取HLS片段")
+def get_hls_segment(video_id: int, version: str, filename: str, request: Request, db: Session = Depends(get_db)):
+    """按需切出的 MPEG-TS 片段，地址带版本号，可永久缓存"""
+    segment = HlsService.parse_segment_name(version, filename)
+    if segment is None:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    video, video_path = _hls_source(db, video_id)
+    if version != HlsService.version(video):
+        # 视频文件已变化，播放器需要重新请求播放列表
+        raise HTTPException(status_code=404, detail="Segment version is outdated")
     try:
-        # 获取视频信息
-        video = VideoService.get_video_by_id(db, video_id)
-        if not video:
-            logger.warning(f"Video not found: {video_id}")
-            raise HTTPException(status_code=404, detail="Video not found")
-        
-        # 获取root_directory设置
-        root_dir = db.query(Setting).filter(Setting.key == "root_directory").first()
-        if not root_dir or not root_dir.value:
-            logger.error("Root directory not configured")
-            raise HTTPException(status_code=404, detail="Root directory not set")
-        
-        # 获取视频文件完整路径
-        video_path = os.path.join(root_dir.value, video.filepath)
-        if not os.path.exists(video_path):
-            logger.error(f"Video file not found at path: {video_path}")
-            raise HTTPException(status_code=404, detail="Video file not found")
-        
-        # 获取文件大小
-        file_size = os.path.getsize(video_path)
-        logger.info(f"Starting video stream for video_id: {video_id}, size: {file_size} bytes")
-        
-        # 自适应分块大小设置（根据文件大小调整）
-        base_chunk_size = 512 * 1024  # 基础块大小512KB
-        if file_size > 2 * 1024 * 1024 * 1024:  # 大于2GB
-            chunk_size = 4 * 1024 * 1024  # 4MB
-        elif file_size > 1024 * 1024 * 1024:  # 大于1GB
-            chunk_size = 2 * 1024 * 1024  # 2MB
-        elif file_size > 100 * 1024 * 1024:  # 大于100MB
-            chunk_size = 1024 * 1024  # 1MB
-        else:
-            chunk_size = base_chunk_size
-        
-        # 设置超时和重试参数
-        timeout = 60  # 增加超时时间到60秒
-        max_retries = 3  # 最大重试次数
-        retry_delay = 1  # 重试延迟（秒）
-        
-        # 获取和验证Range请求头
-        range_header = request.headers.get("range")
-        start = 0
-        end = file_size - 1
-        
-        if range_header:
-            try:
-                range_data = range_header.replace("bytes=", "").split("-")
-                start = int(range_data[0])
-                if range_data[1]:
-                    end = int(range_data[1])
-                if not (0 <= start <= end < file_size):
-                    raise ValueError("Range out of bounds")
-            except ValueError as e:
-                logger.warning(f"Invalid range header: {range_header}, error: {str(e)}")
-                raise HTTPException(status_code=416, detail="Requested range not satisfiable")
-        
-        content_length = end - start + 1
-        
-        # 定义视频流生成器
-        async def video_stream():
-            retry_count = 0
-            last_activity = time.time()
-            last_throughput = 0
-            congestion_window = chunk_size
-            min_sleep = 0.001  # 最小休眠时间1ms
-            max_sleep = 0.05   # 最大休眠时间50ms
-            
-            try:
-                with open(video_path, "rb") as video_file:
-                    video_file.seek(start)
-                    remaining = content_length
-                    
-                    while remaining > 0:
-                        current_time = time.time()
-                        
-                        # 检查超时
-                        if current_time - last_activity > timeout:
-                            logger.warning(f"Stream timeout for video {video_id}")
-                            break
-                        
-                        try:
-                            # 动态调整读取大小，确保使用整数类型
-                            chunk_size_to_read = int(min(int(congestion_window), remaining, chunk_size))
-                            read_start_time = current_time
-                            
-                            data = video_file.read(chunk_size_to_read)
-                            if not data:
-                                logger.info(f"Reached end of file for video {video_id}")
-                                break
-                            
-                            # 计算传输速率和调整拥塞窗口
-                            transfer_time = time.time() - read_start_time
-                            if transfer_time > 0:
-                                current_throughput = len(data) / transfer_time
-                                throughput_ratio = current_throughput / (last_throughput if last_throughput > 0 else current_throughput)
-                                
-                                if throughput_ratio < 0.8:  # 速度下降超过20%
-                                    # 更激进的拥塞窗口调整
-                                    congestion_window = int(max(base_chunk_size, int(congestion_window * 0.7)))
-                                    sleep_time = min(max_sleep, transfer_time * 0.1)
-                                    await asyncio.sleep(sleep_time)
-                                elif throughput_ratio > 1.2:  # 速度提升超过20%
-                                    # 更保守的拥塞窗口增长
-                                    congestion_window = int(min(chunk_size * 2, int(congestion_window * 1.2)))
-                                    await asyncio.sleep(min_sleep)
-                                else:
-                                    # 保持稳定状态
-                                    await asyncio.sleep(min_sleep)
-                                    
-                                last_throughput = current_throughput
-                            
-                            remaining -= len(data)
-                            last_activity = time.time()
-                            
-                            yield data
-                            
-                        except (ConnectionResetError, BrokenPipeError) as e:
-                            logger.error(f"Connection error while streaming video {video_id}: {str(e)}")
-                            if retry_count < max_retries:
-                                retry_count += 1
-                                logger.info(f"Retrying stream for video {video_id}, attempt {retry_count}")
-                                await asyncio.sleep(retry_delay)
-                                continue
-                            break
-                            
-                        except Exception as e:
-                            logger.error(f"Unexpected error while streaming video {video_id}: {str(e)}")
-                            break
-                            
-            except Exception as e:
-                logger.error(f"Failed to stream video {video_id}: {str(e)}")
-                raise HTTPException(status_code=500, detail="Internal server error")
-            
-            finally:
-                logger.info(f"Stream completed for video {video_id}, remaining bytes: {remaining}")
-        
-        # 根据文件扩展名设置Content-Type
-        file_ext = os.path.splitext(video_path)[1].lower()
-        content_type_map = {
-            '.mp4': 'video/mp4',
-            '.avi': 'video/x-msvideo',
-            '.mkv': 'video/x-matroska',
-            '.mov': 'video/quicktime',
-            '.wmv': 'video/x-ms-wmv',
-            '.webm': 'video/webm',
-            '.flv': 'video/x-flv',
-            '.m4v': 'video/x-m4v',
-            '.3gp': 'video/3gpp',
-            '.ts': 'video/mp2t',
-            '.mpg': 'video/mpeg',
-            '.mpeg': 'video/mpeg'
-        }
-        content_type = content_type_map.get(file_ext, 'application/octet-stream')
-        
-        # 设置响应头
-        headers = {
-            "Content-Range": f"bytes {start}-{end}/{file_size}",
-            "Accept-Ranges": "bytes",
-            "Content-Length": str(content_length),
-            "Content-Type": content_type,
-            "Cache-Control": "public, max-age=31536000",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET, OPTIONS",
-            "Connection": "keep-alive"
-        }
-        
-        return StreamingResponse(
-            video_stream(),
-            status_code=206 if range_header else 200,
-            headers=headers
-        )
-        
+        segment_path = HlsService.get_segment(video, video_path, segment, HlsService.cache_limit(db))
     except Exception as e:
-        logger.error(f"Global error in stream_video for video {video_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail="Internal server error")
+        logger.error(f"Failed to cut HLS segment {filename} of video {video_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to cut segment")
+    if not segment_path:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    try:
+        return serve_file(request, segment_path, "video/mp2t", {"Cache-Control": IMMUTABLE_CACHE})
+    except OSError:
+        raise HTTPException(status_code=404, detail="Segment not found")
 
 
 @videosRouter.put("/{video_id}/thumbnail", summary="设置视频缩略图")
@@ -404,56 +624,36 @@ async def set_video_thumbnail(video_id: int, thumbnail: UploadFile = File(...),
 
 @videosRouter.post("/{video_id}/regenerate-thumbnail", summary="重新生成视频缩略图")
 def regenerate_video_thumbnail(video_id: int, db: Session = Depends(get_db)):
-    """强制重新生成视频缩略图，清理旧文件"""
+    """强制重新生成视频缩略图，清理旧文件；同一视频的并发请求共享一次生成"""
     # 获取视频信息
     video = VideoService.get_video_by_id(db, video_id)
     if not video:
         raise HTTPException(status_code=404, detail="Video not found")
-    
+
+    # 构建视频文件的绝对路径
+    video_abs_path = LibraryService.get_video_path(db, video)
+    if not video_abs_path:
+        raise HTTPException(status_code=404, detail="Root directory not set")
+    if not os.path.exists(video_abs_path):
+        raise HTTPException(status_code=404, detail="Video file not found")
+
+    old_thumbnail_path = video.thumbnail_path
+    # 生成在独立的会话中写库，结束当前读事务
+    db.commit()
     try:
-        # 获取root_directory设置
-        root_dir = db.query(Setting).filter(Setting.key == "root_directory").first()
-        if not root_dir or not root_dir.value:
-            raise HTTPException(status_code=404, detail="Root directory not set")
-        
-        # 构建视频文件的绝对路径
-        video_abs_path = os.path.join(root_dir.value, video.filepath)
-        if not os.path.exists(video_abs_path):
-            raise HTTPException(status_code=404, detail="Video file not found")
-        
-        # 强制重新生成缩略图，传递旧缩略图路径以便清理
-        old_thumbnail_path = video.thumbnail_path
-        thumbnail_rel_path = VideoService.generate_thumbnail(
-            video_abs_path, 
-            force_regenerate=True, 
-            old_thumbnail_path=old_thumbnail_path
-        )
-        
-        if thumbnail_rel_path:
-            # 更新数据库中的缩略图路径和状态
-            video.thumbnail_path = thumbnail_rel_path
-            video.thumbnail_generated = True
-            video.updated_at = datetime.now()
-            db.commit()
-            
-            logger.info(f"Regenerated thumbnail for video {video_id}: {thumbnail_rel_path}")
-            return {
-                "message": "Thumbnail regenerated successfully", 
-                "thumbnail_path": thumbnail_rel_path,
-                "old_thumbnail_cleaned": bool(old_thumbnail_path)
-            }
-        else:
-            # 标记生成失败
-            video.thumbnail_generated = False
-            db.commit()
-            raise HTTPException(status_code=500, detail="Failed to regenerate thumbnail")
-            
+        thumbnail_rel_path = ThumbnailService.regenerate(video_id)
     except Exception as e:
-        # 标记生成失败
-        video.thumbnail_generated = False
-        db.commit()
         logger.error(f"Error regenerating thumbnail for video {video_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to regenerate thumbnail: {str(e)}")
+    if not thumbnail_rel_path:
+        raise HTTPException(status_code=500, detail="Failed to regenerate thumbnail")
+
+    logger.info(f"Regenerated thumbnail for video {video_id}: {thumbnail_rel_path}")
+    return {
+        "message": "Thumbnail regenerated successfully",
+        "thumbnail_path": thumbnail_rel_path,
+        "old_thumbnail_cleaned": bool(old_thumbnail_path)
+    }
 
 
 @videosRouter.put("/{video_id}", summary="重命名")
@@ -464,13 +664,13 @@ async def rename(video_id: int, new_name: str, db: Session = Depends(get_db)):
     if not video:
         raise HTTPException(status_code=404, detail="Video not found")
 
-    # 获取root_directory设置
-    root_dir = db.query(Setting).filter(Setting.key == "root_directory").first()
-    if not root_dir or not root_dir.value:
+    # 获取视频所在根目录
+    root_path = LibraryService.get_root_path(db, video.root_id)
+    if not root_path:
         raise HTTPException(status_code=404, detail="Root directory not set")
 
     # 获取视频文件完整路径
-    video_path = os.path.join(root_dir.value, video.filepath)
+    video_path = os.path.join(root_path, video.filepath)
     if not os.path.exists(video_path):
         raise HTTPException(status_code=404, detail="Video file not found")
 
@@ -501,7 +701,7 @@ async def rename(video_id: int, new_name: str, db: Session = Depends(get_db)):
 
     # 更新数据库中的文件名和文件路径
     video.filename = new_name
-    video.filepath = os.path.relpath(new_filepath, root_dir.value)
+    video.filepath = os.path.relpath(new_filepath, root_path)
     db.commit()
 
     return {"message": "Video renamed successfully"}
@@ -515,13 +715,13 @@ def delete_video(video_id: int, db: Session = Depends(get_db)):
     if not video:
         raise HTTPException(status_code=404, detail="Video not found")
 
-    # 获取root_directory设置
-    root_dir = db.query(Setting).filter(Setting.key == "root_directory").first()
-    if not root_dir or not root_dir.value:
+    # 获取视频所在根目录
+    root_path = LibraryService.get_root_path(db, video.root_id)
+    if not root_path:
         raise HTTPException(status_code=404, detail="Root directory not set")
 
     # 获取视频文件完整路径
-    video_path = os.path.join(root_dir.value, video.filepath)
+    video_path = os.path.join(root_path, video.filepath)
     if not os.path.exists(video_path):
         raise HTTPException(status_code=404, detail="Video file not found")
 
@@ -1,20 +1,92 @@
-from sqlalchemy import create_engine
+from datetime import datetime
+from sqlalchemy import create_engine, inspect, text, UniqueConstraint
+from sqlalchemy.schema import CreateTable
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from ..models.setting import Setting, Base
 from ..models.video import Video
 from ..models.tag import Tag
 from ..models.tag_category import TagCategory
+from ..models.scan_job import ScanJob
+from ..models.library_root import LibraryRoot
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./video_manager.db"
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    # 多个根目录并行扫描时各自的写库线程会争用写锁，等待时间放宽到30秒
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False, "timeout": 30}
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def migrate_db():
+    """为已存在的表补充新增的列和索引
+
+    create_all 只会创建缺失的表，不会修改已有表结构，
+    因此模型新增字段后需要在这里通过 ALTER TABLE 补齐。
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+    # 唯一约束变化的表需要重建
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if table.name in existing_tables and _unique_constraints_changed(inspector, table):
+            _rebuild_table(table)
+    # 新增列上的索引
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    _migrate_library_roots()
+
+def _unique_constraints_changed(inspector, table) -> bool:
+    """比较数据库中的唯一约束与模型定义是否一致"""
+    existing = {tuple(c["column_names"]) for c in inspector.get_unique_constraints(table.name)}
+    expected = {tuple(c.name for c in constraint.columns)
+                for constraint in table.constraints if isinstance(constraint, UniqueConstraint)}
+    # 同时设置 unique 和 index 的列生成的是唯一索引，不在唯一约束中
+    expected |= {(column.name,) for column in table.columns if column.unique and not column.index}
+    return existing != expected
+
+def _rebuild_table(table):
+    """SQLite无法修改已有表的约束，按模型建新表、复制数据后替换旧表"""
+    tmp_name = f"{table.name}_new"
+    ddl = str(CreateTable(table).compile(dialect=engine.dialect))
+    ddl = ddl.replace(f"CREATE TABLE {table.name} ", f"CREATE TABLE {tmp_name} ", 1)
+    columns = ", ".join(f'"{column.name}"' for column in table.columns)
+    with engine.begin() as conn:
+        conn.execute(text(ddl))
+        conn.execute(text(f"INSERT INTO {tmp_name} ({columns}) SELECT {columns} FROM {table.name}"))
+        conn.execute(text(f"DROP TABLE {table.name}"))
+        conn.execute(text(f"ALTER TABLE {tmp_name} RENAME TO {table.name}"))
+    print(f"Rebuilt table {table.name} with updated constraints")
+
+def _migrate_library_roots():
+    """把早期的单一根目录设置迁移为第一个根目录，并把没有根目录的视频归入其中"""
+    with engine.begin() as conn:
+        if not conn.execute(text("SELECT COUNT(*) FROM library_roots")).scalar():
+            root_dir = conn.execute(text("SELECT value FROM settings WHERE key = 'root_directory'")).scalar()
+            if not root_dir:
+                return
+            now = datetime.now()
+            conn.execute(text(
+                "INSERT INTO library_roots (name, path, created_at, updated_at) VALUES (:name, :path, :now, :now)"
+            ), {"name": "默认", "path": root_dir, "now": now})
+        conn.execute(text(
+            "UPDATE videos SET root_id = (SELECT MIN(id) FROM library_roots) WHERE root_id IS NULL"
+        ))
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    migrate_db()
 
 def get_db():
     db = SessionLocal()
@@ -24,4 +96,4 @@ def get_db():
         db.close()
 
 # 初始化数据库表
-init_db()
\ No newline at end of file
+init_db()
@@ -0,0 +1,106 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+
+class WalkEntry(NamedTuple):
+    """遍历得到的文件及其指纹信息"""
+    path: str  # 绝对路径
+    size: int  # 文件大小（字节）
+    mtime: float  # 修改时间（时间戳）
+    inode: int  # inode，无法低成本获取时为0
+
+
+# 遍历结束标记
+_DONE = object()
+
+
+def walk_files(root_path: str, extensions: Tuple[str, ...], workers: int = 8,
+               queue_size: int = 256, batch_size: int = 256,
+               errors: Optional[List[str]] = None) -> Iterator[WalkEntry]:
+    """并行遍历目录，边遍历边返回匹配扩展名的文件
+
+    每个子目录作为一个任务交给线程池，最多 workers 个目录同时被读取，
+    大小和修改时间直接取自 os.scandir 的 DirEntry：Windows 下不需要额外的
+    stat 调用，网络共享目录也只需一次目录枚举的往返。
+
+    Args:
+        errors: 传入列表时，读取失败的目录路径会追加到其中，
+            调用方据此区分"文件已删除"和"目录暂时无法读取"
+    """
+    root_path = os.path.abspath(root_path)
+    output = queue.Queue(maxsize=queue_size)
+    stopped = threading.Event()
+    lock = threading.Lock()
+    pending = 0
+    # Windows 下 DirEntry.inode() 需要额外打开文件，不参与指纹
+    use_inode = os.name != 'nt'
+    executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="file-walker")
+
+    def submit(path: str):
+        nonlocal pending
+        with lock:
+            pending += 1
+        executor.submit(scan_dir, path)
+
+    def scan_dir(path: str):
+        nonlocal pending
+        try:
+            batch = []
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if stopped.is_set():
+                        return
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            submit(entry.path)
+                        elif entry.name.lower().endswith(extensions) and entry.is_file():
+                            st = entry.stat()
+                            batch.append(WalkEntry(
+                                entry.path,
+                                st.st_size,
+                                st.st_mtime,
+                                entry.inode() if use_inode else 0
+                            ))
+                            # 按批放入队列，减少队列加锁开销
+                            if len(batch) >= batch_size:
+                                output.put(batch)
+                                batch = []
+                    except OSError as e:
+                        print(f"Error reading file info for {entry.path}: {str(e)}")
+            if batch:
+                output.put(batch)
+        except OSError as e:
+            print(f"Error scanning directory {path}: {str(e)}")
+            if errors is not None:
+                with lock:
+                    errors.append(path)
+        finally:
+            with lock:
+                pending -= 1
+                finished = pending == 0
+            if finished:
+                output.put(_DONE)
+
+    submit(root_path)
+    try:
+        while True:
+            item = output.get()
+            if item is _DONE:
+                break
+            yield from item
+    finally:
+        # 调用方提前停止时，清空队列让工作线程退出
+        stopped.set()
+        while True:
+            try:
+                output.get_nowait()
+            except queue.Empty:
+                with lock:
+                    if pending == 0:
+                        break
+                time.sleep(0.01)
+        executor.shutdown(wait=False)
@@ -0,0 +1,279 @@
+"""发送文件字节区间的 ASGI 响应（RFC 7232 / RFC 7233）
+
+serve_file 处理条件请求和 Range 请求：
+- ETag（文件大小 + 修改时间）和 Last-Modified，If-None-Match / If-Modified-Since 返回 304
+- Range: bytes=a-b、a-、-n（最后 n 字节），多个区间以 multipart/byteranges 返回
+- If-Range 与当前 ETag 或 Last-Modified 不一致时忽略 Range，返回完整文件
+- 无法满足的区间返回 416，Content-Range: bytes */文件大小
+- HEAD 只返回响应头
+
+服务器支持 ASGI 的 zero-copy send 扩展（http.response.zerocopysend）时，
+把打开的文件交给服务器，由服务器用 os.sendfile 直接从页缓存写入套接字，
+数据不经过 Python；否则退回按块读取文件并逐块发送。
+
+按块发送时，磁盘读取在专用的 I/O 线程池中进行，不占用事件循环，
+也不与 FastAPI 同步接口共用的线程池争抢线程；发送当前块的同时预读下一块。
+打开和关闭文件同样在该线程池中进行；serve_file 中的 stat 会阻塞，调用它的接口应定义为同步函数。
+"""
+import asyncio
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+from typing import List, Mapping, Optional, Tuple
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+# 退回按块发送时每块的大小
+CHUNK_SIZE = 1024 * 1024
+# 读取文件的线程数，冷读取（机械硬盘寻道）时每个流占用一个线程
+IO_WORKERS = 16
+# 合并后区间数超过该值时忽略 Range 返回完整文件，避免大量小区间放大请求开销
+MAX_RANGES = 64
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _io_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="stream-io")
+        return _executor
+
+
+def _read_at(file, offset: int, size: int) -> bytes:
+    """定位到 offset 后读取，定位和第一次读取在同一个 I/O 线程中完成"""
+    file.seek(offset)
+    return file.read(size)
+
+
+class RangeNotSatisfiable(Exception):
+    """Range 语法正确，但没有任何区间落在文件范围内"""
+
+
+def parse_range(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """解析 Range 请求头，返回合并、排序后的 [start, end] 闭区间列表
+
+    单位不是 bytes 或语法错误时返回None（按 RFC 7233 忽略 Range，返回完整文件）；
+    所有区间都无法满足时抛出 RangeNotSatisfiable。
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip():
+        return None
+    ranges = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        first, dash, last = item.partition("-")
+        first, last = first.strip(), last.strip()
+        if not dash or (first and not first.isdigit()) or (last and not last.isdigit()) or not (first or last):
+            return None
+        if not first:
+            # 后缀区间：最后 n 字节
+            suffix = int(last)
+            if suffix > 0 and size > 0:
+                ranges.append((max(0, size - suffix), size - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start < size:
+            ranges.append((start, min(int(last), size - 1) if last else size - 1))
+    if not ranges:
+        raise RangeNotSatisfiable()
+    # 合并重叠或相邻的区间
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _parse_http_date(value: str) -> Optional[float]:
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def serve_file(request: Request, path: str, media_type: str, headers: Optional[Mapping[str, str]] = None) -> Response:
+    """按请求头返回文件的完整内容、一个或多个区间、304 或 416
+
+    os.stat 会阻塞，应在同步接口中调用（FastAPI 在线程池中执行），不要在 async 接口中调用。
+    文件不存在时抛出 OSError，由调用方转换为 404。
+    """
+    st = os.stat(path)
+    size = st.st_size
+    etag = f'"{size:x}-{st.st_mtime_ns:x}"'
+    last_modified = formatdate(st.st_mtime, usegmt=True)
+    headers = {
+        **(headers or {}),
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": last_modified,
+    }
+
+    # 条件请求：If-None-Match 优先于 If-Modified-Since，ETag 使用弱比较
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        if "*" in tags or etag in tags or f"W/{etag}" in tags:
+            return Response(status_code=304, headers=headers)
+    else:
+        since = _parse_http_date(request.headers.get("if-modified-since", ""))
+        if since is not None and int(st.st_mtime) <= since:
+            return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and if_range:
+        # If-Range 使用强比较：ETag 必须完全一致（弱 ETag 永不匹配），日期必须与 Last-Modified 相同
+        if if_range.startswith('"') or if_range.startswith("W/"):
+            valid = if_range == etag
+        else:
+            valid = _parse_http_date(if_range) == _parse_http_date(last_modified)
+        if not valid:
+            range_header = None
+
+    ranges = None
+    if range_header:
+        try:
+            ranges = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if ranges is not None and len(ranges) > MAX_RANGES:
+            ranges = None
+
+    return FileRangeResponse(path, size, ranges, headers=headers, media_type=media_type)
+
+
+class FileRangeResponse(Response):
+    def __init__(self, path: str, size: int, ranges: Optional[List[Tuple[int, int]]] = None,
+                 headers: Optional[Mapping[str, str]] = None, media_type: Optional[str] = None):
+        """发送 path 的完整内容（ranges 为None），或 ranges 中的 [start, end] 闭区间
+
+        一个区间时返回 206 和 Content-Range，多个区间时返回 206 multipart/byteranges。
+        """
+        self.path = path
+        self.background = None
+        self.parts: List[Tuple[bytes, int, int]] = []  # [(分段头, 起始位置, 字节数)]
+        self.trailer = b""
+        headers = dict(headers or {})
+
+        if ranges is None:
+            self.status_code = 200
+            self.media_type = media_type
+            self.parts.append((b"", 0, size))
+            content_length = size
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            self.status_code = 206
+            self.media_type = media_type
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            self.parts.append((b"", start, end - start + 1))
+            content_length = end - start + 1
+        else:
+            boundary = secrets.token_hex(16)
+            self.status_code = 206
+            self.media_type = f"multipart/byteranges; boundary={boundary}"
+            content_length = 0
+            for i, (start, end) in enumerate(ranges):
+                # 分隔符前的 CRLF 属于分隔符，第一段之前不需要
+                part_header = (
+                    f"--{boundary}\r\n"
+                    f"Content-Type: {media_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+                ).encode("latin-1")
+                if i > 0:
+                    part_header = b"\r\n" + part_header
+                self.parts.append((part_header, start, end - start + 1))
+                content_length += len(part_header) + end - start + 1
+            self.trailer = f"\r\n--{boundary}--\r\n".encode("latin-1")
+            content_length += len(self.trailer)
+
+        headers["Content-Length"] = str(content_length)
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # 先打开文件再发送响应头，文件在此期间被删除时仍能返回错误状态码；
+        # 打开和关闭都在 I/O 线程池中进行，不阻塞事件循环
+        loop = asyncio.get_running_loop()
+        executor = _io_executor()
+        file = await loop.run_in_executor(executor, open, self.path, "rb")
+        try:
+            await self._send_file(file, scope, receive, send)
+        finally:
+            await loop.run_in_executor(executor, file.close)
+
+    async def _send_file(self, file, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        zerocopy = ZEROCOPY_EXTENSION in scope.get("extensions", {})
+        disconnected = asyncio.Event()
+
+        async def listen_for_disconnect():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                    return
+
+        listener = None if zerocopy else asyncio.ensure_future(listen_for_disconnect())
+        try:
+            for part_header, start, count in self.parts:
+                if part_header:
+                    await send({"type": "http.response.body", "body": part_header, "more_body": True})
+                if count <= 0:
+                    continue
+                if zerocopy:
+                    await send({
+                        "type": ZEROCOPY_EXTENSION,
+                        "file": file,
+                        "offset": start,
+                        "count": count,
+                        "more_body": True,
+                    })
+                elif not await self._send_chunks(file, start, count, send, disconnected):
+                    return
+            await send({"type": "http.response.body", "body": self.trailer, "more_body": False})
+        finally:
+            if listener is not None:
+                listener.cancel()
+
+    async def _send_chunks(self, file, start: int, count: int, send: Send, disconnected: asyncio.Event) -> bool:
+        """逐块读取并发送一个区间，客户端断开或文件被截短时返回False"""
+        loop = asyncio.get_running_loop()
+        executor = _io_executor()
+        # 同一时间只有一个读取在进行，文件位置按顺序前进
+        reading = loop.run_in_executor(executor, _read_at, file, start, min(CHUNK_SIZE, count))
+        remaining = count
+        try:
+            while reading is not None:
+                data = await reading
+                reading = None
+                if not data or disconnected.is_set():
+                    # 文件在发送过程中被截短，或客户端已断开（例如播放器拖动进度条后放弃旧请求）
+                    return False
+                remaining -= len(data)
+                # 双缓冲：先发起下一块的读取，再发送当前块
+                if remaining > 0:
+                    reading = loop.run_in_executor(executor, file.read, min(CHUNK_SIZE, remaining))
+                await send({"type": "http.response.body", "body": data, "more_body": True})
+            return True
+        finally:
+            # 等预读结束后再关闭文件，关闭操作不会阻塞事件循环
+            if reading is not None:
+                await asyncio.wait([reading])
@@ -1,4 +1,6 @@
-from typing import Dict
+import time
+from collections import deque
+from typing import Dict, Optional
 
 # 全局扫描状态
 scan_status: Dict = {
@@ -6,27 +8,109 @@ scan_status: Dict = {
     "status": "",    # 当前状态描述
     "completed": False,  # 是否完成
     "total_files": 0,  # 总文件数
-    "processed_files": 0  # 已处理文件数
+    "processed_files": 0,  # 已处理文件数
+    "added": 0,  # 新增文件数
+    "changed": 0,  # 变化文件数
+    "removed": 0,  # 删除记录数
+    "moved": 0,  # 移动文件数
+    "unchanged": 0,  # 未变化文件数
+    "failed_files": 0,  # 写入数据库失败的文件数
+    "job_id": None,  # 当前扫描任务ID
+    "phase": "",  # 当前扫描阶段
+    "state": ""  # 扫描任务状态
 }
 
+# 状态版本号，每次更新加一，推送端据此判断是否有新状态
+_version = 0
+# 扫描开始和结束时间
+_started_at: Optional[float] = None
+_finished_at: Optional[float] = None
+# 最近的 (时间, 已处理文件数) 采样，用于计算速度
+_samples = deque(maxlen=64)
+# 计算速度的时间窗口（秒）和采样间隔（秒）
+RATE_WINDOW = 10.0
+SAMPLE_INTERVAL = 0.5
+
+def _touch():
+    global _version
+    _version += 1
+
 def update_scan_progress(progress: float, status: str = None, completed: bool = None):
     """更新扫描进度"""
+    global _finished_at
     scan_status["progress"] = max(0.0, min(1.0, progress))
     if status is not None:
         scan_status["status"] = status
     if completed is not None:
         scan_status["completed"] = completed
+        _finished_at = time.monotonic() if completed else None
+    _touch()
+
+def update_scan_counters(**counters):
+    """更新扫描计数（total_files、processed_files、added、changed、removed、moved、unchanged、failed_files）及任务信息"""
+    for key, value in counters.items():
+        if key in scan_status:
+            scan_status[key] = value
+    if "processed_files" in counters:
+        now = time.monotonic()
+        if not _samples or now - _samples[-1][0] >= SAMPLE_INTERVAL:
+            _samples.append((now, counters["processed_files"]))
+    _touch()
+
+def get_scan_version() -> int:
+    """获取状态版本号"""
+    return _version
+
+def _rate(now: float) -> float:
+    """最近 RATE_WINDOW 秒内的处理速度（文件/秒）"""
+    # 取窗口内最早的采样，与当前计数比较
+    for sample_time, sample_count in list(_samples):
+        elapsed = now - sample_time
+        if elapsed <= RATE_WINDOW:
+            if elapsed < SAMPLE_INTERVAL:
+                # 时间太短时速度波动过大
+                return 0.0
+            return max(0.0, (scan_status["processed_files"] - sample_count) / elapsed)
+    return 0.0
 
 def get_scan_status() -> Dict:
-    """获取当前扫描状态"""
-    return scan_status.copy()
+    """获取当前扫描状态，附带耗时、处理速度和预计剩余时间"""
+    status = scan_status.copy()
+    now = time.monotonic()
+    if _started_at is not None:
+        status["elapsed"] = round((_finished_at or now) - _started_at, 1)
+    else:
+        status["elapsed"] = 0.0
+    throughput = _rate(now) if not status["completed"] else 0.0
+    status["throughput"] = round(throughput, 1)
+    # 遍历阶段总数仍在增长，无法估算剩余时间
+    remaining = status["total_files"] - status["processed_files"]
+    if throughput > 0 and status["phase"] != "walking" and not status["completed"]:
+        status["eta"] = round(remaining / throughput, 1)
+    else:
+        status["eta"] = None
+    return status
 
 def reset_scan_status():
     """重置扫描状态"""
+    global _started_at, _finished_at
     scan_status.update({
         "progress": 0.0,
         "status": "",
         "completed": False,
         "total_files": 0,
-        "processed_files": 0
-    })
\ No newline at end of file
+        "processed_files": 0,
+        "added": 0,
+        "changed": 0,
+        "removed": 0,
+        "moved": 0,
+        "unchanged": 0,
+        "failed_files": 0,
+        "job_id": None,
+        "phase": "",
+        "state": ""
+    })
+    _samples.clear()
+    _started_at = time.monotonic()
+    _finished_at = None
+    _touch()
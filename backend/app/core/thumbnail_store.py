@@ -0,0 +1,138 @@
+"""缩略图打包存储
+
+所有缩略图保存在 thumbnails/thumbnails.db 的一张 BLOB 表中，键为原来的相对文件路径
+（例如 thumbnails/xxx_thumb_160.webp），取代缩略图目录下的大量小文件：
+- 读取走 SQLite 的内存映射（mmap），不需要为每个请求 open/stat 文件
+- 清理孤立缩略图只需按键做差集，不需要 listdir
+- 删除产生的空闲页由 compact() 回收
+
+与主数据库分开存放，缩略图的写入不会与扫描争用主数据库的写锁。
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+STORE_PATH = os.path.join(PROJECT_ROOT, 'thumbnails', 'thumbnails.db')
+
+# 内存映射的大小上限（字节），超出部分回退到普通读取
+MMAP_SIZE = 1024 * 1024 * 1024
+# 批量读取和删除时每条语句的键数，低于SQLite的变量数上限
+CHUNK_SIZE = 900
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def _connect() -> sqlite3.Connection:
+    """每个线程一个连接，首次使用时建表"""
+    global _initialized
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        return conn
+    os.makedirs(os.path.dirname(STORE_PATH), exist_ok=True)
+    conn = sqlite3.connect(STORE_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    with _init_lock:
+        if not _initialized:
+            # auto_vacuum 需要在建表前设置；INCREMENTAL 模式下空闲页可由 compact() 回收
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS thumbnails ("
+                "key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, created_at REAL NOT NULL)"
+            )
+            _initialized = True
+    _local.conn = conn
+    return conn
+
+
+def get(key: str) -> Optional[bytes]:
+    row = _connect().execute("SELECT data FROM thumbnails WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def get_many(keys: List[str]) -> Dict[str, bytes]:
+    """一次查询读取多个键，返回存在的键及其数据"""
+    conn = _connect()
+    result = {}
+    for start in range(0, len(keys), CHUNK_SIZE):
+        chunk = keys[start:start + CHUNK_SIZE]
+        placeholders = ",".join("?" * len(chunk))
+        result.update(conn.execute(f"SELECT key, data FROM thumbnails WHERE key IN ({placeholders})", chunk))
+    return result
+
+
+def exists(key: str) -> bool:
+    return _connect().execute("SELECT 1 FROM thumbnails WHERE key = ?", (key,)).fetchone() is not None
+
+
+def put(key: str, data: bytes):
+    put_many([(key, data)])
+
+
+def put_many(items: Iterable[Tuple[str, bytes]]):
+    """在一个事务中写入多个缩略图，已存在的键会被覆盖"""
+    conn = _connect()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
+            "INSERT OR REPLACE INTO thumbnails (key, data, size, created_at) VALUES (?, ?, ?, ?)",
+            [(key, data, len(data), now) for key, data in items]
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def delete(keys: List[str]) -> int:
+    """删除指定的键，返回删除的数量"""
+    conn = _connect()
+    deleted = 0
+    for start in range(0, len(keys), CHUNK_SIZE):
+        chunk = keys[start:start + CHUNK_SIZE]
+        placeholders = ",".join("?" * len(chunk))
+        deleted += conn.execute(f"DELETE FROM thumbnails WHERE key IN ({placeholders})", chunk).rowcount
+    return deleted
+
+
+def sizes() -> Dict[str, int]:
+    """所有键及其大小，只读取索引和 size 列，不读取图片数据"""
+    return dict(_connect().execute("SELECT key, size FROM thumbnails"))
+
+
+def stats() -> Dict:
+    conn = _connect()
+    count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM thumbnails").fetchone()
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return {
+        "count": count,
+        "data_size": total,
+        "file_size": page_size * page_count,
+        "reclaimable_size": page_size * freelist,
+    }
+
+
+def compact(full: bool = False) -> int:
+    """回收删除缩略图后留下的空闲页，返回回收的字节数
+
+    默认使用 incremental_vacuum，只把空闲页从文件末尾截掉；
+    full 为True时执行 VACUUM 重写整个文件，同时消除碎片，期间会阻塞写入。
+    """
+    conn = _connect()
+    before = stats()["file_size"]
+    if full:
+        conn.execute("VACUUM")
+    else:
+        # incremental_vacuum 每执行一步释放一页，execute 只执行一步，executescript 会执行到结束
+        conn.executescript("PRAGMA incremental_vacuum")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return before - stats()["file_size"]
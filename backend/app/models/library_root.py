@@ -0,0 +1,12 @@
+from sqlalchemy import Column, String, Integer, DateTime
+from datetime import datetime
+from .setting import Base
+
+class LibraryRoot(Base):
+    __tablename__ = 'library_roots'
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True)  # 显示名称
+    path = Column(String)  # 根目录的绝对路径
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
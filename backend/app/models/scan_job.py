@@ -0,0 +1,28 @@
+from sqlalchemy import Column, String, Integer, DateTime, Boolean, ForeignKey
+from datetime import datetime
+from .setting import Base
+
+class ScanJob(Base):
+    __tablename__ = 'scan_jobs'
+
+    id = Column(Integer, primary_key=True, index=True)
+    state = Column(String, default='running', index=True)  # running / completed / failed / cancelled / interrupted
+    phase = Column(String, default='pending')  # pending / walking / probing / cleanup / thumbnails / done
+    incremental = Column(Boolean, default=True)  # 是否增量扫描
+    root_id = Column(Integer, ForeignKey('library_roots.id', ondelete='SET NULL'), nullable=True)  # 只扫描该根目录，为空时扫描全部
+    message = Column(String, nullable=True)  # 最近的状态描述或错误信息
+
+    # 计数，随每批写库一起提交，作为断点续扫的检查点
+    total_files = Column(Integer, default=0)
+    processed_files = Column(Integer, default=0)
+    added = Column(Integer, default=0)
+    changed = Column(Integer, default=0)
+    removed = Column(Integer, default=0)
+    moved = Column(Integer, default=0)  # 按内容指纹识别出的移动/重命名文件数
+    unchanged = Column(Integer, default=0)
+    failed_files = Column(Integer, default=0)  # 逐条重试后仍写入数据库失败的文件数，这些文件未入库
+
+    created_at = Column(DateTime, default=datetime.now)
+    started_at = Column(DateTime, default=datetime.now)  # 首次开始时间，续扫时不变
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    finished_at = Column(DateTime, nullable=True)
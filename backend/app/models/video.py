@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean
+from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, ForeignKey, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .setting import Base
@@ -6,19 +6,40 @@ from .tag import video_tag
 
 class Video(Base):
     __tablename__ = 'videos'
+    # 不同根目录下可以有相同的相对路径
+    __table_args__ = (UniqueConstraint('root_id', 'filepath', name='uq_videos_root_filepath'),)
     
     id = Column(Integer, primary_key=True, index=True)
+    root_id = Column(Integer, ForeignKey('library_roots.id'), nullable=True, index=True)  # 所在根目录
     filename = Column(String, index=True)
-    filepath = Column(String, unique=True)
+    filepath = Column(String)  # 相对于根目录的路径
     size = Column(Float)  # 文件大小（MB）
     duration = Column(Float)  # 视频时长（秒）
     thumbnail_path = Column(String, nullable=True)  # 缩略图路径
     is_favorite = Column(Boolean, default=False)  # 是否收藏
-    web_playable = Column(Boolean, default=True)  # 是否可以在网页播放
+    web_playable = Column(Boolean, default=True)  # 是否可以在网页播放，扫描时根据容器和编码自动判断，可手动修改
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     thumbnail_generated = Column(Boolean, default=False)  # 缩略图是否已生成
-    
+    thumbnail_hash = Column(String, nullable=True)  # 缩略图内容哈希，作为缩略图URL的版本号和ETag
+
+    # 文件指纹，用于增量扫描时判断文件是否变化
+    file_size = Column(Integer, nullable=True)  # 文件大小（字节）
+    file_mtime = Column(Float, nullable=True)  # 文件修改时间（时间戳）
+    file_inode = Column(Integer, nullable=True)  # 文件inode（Windows下为文件索引号）
+    content_hash = Column(String, nullable=True, index=True)  # 内容指纹：大小+首尾数据块哈希，用于识别被移动或重命名的文件
+    last_scan_job_id = Column(Integer, nullable=True)  # 最近写入该记录的扫描任务ID，只由扫描写入，续扫时据此跳过已处理的文件
+
+    # 媒体信息，与时长在同一次ffprobe调用中获取
+    container = Column(String, nullable=True)  # 容器格式（ffprobe的format_name）
+    video_codec = Column(String, nullable=True, index=True)  # 视频编码
+    audio_codec = Column(String, nullable=True)  # 音频编码
+    width = Column(Integer, nullable=True)  # 宽度（像素）
+    height = Column(Integer, nullable=True, index=True)  # 高度（像素）
+    bit_rate = Column(Integer, nullable=True)  # 总码率（bit/s）
+    frame_rate = Column(Float, nullable=True)  # 帧率
+    moov_at_start = Column(Boolean, nullable=True)  # MP4的moov是否位于文件开头（faststart）
+
     # 播放进度相关字段
     last_position = Column(Float, default=0.0)  # 最后播放位置（秒）
     watch_progress = Column(Float, default=0.0)  # 观看进度百分比（0-100）
@@ -26,4 +47,11 @@ class Video(Base):
     is_completed = Column(Boolean, default=False)  # 是否已看完
     
     # 与Tag模型建立多对多关系
-    tags = relationship("Tag", secondary=video_tag, back_populates="videos")
\ No newline at end of file
+    tags = relationship("Tag", secondary=video_tag, back_populates="videos")
+
+    @property
+    def thumbnail_url(self) -> str:
+        """缩略图地址，缩略图内容变化时地址随之变化，可被浏览器永久缓存"""
+        if self.thumbnail_generated and self.thumbnail_hash:
+            return f"/api/videos/{self.id}/thumbnail/{self.thumbnail_hash}"
+        return f"/api/videos/{self.id}/thumbnail"
\ No newline at end of file
@@ -0,0 +1,31 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import List, Optional
+
+class DuplicateVideo(BaseModel):
+    """重复组中的视频"""
+    id: int
+    filename: str
+    filepath: str
+    is_favorite: bool = False
+    thumbnail_path: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class DuplicateCluster(BaseModel):
+    """一组内容相同的视频"""
+    file_size: int  # 文件大小（字节）
+    duration: float  # 视频时长（秒）
+    wasted_bytes: int  # 只保留一份时可释放的空间（字节）
+    videos: List[DuplicateVideo]
+
+class DuplicateReport(BaseModel):
+    """查重状态和结果"""
+    state: str
+    message: str = ""
+    progress: float = 0.0
+    total_videos: int = 0
+    candidates: int = 0
+    hashed: int = 0
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    clusters: List[DuplicateCluster] = []
@@ -0,0 +1,23 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional
+
+class LibraryRootBase(BaseModel):
+    name: str
+    path: str
+
+class LibraryRootCreate(LibraryRootBase):
+    pass
+
+class LibraryRootUpdate(LibraryRootBase):
+    name: Optional[str] = None
+    path: Optional[str] = None
+
+class LibraryRoot(LibraryRootBase):
+    id: int
+    created_at: datetime
+    updated_at: datetime
+    videos_count: Optional[int] = None  # 根目录下的视频数量
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,27 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional
+
+class ScanJob(BaseModel):
+    """扫描任务"""
+    id: int
+    state: str
+    phase: str
+    incremental: bool
+    root_id: Optional[int] = None
+    message: Optional[str] = None
+    total_files: int = 0
+    processed_files: int = 0
+    added: int = 0
+    changed: int = 0
+    removed: int = 0
+    moved: int = 0
+    unchanged: int = 0
+    failed_files: Optional[int] = 0  # 早于该字段的任务为空
+    created_at: datetime
+    started_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
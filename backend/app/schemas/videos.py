@@ -9,18 +9,29 @@ class VideoBase(BaseModel):
     size: float
     duration: float
     thumbnail_path: Optional[str] = None
+    thumbnail_generated: Optional[bool] = None
     is_favorite: bool = False
     web_playable: bool = True
     last_position: float = 0.0
     watch_progress: float = 0.0
     last_watched_at: Optional[datetime] = None
     is_completed: bool = False
+    container: Optional[str] = None
+    video_codec: Optional[str] = None
+    audio_codec: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    bit_rate: Optional[int] = None
+    frame_rate: Optional[float] = None
+    moov_at_start: Optional[bool] = None
 
 class VideoCreate(VideoBase):
     pass
 
 class Video(VideoBase):
     id: int
+    thumbnail_url: str
+    root_id: Optional[int] = None
     created_at: datetime
     updated_at: datetime
     tags: Optional[List[Tag]] = None
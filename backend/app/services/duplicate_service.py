@@ -0,0 +1,200 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Optional
+from sqlalchemy.orm import Session
+from ..core.database import SessionLocal
+from ..models.video import Video
+from .library_service import LibraryService
+from .setting_service import SettingService
+from .video_service import VideoService
+
+# 抽样哈希：在文件中均匀取 SAMPLE_COUNT 个位置，每处读取 SAMPLE_CHUNK 字节
+SAMPLE_COUNT = 16
+SAMPLE_CHUNK = 64 * 1024
+
+# 时长分桶的粒度（秒），同一视频的副本探测出的时长相同，分桶只用于消除浮点误差
+DURATION_BUCKET = 1.0
+
+# 最近一次查重的状态和结果
+_report_lock = threading.Lock()
+_report: Dict = {
+    "state": "idle",  # idle / running / completed / failed
+    "message": "",
+    "progress": 0.0,  # 查重进度（0-1）
+    "total_videos": 0,  # 参与查重的视频数
+    "candidates": 0,  # 大小和时长相同、需要计算抽样哈希的视频数
+    "hashed": 0,  # 已计算抽样哈希的视频数
+    "started_at": None,
+    "finished_at": None,
+    "clusters": []
+}
+
+
+class DuplicateService:
+    @staticmethod
+    def sample_fingerprint(filepath: str, size: int) -> Optional[str]:
+        """计算抽样哈希：文件大小 + 均匀分布的 SAMPLE_COUNT 个数据块
+
+        读取量固定为 SAMPLE_COUNT * SAMPLE_CHUNK 字节，与文件大小无关；读取失败时返回None。
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(str(size).encode())
+        try:
+            with open(filepath, 'rb') as f:
+                if size <= SAMPLE_COUNT * SAMPLE_CHUNK:
+                    digest.update(f.read())
+                else:
+                    step = (size - SAMPLE_CHUNK) / (SAMPLE_COUNT - 1)
+                    for i in range(SAMPLE_COUNT):
+                        f.seek(int(i * step))
+                        digest.update(f.read(SAMPLE_CHUNK))
+        except OSError as e:
+            print(f"Error sampling {filepath}: {str(e)}")
+            return None
+        return digest.hexdigest()
+
+    @staticmethod
+    def group_candidates(rows: list) -> list:
+        """按文件大小和时长分桶分组，返回包含两个及以上视频的候选组
+
+        rows 为 (id, filepath, size, duration, file_size, root_id) 列表；
+        有字节级大小时按字节比较，早期记录只有以MB为单位的 size。
+        """
+        groups = {}
+        for row in rows:
+            _, _, size, duration, file_size, _ = row
+            if not duration or duration <= 0:
+                continue
+            key = (file_size if file_size else size, round(duration / DURATION_BUCKET))
+            groups.setdefault(key, []).append(row)
+        return [group for group in groups.values() if len(group) > 1]
+
+    @staticmethod
+    def get_report() -> Dict:
+        """获取最近一次查重的状态和结果"""
+        with _report_lock:
+            return dict(_report)
+
+    @staticmethod
+    def start() -> bool:
+        """在后台线程中启动查重，已在执行时返回False"""
+        with _report_lock:
+            if _report["state"] == "running":
+                return False
+            _report.update(
+                state="running", message="正在查找重复视频...", progress=0.0,
+                total_videos=0, candidates=0, hashed=0,
+                started_at=datetime.now(), finished_at=None, clusters=[]
+            )
+        threading.Thread(target=DuplicateService._run, name="duplicate-finder", daemon=True).start()
+        return True
+
+    @staticmethod
+    def _update(**fields):
+        with _report_lock:
+            _report.update(fields)
+
+    @staticmethod
+    def _run():
+        db = SessionLocal()
+        try:
+            clusters = DuplicateService.find_duplicates(db)
+            DuplicateService._update(
+                state="completed", progress=1.0, clusters=clusters, finished_at=datetime.now(),
+                message=f"找到 {len(clusters)} 组重复视频"
+            )
+        except Exception as e:
+            print(f"Duplicate finder error: {str(e)}")
+            DuplicateService._update(state="failed", message=f"查重出错: {str(e)}", finished_at=datetime.now())
+        finally:
+            db.close()
+
+    @staticmethod
+    def find_duplicates(db: Session) -> list:
+        """查找重复视频
+
+        先按数据库中已有的大小和时长分组，只对同组的少量候选文件计算抽样哈希，
+        大小或时长不同的文件不会被读取。
+
+        Returns:
+            重复视频组列表，按可释放的空间从大到小排序
+        """
+        root_paths = LibraryService.get_root_paths(db)
+        if not root_paths:
+            raise ValueError("未设置根目录")
+        workers = SettingService.get_int_setting(db, "duplicate_hash_workers", 4)
+
+        rows = db.query(
+            Video.id, Video.filepath, Video.size, Video.duration, Video.file_size, Video.root_id
+        ).filter(Video.root_id.in_(root_paths)).all()
+        groups = DuplicateService.group_candidates(rows)
+        candidates = [row for group in groups for row in group]
+        DuplicateService._update(total_videos=len(rows), candidates=len(candidates))
+        db.commit()
+
+        # 计算候选文件的抽样哈希，文件读取为I/O密集型，使用线程池并行
+        hashes = {}
+        lock = threading.Lock()
+
+        def hash_row(row):
+            video_id, filepath, size, _, file_size, root_id = row
+            abs_path = VideoService._get_abs_path(root_paths[root_id], filepath)
+            if not file_size:
+                try:
+                    file_size = os.path.getsize(abs_path)
+                except OSError:
+                    file_size = None
+            sample = DuplicateService.sample_fingerprint(abs_path, file_size) if file_size else None
+            with lock:
+                hashes[video_id] = (sample, file_size)
+                hashed = len(hashes)
+            DuplicateService._update(
+                hashed=hashed, progress=hashed / len(candidates),
+                message=f"正在比对第 {hashed}/{len(candidates)} 个候选文件..."
+            )
+
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="duplicate-hash") as executor:
+            list(executor.map(hash_row, candidates))
+
+        # 同一候选组内抽样哈希相同的视频视为重复
+        clusters = []
+        for group in groups:
+            by_hash = {}
+            for row in group:
+                sample, file_size = hashes.get(row[0], (None, None))
+                if sample:
+                    by_hash.setdefault((sample, file_size), []).append(row[0])
+            for (_, file_size), video_ids in by_hash.items():
+                if len(video_ids) > 1:
+                    clusters.append({"file_size": file_size, "video_ids": video_ids})
+
+        # 加载重复视频的详细信息
+        ids = [video_id for cluster in clusters for video_id in cluster["video_ids"]]
+        videos = {}
+        for start in range(0, len(ids), 900):
+            for video in db.query(Video).filter(Video.id.in_(ids[start:start + 900])):
+                videos[video.id] = video
+        result = []
+        for cluster in clusters:
+            members = [videos[video_id] for video_id in cluster["video_ids"] if video_id in videos]
+            if len(members) < 2:
+                continue
+            members.sort(key=lambda video: video.created_at or datetime.min)
+            result.append({
+                "file_size": cluster["file_size"],
+                "duration": members[0].duration,
+                "wasted_bytes": cluster["file_size"] * (len(members) - 1),
+                "videos": [{
+                    "id": video.id,
+                    "filename": video.filename,
+                    "filepath": video.filepath,
+                    "is_favorite": video.is_favorite,
+                    "thumbnail_path": video.thumbnail_path,
+                    "created_at": video.created_at
+                } for video in members]
+            })
+        result.sort(key=lambda cluster: cluster["wasted_bytes"], reverse=True)
+        return result
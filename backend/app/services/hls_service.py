@@ -0,0 +1,441 @@
+"""按需切片的 HLS 点播
+
+- 播放列表：一次 ffprobe 遍历视频流的数据包（不解码）取得所有关键帧时间，
+  按关键帧把视频切成约 6 秒的片段，生成 VOD 播放列表；结果按文件版本保存，只需遍历一次
+- 片段：请求时用 -c copy 从源文件切出 MPEG-TS 片段，不重新编码；
+  保留原始时间戳（-copyts），分别切出的片段在播放器中可以无缝衔接
+- 缓存：片段保存在 thumbnails/hls/ 下，总大小超过上限时按最近最少使用淘汰
+- 预取：请求第 n 个片段后，在后台切出之后的 1~2 个片段，播放到时直接从缓存返回
+
+拖动进度时播放器只需请求目标位置所在的片段，不需要读取大段的字节区间。
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import subprocess
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from sqlalchemy.orm import Session
+from ..models.video import Video
+from .remux_service import FALLBACK_AUDIO_ARGS
+from .setting_service import SettingService
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+HLS_DIR = os.path.join(PROJECT_ROOT, 'thumbnails', 'hls')
+
+# MPEG-TS 片段中浏览器（原生 HLS 和 video.js）都能播放的视频编码
+HLS_VIDEO_CODECS = ("h264",)
+# 可以原样复制的音频编码，其他编码转为 AAC
+HLS_COPY_AUDIO_CODECS = ("aac",)
+# 片段的目标时长（秒），实际在此之后的第一个关键帧处切分
+TARGET_SEGMENT_DURATION = 6.0
+# 片段缓存的默认大小上限（MB），可通过设置 hls_cache_size 修改
+DEFAULT_CACHE_SIZE_MB = 2048
+# 设置 hls_mode：0 不使用 HLS；1 自动，用于浏览器不能直接播放或大于下面大小的视频；2 用于所有可以切片的视频
+DEFAULT_HLS_MODE = 1
+HLS_AUTO_MIN_SIZE = 2 * 1024 * 1024 * 1024
+# 请求一个片段后在后台预先切出的后续片段数
+PREFETCH_SEGMENTS = 2
+# 后台预取的线程数
+PREFETCH_WORKERS = 2
+# 内存中保留的关键帧索引数
+INDEX_CACHE_SIZE = 32
+# 切片时 -ss 比片段起点稍晚一点，保证定位到片段起点的关键帧，而不是前一个
+SEEK_EPSILON = 0.001
+# 遍历数据包的超时时间（秒），需要读取整个文件
+PROBE_TIMEOUT = 600
+
+SEGMENT_PATTERN = re.compile(r"^(\d{1,6})\.ts$")
+VERSION_PATTERN = re.compile(r"^[0-9a-f]{8}$")
+
+_lock = threading.Lock()
+# 片段文件路径 -> 大小，按最近使用排序，最早的在前
+_cache: "OrderedDict[str, int]" = OrderedDict()
+_cache_size = 0
+_cache_loaded = False
+# 正在生成的片段或索引，同一个键同时只生成一次，其他请求等待同一个结果
+_inflight: Dict[str, Future] = {}
+# 每个视频最近请求的片段序号，拖动进度后不再预取旧位置之后的片段
+_playheads: Dict[int, int] = {}
+# 关键帧索引：版本目录 -> 片段边界
+_indexes: "OrderedDict[str, dict]" = OrderedDict()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+class HlsService:
+    @staticmethod
+    def can_play(video: Video) -> bool:
+        return video.video_codec in HLS_VIDEO_CODECS
+
+    @staticmethod
+    def should_use(db: Session, video: Video) -> bool:
+        """按 hls_mode 设置判断播放器是否使用 HLS"""
+        mode = SettingService.get_int_setting(db, "hls_mode", DEFAULT_HLS_MODE)
+        if mode <= 0 or not HlsService.can_play(video):
+            return False
+        return mode >= 2 or not video.web_playable or (video.file_size or 0) >= HLS_AUTO_MIN_SIZE
+
+    @staticmethod
+    def cache_limit(db: Session) -> int:
+        """片段缓存的大小上限（字节）"""
+        return max(1, SettingService.get_int_setting(db, "hls_cache_size", DEFAULT_CACHE_SIZE_MB)) * 1024 * 1024
+
+    @staticmethod
+    def version(video: Video) -> str:
+        """片段版本：文件变化或切片参数变化时随之变化"""
+        key = f"{video.file_size}-{video.file_mtime}-{TARGET_SEGMENT_DURATION}-{video.audio_codec}"
+        return hashlib.blake2b(key.encode(), digest_size=4).hexdigest()
+
+    @staticmethod
+    def _video_dir(video_id: int, version: str) -> str:
+        return os.path.join(HLS_DIR, f"{video_id}_{version}")
+
+    @staticmethod
+    def _run_once(key: str, func: Callable):
+        """同一个键同时只执行一次 func，并发的调用等待并共享结果"""
+        with _lock:
+            future = _inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                _inflight[key] = future
+        if not owner:
+            return future.result()
+        try:
+            result = func()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with _lock:
+                _inflight.pop(key, None)
+
+    # ---------- 关键帧索引和播放列表 ----------
+
+    @staticmethod
+    def probe_keyframes(video_path: str) -> Dict:
+        """一次遍历视频流的数据包，返回关键帧时间（相对文件起始时间，已排序）和时长
+
+        只读取数据包的时间戳和标志，不解码，耗时主要取决于磁盘读取速度。
+        """
+        result = subprocess.run(
+            [
+                "ffprobe", "-v", "error", "-select_streams", "v:0",
+                "-show_entries", "packet=pts_time,flags:format=start_time,duration",
+                "-of", "csv", video_path,
+            ],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=PROBE_TIMEOUT,
+        )
+        if result.returncode != 0:
+            raise Exception(f"ffprobe failed: {result.stderr.decode(errors='ignore').strip()}")
+
+        keyframes = []
+        start_time = 0.0
+        duration = 0.0
+        last_pts = 0.0
+        for line in result.stdout.decode(errors="ignore").splitlines():
+            fields = line.strip().split(",")
+            if fields[0] == "packet" and len(fields) >= 3:
+                try:
+                    pts = float(fields[1])
+                except ValueError:
+                    continue
+                last_pts = max(last_pts, pts)
+                if "K" in fields[2]:
+                    keyframes.append(pts)
+            elif fields[0] == "format" and len(fields) >= 3:
+                try:
+                    start_time = float(fields[1])
+                    duration = float(fields[2])
+                except ValueError:
+                    pass
+        if not keyframes:
+            raise Exception("No keyframes found")
+        keyframes = sorted({round(pts - start_time, 6) for pts in keyframes})
+        return {"keyframes": keyframes, "duration": duration or last_pts - start_time}
+
+    @staticmethod
+    def build_segments(keyframes: List[float], duration: float) -> List[float]:
+        """按目标时长在关键帧处切分，返回片段边界 [0, t1, ..., duration]"""
+        boundaries = [0.0]
+        for pts in keyframes:
+            if pts - boundaries[-1] >= TARGET_SEGMENT_DURATION and duration - pts >= 1.0:
+                boundaries.append(pts)
+        boundaries.append(max(duration, boundaries[-1] + 0.001))
+        return boundaries
+
+    @staticmethod
+    def get_index(video: Video, video_path: str) -> Dict:
+        """获取片段边界，首次请求时遍历数据包并保存到版本目录"""
+        version = HlsService.version(video)
+        video_dir = HlsService._video_dir(video.id, version)
+        with _lock:
+            index = _indexes.get(video_dir)
+            if index is not None:
+                _indexes.move_to_end(video_dir)
+                return index
+
+        def load():
+            index_path = os.path.join(video_dir, "index.json")
+            try:
+                with open(index_path, encoding="utf-8") as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+            probed = HlsService.probe_keyframes(video_path)
+            index = {
+                "version": version,
+                "boundaries": HlsService.build_segments(probed["keyframes"], probed["duration"]),
+            }
+            os.makedirs(video_dir, exist_ok=True)
+            with open(index_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(index, f)
+            os.replace(index_path + ".tmp", index_path)
+            HlsService._remove_old_versions(video.id, version)
+            print(f"Indexed {len(index['boundaries']) - 1} HLS segments for video {video.id}")
+            return index
+
+        index = HlsService._run_once(video_dir, load)
+        with _lock:
+            _indexes[video_dir] = index
+            while len(_indexes) > INDEX_CACHE_SIZE:
+                _indexes.popitem(last=False)
+        return index
+
+    @staticmethod
+    def build_playlist(index: Dict) -> str:
+        """VOD 播放列表，片段地址相对于播放列表，带版本号，文件变化后不会命中旧缓存"""
+        boundaries = index["boundaries"]
+        durations = [end - start for start, end in zip(boundaries, boundaries[1:])]
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            "#EXT-X-PLAYLIST-TYPE:VOD",
+            f"#EXT-X-TARGETDURATION:{math.ceil(max(durations))}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+            "#EXT-X-INDEPENDENT-SEGMENTS",
+        ]
+        for i, duration in enumerate(durations):
+            lines.append(f"#EXTINF:{duration:.6f},")
+            lines.append(f"{index['version']}/{i}.ts")
+        lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    # ---------- 片段 ----------
+
+    @staticmethod
+    def build_segment_command(video_path: str, start: float, end: float, audio_codec: Optional[str],
+                              output_path: str) -> List[str]:
+        """切出 [start, end) 的片段
+
+        -ss/-t 作为输入选项，读取从 start 处关键帧开始、到 end 之前的数据包；
+        -copyts -start_at_zero 让所有片段共用以文件起点为 0 的时间轴。
+        """
+        seek = start + SEEK_EPSILON if start > 0 else 0.0
+        args = ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error"]
+        if seek > 0:
+            args += ["-ss", f"{seek:.3f}"]
+        args += ["-t", f"{end - seek:.3f}", "-i", video_path, "-map", "0:v:0", "-c:v", "copy"]
+        if audio_codec:
+            args += ["-map", "0:a:0"]
+            args += ["-c:a", "copy"] if audio_codec in HLS_COPY_AUDIO_CODECS else FALLBACK_AUDIO_ARGS
+        args += [
+            "-sn", "-dn",
+            "-copyts", "-start_at_zero", "-avoid_negative_ts", "disabled",
+            "-muxdelay", "0", "-muxpreload", "0",
+            "-f", "mpegts", "-y", output_path,
+        ]
+        return args
+
+    @staticmethod
+    def get_segment(video: Video, video_path: str, segment: int, cache_limit: int) -> Optional[str]:
+        """返回片段文件路径，不在缓存中时立即切出，并在后台预取之后的片段
+
+        序号超出范围时返回None。
+        """
+        index = HlsService.get_index(video, video_path)
+        boundaries = index["boundaries"]
+        if segment < 0 or segment >= len(boundaries) - 1:
+            return None
+        with _lock:
+            _playheads[video.id] = segment
+        path = HlsService._ensure_segment(video.id, video.audio_codec, video_path, index, segment, cache_limit)
+        for ahead in range(segment + 1, min(segment + 1 + PREFETCH_SEGMENTS, len(boundaries) - 1)):
+            HlsService._prefetch(video.id, video.audio_codec, video_path, index, ahead, cache_limit)
+        return path
+
+    @staticmethod
+    def parse_segment_name(version: str, filename: str) -> Optional[int]:
+        """片段地址中的序号，只接受播放列表中使用的格式"""
+        match = SEGMENT_PATTERN.match(filename)
+        if not match or not VERSION_PATTERN.match(version):
+            return None
+        return int(match.group(1))
+
+    @staticmethod
+    def _segment_path(video_id: int, version: str, segment: int) -> str:
+        return os.path.join(HlsService._video_dir(video_id, version), f"{segment}.ts")
+
+    @staticmethod
+    def _ensure_segment(video_id: int, audio_codec: Optional[str], video_path: str, index: Dict,
+                        segment: int, cache_limit: int) -> str:
+        path = HlsService._segment_path(video_id, index["version"], segment)
+        if HlsService._touch(path):
+            return path
+
+        def cut():
+            if os.path.exists(path):
+                HlsService._add(path, os.path.getsize(path), cache_limit)
+                return path
+            start, end = index["boundaries"][segment], index["boundaries"][segment + 1]
+            tmp_path = path + ".tmp"
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            result = subprocess.run(
+                HlsService.build_segment_command(video_path, start, end, audio_codec, tmp_path),
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            )
+            if result.returncode != 0 or not os.path.exists(tmp_path):
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise Exception(f"ffmpeg failed: {result.stderr.decode(errors='ignore').strip()}")
+            os.replace(tmp_path, path)
+            HlsService._add(path, os.path.getsize(path), cache_limit)
+            return path
+
+        return HlsService._run_once(path, cut)
+
+    @staticmethod
+    def _prefetch(video_id: int, audio_codec: Optional[str], video_path: str, index: Dict,
+                  segment: int, cache_limit: int):
+        global _executor
+        path = HlsService._segment_path(video_id, index["version"], segment)
+        with _lock:
+            if path in _cache or path in _inflight:
+                return
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="hls-prefetch")
+
+        def run():
+            # 排队期间播放位置已经改变（拖动进度）时放弃
+            with _lock:
+                playhead = _playheads.get(video_id)
+            if playhead is None or not playhead < segment <= playhead + PREFETCH_SEGMENTS:
+                return
+            try:
+                HlsService._ensure_segment(video_id, audio_codec, video_path, index, segment, cache_limit)
+            except Exception as e:
+                print(f"Error prefetching HLS segment {segment} of video {video_id}: {str(e)}")
+
+        _executor.submit(run)
+
+    # ---------- LRU 缓存 ----------
+
+    @staticmethod
+    def _load_cache():
+        """首次使用时扫描缓存目录，按修改时间恢复使用顺序"""
+        global _cache_size, _cache_loaded
+        files = []
+        for root, _, names in os.walk(HLS_DIR):
+            for name in names:
+                path = os.path.join(root, name)
+                if SEGMENT_PATTERN.match(name):
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((st.st_mtime, path, st.st_size))
+                elif name.endswith(".tmp"):
+                    # 上次退出时未完成的片段
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+        files.sort()
+        _cache.clear()
+        _cache.update((path, size) for _, path, size in files)
+        _cache_size = sum(_cache.values())
+        _cache_loaded = True
+
+    @staticmethod
+    def _touch(path: str) -> bool:
+        """片段在缓存中时标记为最近使用并返回True"""
+        with _lock:
+            if not _cache_loaded:
+                HlsService._load_cache()
+            if path not in _cache:
+                return False
+            _cache.move_to_end(path)
+        if os.path.exists(path):
+            return True
+        HlsService._forget([path])
+        return False
+
+    @staticmethod
+    def _add(path: str, size: int, cache_limit: int):
+        """加入缓存，超出上限时删除最久未使用的片段（保留刚加入的片段）"""
+        global _cache_size
+        evicted = []
+        with _lock:
+            if not _cache_loaded:
+                HlsService._load_cache()
+            _cache_size += size - _cache.pop(path, 0)
+            _cache[path] = size
+            while _cache_size > cache_limit and len(_cache) > 1:
+                oldest, oldest_size = _cache.popitem(last=False)
+                _cache_size -= oldest_size
+                evicted.append(oldest)
+        for oldest in evicted:
+            try:
+                os.remove(oldest)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _forget(paths: List[str]):
+        global _cache_size
+        with _lock:
+            for path in paths:
+                _cache_size -= _cache.pop(path, 0)
+
+    @staticmethod
+    def _remove_dir(path: str):
+        prefix = path + os.sep
+        with _lock:
+            stale = [key for key in _cache if key.startswith(prefix)]
+            _indexes.pop(path, None)
+        HlsService._forget(stale)
+        shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def _remove_old_versions(video_id: int, version: str):
+        prefix = f"{video_id}_"
+        try:
+            names = os.listdir(HLS_DIR)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.startswith(prefix) and name != f"{video_id}_{version}":
+                HlsService._remove_dir(os.path.join(HLS_DIR, name))
+
+    @staticmethod
+    def cleanup_orphaned(db: Session) -> int:
+        """删除已不存在的视频的片段目录，返回删除的目录数"""
+        try:
+            names = os.listdir(HLS_DIR)
+        except FileNotFoundError:
+            return 0
+        video_ids = {video_id for (video_id,) in db.query(Video.id)}
+        cleaned = 0
+        for name in names:
+            video_id = name.split("_", 1)[0]
+            if not video_id.isdigit() or int(video_id) not in video_ids:
+                HlsService._remove_dir(os.path.join(HLS_DIR, name))
+                cleaned += 1
+        return cleaned
@@ -0,0 +1,117 @@
+import os
+from typing import Dict, List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from ..models.library_root import LibraryRoot
+from ..models.video import Video
+from .setting_service import SettingService
+
+
+class LibraryService:
+    @staticmethod
+    def get_all_roots(db: Session) -> List[LibraryRoot]:
+        """获取所有根目录，包含视频数量统计"""
+        roots = db.query(LibraryRoot).order_by(LibraryRoot.id).all()
+        counts = dict(db.query(Video.root_id, func.count(Video.id)).group_by(Video.root_id).all())
+        for root in roots:
+            root.videos_count = counts.get(root.id, 0)
+        return roots
+
+    @staticmethod
+    def get_root_by_id(db: Session, root_id: int) -> Optional[LibraryRoot]:
+        return db.query(LibraryRoot).filter(LibraryRoot.id == root_id).first()
+
+    @staticmethod
+    def get_root_path(db: Session, root_id: Optional[int]) -> Optional[str]:
+        """获取根目录的绝对路径，视频的 filepath 相对于该路径"""
+        if root_id is None:
+            return None
+        root = LibraryService.get_root_by_id(db, root_id)
+        if not root or not root.path:
+            return None
+        return os.path.abspath(root.path)
+
+    @staticmethod
+    def get_root_paths(db: Session) -> Dict[int, str]:
+        """获取所有根目录 {ID: 绝对路径}"""
+        return {root.id: os.path.abspath(root.path) for root in db.query(LibraryRoot).order_by(LibraryRoot.id)}
+
+    @staticmethod
+    def get_video_path(db: Session, video: Video) -> Optional[str]:
+        """获取视频文件的绝对路径，根目录不存在时返回None"""
+        root_path = LibraryService.get_root_path(db, video.root_id)
+        if not root_path:
+            return None
+        if os.path.isabs(video.filepath):
+            return video.filepath
+        return os.path.join(root_path, video.filepath)
+
+    @staticmethod
+    def _validate(db: Session, name: str, path: str, root_id: Optional[int] = None):
+        if not os.path.isdir(path):
+            raise ValueError(f"目录不存在: {path}")
+        existing = db.query(LibraryRoot).filter(LibraryRoot.name == name).first()
+        if existing and existing.id != root_id:
+            raise ValueError(f"根目录名称 '{name}' 已存在")
+        # 根目录之间不能相互包含，否则同一个文件会被扫描两次
+        abs_path = os.path.abspath(path)
+        for other_id, other_path in LibraryService.get_root_paths(db).items():
+            if other_id == root_id:
+                continue
+            if os.path.commonpath([abs_path, other_path]) in (abs_path, other_path):
+                raise ValueError(f"与已有根目录 {other_path} 重叠")
+
+    @staticmethod
+    def create_root(db: Session, name: str, path: str) -> LibraryRoot:
+        """添加根目录"""
+        LibraryService._validate(db, name, path)
+        root = LibraryRoot(name=name, path=os.path.abspath(path))
+        db.add(root)
+        db.commit()
+        db.refresh(root)
+        return root
+
+    @staticmethod
+    def update_root(db: Session, root_id: int, name: Optional[str] = None,
+                    path: Optional[str] = None) -> Optional[LibraryRoot]:
+        """修改根目录的名称或路径，路径变化后视频记录的相对路径保持不变"""
+        root = LibraryService.get_root_by_id(db, root_id)
+        if not root:
+            return None
+        name = name if name is not None else root.name
+        path = path if path is not None else root.path
+        LibraryService._validate(db, name, path, root_id)
+        root.name = name
+        root.path = os.path.abspath(path)
+        db.commit()
+        db.refresh(root)
+        return root
+
+    @staticmethod
+    def delete_root(db: Session, root_id: int) -> bool:
+        """删除根目录及其下的视频记录（不删除视频文件），孤立的缩略图由清理任务处理"""
+        from .scan_service import ScanService
+        root = LibraryService.get_root_by_id(db, root_id)
+        if not root:
+            return False
+        video_ids = [video_id for (video_id,) in db.query(Video.id).filter(Video.root_id == root_id)]
+        ScanService.delete_videos(db, video_ids)
+        db.delete(root)
+        db.commit()
+        return True
+
+    @staticmethod
+    def get_default_root(db: Session) -> Optional[LibraryRoot]:
+        """第一个根目录，对应早期的 root_directory 设置"""
+        return db.query(LibraryRoot).order_by(LibraryRoot.id).first()
+
+    @staticmethod
+    def set_default_root(db: Session, path: str) -> LibraryRoot:
+        """兼容 root_directory 设置：修改第一个根目录的路径，没有根目录时创建"""
+        root = LibraryService.get_default_root(db)
+        if root is None:
+            root = LibraryService.create_root(db, "默认", path)
+        else:
+            root = LibraryService.update_root(db, root.id, path=path)
+        SettingService.set_root_directory(db, root.path)
+        return root
@@ -0,0 +1,104 @@
+"""把浏览器不能直接打开的容器（MKV、AVI、TS、FLV 等）实时转封装为分片 MP4
+
+视频流原样复制（-c copy），不重新编码；ffmpeg 的输出通过管道直接发送给客户端，不写临时文件。
+分片 MP4（empty_moov + 每个关键帧一个分片）不需要在写完后回填 moov，可以边转边播。
+输出不能按字节区间跳转，拖动进度时由客户端带上 start 参数重新请求，从该时间点之前的关键帧开始转封装。
+"""
+import asyncio
+import functools
+import subprocess
+from typing import AsyncIterator, List, Optional
+from ..models.video import Video
+from .video_service import WEB_CONTAINERS
+
+# 可以复制进 MP4 并由浏览器解码的编码
+REMUX_VIDEO_CODECS = WEB_CONTAINERS["mp4"]["video"]
+REMUX_AUDIO_CODECS = WEB_CONTAINERS["mp4"]["audio"]
+# 音频编码不受浏览器支持（AC3、DTS 等）时转为 AAC，音频编码的开销远小于视频
+FALLBACK_AUDIO_ARGS = ["-c:a", "aac", "-b:a", "192k", "-ac", "2"]
+# 每次从管道读取的最大字节数
+CHUNK_SIZE = 256 * 1024
+MOVFLAGS = "frag_keyframe+empty_moov+default_base_moof"
+
+
+class RemuxError(Exception):
+    """ffmpeg 在输出任何数据之前退出"""
+
+
+class RemuxService:
+    @staticmethod
+    def can_remux(video: Video) -> bool:
+        """视频编码可以原样复制进 MP4 时返回True"""
+        return video.video_codec in REMUX_VIDEO_CODECS
+
+    @staticmethod
+    def build_command(video_path: str, start: float = 0.0, audio_codec: Optional[str] = None) -> List[str]:
+        """生成转封装命令，输出写到标准输出
+
+        -ss 放在 -i 之前按输入定位，复制视频流时从 start 之前最近的关键帧开始；
+        只取第一路视频和第一路音频，忽略字幕和 MKV 中作为封面的图片流。
+        """
+        args = ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error"]
+        if start > 0:
+            args += ["-ss", f"{start:.3f}"]
+        args += ["-i", video_path, "-map", "0:v:0", "-c:v", "copy"]
+        if audio_codec:
+            args += ["-map", "0:a:0"]
+            args += ["-c:a", "copy"] if audio_codec in REMUX_AUDIO_CODECS else FALLBACK_AUDIO_ARGS
+        args += [
+            "-sn", "-dn",
+            "-avoid_negative_ts", "make_zero",
+            "-movflags", MOVFLAGS,
+            "-f", "mp4", "pipe:1",
+        ]
+        return args
+
+    @staticmethod
+    async def open_stream(video_path: str, start: float = 0.0,
+                          audio_codec: Optional[str] = None) -> AsyncIterator[bytes]:
+        """启动 ffmpeg 并返回输出数据的异步迭代器
+
+        先读到第一块数据再返回，ffmpeg 启动即失败（文件损坏、编码不支持）时抛出 RemuxError，
+        调用方可以在发送响应头之前返回错误状态码。
+        迭代器关闭（客户端断开、拖动进度后放弃旧请求）时结束 ffmpeg 进程。
+        """
+        loop = asyncio.get_running_loop()
+        # 创建进程（fork/exec）可能耗时数十毫秒，同样放在线程池中
+        process = await loop.run_in_executor(None, functools.partial(
+            subprocess.Popen,
+            RemuxService.build_command(video_path, start, audio_codec),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+        ))
+        try:
+            # 管道读取会阻塞到 ffmpeg 产生输出，放在默认线程池中，不占用 FastAPI 同步接口的线程池
+            first = await loop.run_in_executor(None, process.stdout.read1, CHUNK_SIZE)
+        except BaseException:
+            await RemuxService._terminate(process)
+            raise
+        if not first:
+            await RemuxService._terminate(process)
+            raise RemuxError(f"ffmpeg exited with code {process.returncode}")
+
+        async def chunks():
+            try:
+                data = first
+                while data:
+                    yield data
+                    data = await loop.run_in_executor(None, process.stdout.read1, CHUNK_SIZE)
+                returncode = await loop.run_in_executor(None, process.wait)
+                if returncode != 0:
+                    # 响应头已发送，只能提前结束输出
+                    print(f"Remux of {video_path} exited with code {returncode}")
+            finally:
+                await RemuxService._terminate(process)
+
+        return chunks()
+
+    @staticmethod
+    async def _terminate(process: subprocess.Popen):
+        """结束 ffmpeg 并回收进程；阻塞中的管道读取会因管道关闭而返回"""
+        if process.poll() is None:
+            process.kill()
+        await asyncio.get_running_loop().run_in_executor(None, process.wait)
+        process.stdout.close()
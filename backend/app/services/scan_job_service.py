@@ -0,0 +1,129 @@
+import threading
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy.orm import Session
+from ..core.database import SessionLocal
+from ..core.scan_status import reset_scan_status, update_scan_counters
+from ..models.scan_job import ScanJob
+from .scan_service import ScanService
+
+# 当前进程中正在执行的扫描任务
+_current_lock = threading.Lock()
+_current = {"job_id": None, "thread": None, "cancel": None}
+
+# 可以续扫的任务状态
+RESUMABLE_STATES = ("interrupted", "cancelled", "failed")
+
+
+class ScanJobService:
+    @staticmethod
+    def _running_job_id() -> Optional[int]:
+        thread = _current["thread"]
+        if thread is not None and thread.is_alive():
+            return _current["job_id"]
+        return None
+
+    @staticmethod
+    def _launch(job_id: int, resume: bool):
+        """在后台线程中执行扫描任务，调用方需持有 _current_lock"""
+        cancel_event = threading.Event()
+        thread = threading.Thread(
+            target=ScanJobService._run, args=(job_id, cancel_event, resume),
+            name=f"scan-job-{job_id}", daemon=True
+        )
+        _current.update(job_id=job_id, thread=thread, cancel=cancel_event)
+        reset_scan_status()
+        update_scan_counters(job_id=job_id, state="running", phase="pending")
+        thread.start()
+
+    @staticmethod
+    def _run(job_id: int, cancel_event: threading.Event, resume: bool):
+        try:
+            ScanService.run_job(job_id, cancel_event, resume)
+        finally:
+            with _current_lock:
+                if _current["job_id"] == job_id:
+                    _current.update(job_id=None, thread=None, cancel=None)
+
+    @staticmethod
+    def start_scan(db: Session, incremental: bool = True, root_id: Optional[int] = None) -> Tuple[ScanJob, bool]:
+        """启动扫描任务
+
+        已有任务在执行时不会重复启动，直接返回正在执行的任务。
+        指定 root_id 时只扫描该根目录，其他根目录的记录不受影响。
+
+        Returns:
+            (任务, 是否新启动)
+        """
+        with _current_lock:
+            running_id = ScanJobService._running_job_id()
+            if running_id is not None:
+                return ScanJobService.get_job(db, running_id), False
+            job = ScanJob(state="running", phase="pending", incremental=incremental, root_id=root_id)
+            db.add(job)
+            db.commit()
+            db.refresh(job)
+            ScanJobService._launch(job.id, resume=False)
+            return job, True
+
+    @staticmethod
+    def resume_scan(db: Session, job_id: int) -> Tuple[Optional[ScanJob], bool]:
+        """续扫被中断、取消或失败的任务
+
+        Returns:
+            (任务, 是否新启动)；任务不存在时返回 (None, False)，
+            已有任务在执行时返回正在执行的任务
+        """
+        with _current_lock:
+            running_id = ScanJobService._running_job_id()
+            if running_id is not None:
+                return ScanJobService.get_job(db, running_id), False
+            job = ScanJobService.get_job(db, job_id)
+            if not job or job.state not in RESUMABLE_STATES:
+                return job, False
+            job.state = "running"
+            job.finished_at = None
+            db.commit()
+            db.refresh(job)
+            ScanJobService._launch(job.id, resume=True)
+            return job, True
+
+    @staticmethod
+    def cancel_scan(db: Session, job_id: int) -> bool:
+        """取消扫描任务，已写入的结果会保留，可通过续扫继续"""
+        with _current_lock:
+            if ScanJobService._running_job_id() == job_id:
+                _current["cancel"].set()
+                update_scan_counters(state="cancelling")
+                return True
+        job = ScanJobService.get_job(db, job_id)
+        if job and job.state == "running":
+            # 没有线程在执行（例如进程异常退出后遗留的记录）
+            job.state = "cancelled"
+            job.finished_at = datetime.now()
+            db.commit()
+            return True
+        return False
+
+    @staticmethod
+    def resume_interrupted():
+        """应用启动时调用：把上次进程退出时仍在执行的任务标记为中断，并续扫最近的一个"""
+        db = SessionLocal()
+        try:
+            jobs = db.query(ScanJob).filter(ScanJob.state == "running").order_by(ScanJob.id.desc()).all()
+            for job in jobs:
+                job.state = "interrupted"
+            db.commit()
+            if jobs:
+                print(f"Resuming interrupted scan job {jobs[0].id}")
+                ScanJobService.resume_scan(db, jobs[0].id)
+        finally:
+            db.close()
+
+    @staticmethod
+    def get_job(db: Session, job_id: int) -> Optional[ScanJob]:
+        return db.query(ScanJob).filter(ScanJob.id == job_id).first()
+
+    @staticmethod
+    def list_jobs(db: Session, limit: int = 20) -> List[ScanJob]:
+        return db.query(ScanJob).order_by(ScanJob.id.desc()).limit(limit).all()
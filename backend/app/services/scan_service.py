@@ -0,0 +1,659 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from ..core.database import SessionLocal
+from ..core.file_walker import walk_files
+from ..core.scan_status import update_scan_progress, update_scan_counters
+from ..models.video import Video
+from ..models.tag import video_tag
+from ..models.scan_job import ScanJob
+from ..models.library_root import LibraryRoot
+from .setting_service import SettingService
+from .video_service import VideoService, MEDIA_COLUMNS
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.wmv', '.3gp', '.ts', '.flv', '.webm', '.m3u8', '.mpeg')
+
+# 重新扫描已有记录时需要更新的列
+UPSERT_COLUMNS = ("size", "duration", "file_size", "file_mtime", "file_inode", "content_hash",
+                  "updated_at", "last_scan_job_id") + MEDIA_COLUMNS
+
+# 内容指纹读取文件开头和结尾的字节数
+CONTENT_HASH_CHUNK = 2 * 1024 * 1024
+
+# 流水线结束标记
+_STOP = object()
+
+# 写库线程最长的提交间隔（秒），探测较慢时也能及时更新进度和检查点
+FLUSH_INTERVAL = 1.0
+
+# 单条 DELETE ... WHERE id IN (...) 的最大参数个数，低于旧版SQLite的999个变量上限
+DELETE_CHUNK_SIZE = 900
+
+
+class ScanState:
+    """一次扫描任务中各根目录流水线共享的计数和移动识别信息"""
+
+    def __init__(self, job_id: Optional[int] = None, initial_counters: Optional[dict] = None):
+        self.job_id = job_id
+        self.lock = threading.Lock()
+        self.counters = {"total_files": 0, "processed_files": 0, "added": 0, "changed": 0,
+                         "removed": 0, "moved": 0, "unchanged": 0, "failed_files": 0}
+        self.counters.update(initial_counters or {})
+        # 仍在遍历的流水线数
+        self.walking = 0
+        # 内容指纹 -> [(记录ID, 原文件绝对路径)]，用于识别移动的文件，包括跨根目录的移动
+        self.hash_index = {}
+        # 已被移动后的文件认领的记录ID
+        self.moved_ids = set()
+
+    @property
+    def phase(self) -> str:
+        return "walking" if self.walking > 0 else "probing"
+
+    def add_fingerprints(self, root_path: str, fingerprints: dict):
+        for rel_path, record in fingerprints.items():
+            if record[5]:
+                self.hash_index.setdefault(record[5], []).append((record[0], os.path.join(root_path, rel_path)))
+
+    def walk_finished(self):
+        with self.lock:
+            self.walking -= 1
+        update_scan_counters(phase=self.phase)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.counters)
+
+    def count(self, **increments: int) -> dict:
+        with self.lock:
+            for key, value in increments.items():
+                self.counters[key] += value
+            counters = dict(self.counters)
+        update_scan_counters(**counters)
+        total = counters["total_files"]
+        processed = counters["processed_files"]
+        if self.phase == "walking":
+            message = f"正在扫描视频文件，已发现 {total} 个，已处理 {processed} 个..."
+        else:
+            message = f"正在处理第 {processed}/{total} 个文件..."
+        # 留出最后5%给清理阶段
+        update_scan_progress(0.95 * processed / total if total > 0 else 0, message)
+        return counters
+
+    def claim_moved(self, content_hash: str) -> Optional[int]:
+        """查找内容指纹相同且原文件已不存在的记录，认领后返回其ID"""
+        for video_id, old_path in self.hash_index.get(content_hash, ()):
+            with self.lock:
+                if video_id in self.moved_ids:
+                    continue
+                # 原文件仍在，说明是复制而不是移动
+                if os.path.exists(old_path):
+                    continue
+                self.moved_ids.add(video_id)
+            return video_id
+        return None
+
+
+class ScanPipeline:
+    """单个根目录的扫描流水线：遍历 -> 探测 -> 写库
+
+    - 遍历阶段并行读取目录，在调用线程中边遍历边与内存中的指纹对比，把需要探测的文件放入有界队列
+    - 探测阶段由 probe_workers 个线程并行调用ffprobe，每个文件有独立的超时
+    - 写库阶段只有一个线程，持有独立的Session，按 batch_size 批量提交，
+      并在同一事务中把计数写入扫描任务作为检查点；整批写入失败时逐条重试，仍失败的计入 failed_files
+    - 遍历时记录所有存在的相对路径（seen），遍历完整结束后（walk_completed）
+      与指纹做差集即可得到文件已删除的记录，不需要逐条检查文件是否存在
+    - 新文件在探测前先计算内容指纹，与原路径已不存在的记录匹配时视为移动，
+      只改写路径，保留标签、收藏和播放进度，也不需要重新探测
+
+    ffprobe本身是独立进程，探测线程只是等待子进程结束，因此线程池即可随CPU核数扩展。
+    多个根目录时每个根目录各有一条流水线，计数汇总在共享的 ScanState 中。
+    """
+
+    def __init__(self, root_id: Optional[int], root_path: str, fingerprints: dict,
+                 state: Optional[ScanState] = None, incremental: bool = True,
+                 probe_workers: int = 4, probe_timeout: float = 30, batch_size: int = 500,
+                 walk_workers: int = 8, queue_size: int = 1000,
+                 cancel_event: Optional[threading.Event] = None, resume_job_id: Optional[int] = None):
+        self.root_id = root_id
+        self.root_path = root_path
+        self.fingerprints = fingerprints
+        if state is None:
+            state = ScanState()
+            state.add_fingerprints(root_path, fingerprints)
+            state.walking = 1
+        self.state = state
+        self.incremental = incremental
+        self.probe_workers = max(1, probe_workers)
+        self.probe_timeout = probe_timeout
+        self.batch_size = max(1, batch_size)
+        self.walk_workers = walk_workers
+        self.cancel_event = cancel_event or threading.Event()
+        # 续扫时，本任务中断前已写入的记录（last_scan_job_id 为本任务）直接跳过；
+        # 不能按 updated_at 判断，缩略图、收藏、播放进度等也会更新该列
+        self.resume_job_id = resume_job_id
+        self.probe_queue = queue.Queue(maxsize=queue_size)
+        self.result_queue = queue.Queue(maxsize=queue_size)
+        self.seen = set()
+        self.walk_errors = []
+        self.walk_completed = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def run(self):
+        """执行扫描，计数累计到 self.state"""
+        workers = [
+            threading.Thread(target=self._probe_worker, name=f"scan-probe-{self.root_id}-{i}", daemon=True)
+            for i in range(self.probe_workers)
+        ]
+        writer = threading.Thread(target=self._writer, name=f"scan-writer-{self.root_id}", daemon=True)
+        for worker in workers:
+            worker.start()
+        writer.start()
+        try:
+            self._walk()
+        finally:
+            self.state.walk_finished()
+            for _ in workers:
+                self.probe_queue.put(_STOP)
+            for worker in workers:
+                worker.join()
+            self.result_queue.put(_STOP)
+            writer.join()
+
+    def _count(self, **increments: int) -> dict:
+        return self.state.count(**increments)
+
+    def _walk(self):
+        entries = walk_files(self.root_path, VIDEO_EXTENSIONS, workers=self.walk_workers, errors=self.walk_errors)
+        for entry in entries:
+            if self.cancelled:
+                return
+            rel_path = os.path.relpath(entry.path, self.root_path)
+            self.seen.add(rel_path)
+            fingerprint = (entry.size, entry.mtime, entry.inode)
+            record = self.fingerprints.get(rel_path)
+            if self.resume_job_id is not None and record and record[7] == self.resume_job_id:
+                # 中断前已处理并写入，计数已包含在检查点中
+                self._count(total_files=1, processed_files=1)
+                continue
+            state = ScanService.classify_file(record, fingerprint, self.incremental)
+            if state == "unchanged" and record[5] and record[6]:
+                self._count(total_files=1, unchanged=1, processed_files=1)
+            elif state in ("unchanged", "backfill"):
+                # 文件未变化，只补写缺少的指纹和媒体信息；有媒体信息时不调用ffprobe
+                self._count(total_files=1, unchanged=1)
+                mode = "hash" if record[6] else "media"
+                self.probe_queue.put((entry.path, rel_path, fingerprint, record[0], mode))
+            else:
+                # 新增/变化/移动数在写库成功后计入
+                self._count(total_files=1)
+                self.probe_queue.put((entry.path, rel_path, fingerprint, record[0] if record else None, "probe"))
+        self.walk_completed = not self.cancelled
+
+    def missing_ids(self) -> list:
+        """文件已不存在的记录ID：指纹中有而遍历中没有见到的路径
+
+        只在遍历完整结束后有效；读取失败的目录下的记录会被保留。
+        有多个根目录时，需要等所有流水线结束后再调用，其他根目录中的移动才会被排除。
+        """
+        if not self.walk_completed:
+            return []
+        failed_prefixes = tuple(
+            os.path.relpath(path, self.root_path) + os.sep for path in self.walk_errors
+        )
+        if any(prefix == "." + os.sep for prefix in failed_prefixes):
+            # 根目录本身无法读取
+            return []
+        return [
+            record[0] for rel_path, record in self.fingerprints.items()
+            if rel_path not in self.seen and record[0] not in self.state.moved_ids
+            and not (failed_prefixes and rel_path.startswith(failed_prefixes))
+        ]
+
+    def _probe_worker(self):
+        while True:
+            item = self.probe_queue.get()
+            if item is _STOP:
+                break
+            if self.cancelled:
+                # 取消后只清空队列，不再探测
+                continue
+            filepath, rel_path, fingerprint, existing_id, mode = item
+            content_hash = ScanService.content_fingerprint(filepath, fingerprint[0])
+            if mode == "hash":
+                self.result_queue.put(("backfill", rel_path, fingerprint, existing_id, None, content_hash))
+                continue
+            if existing_id is None and content_hash:
+                moved_id = self.state.claim_moved(content_hash)
+                if moved_id is not None:
+                    self.result_queue.put(("move", rel_path, fingerprint, moved_id, None, content_hash))
+                    continue
+            media = VideoService.probe_media(filepath, timeout=self.probe_timeout)
+            if mode == "media" and media is None:
+                # 补写媒体信息失败时保留原记录
+                self.result_queue.put(("backfill", rel_path, fingerprint, existing_id, None, content_hash))
+                continue
+            self.result_queue.put((mode, rel_path, fingerprint, existing_id, media, content_hash))
+
+    def _writer(self):
+        db = SessionLocal()
+        batch = []
+        last_flush = time.monotonic()
+        try:
+            while True:
+                try:
+                    item = self.result_queue.get(timeout=FLUSH_INTERVAL)
+                except queue.Empty:
+                    item = None
+                if item is _STOP:
+                    break
+                if item is not None:
+                    batch.append(item)
+                # 批次写满或距上次提交超过 FLUSH_INTERVAL 时提交
+                if len(batch) >= self.batch_size or time.monotonic() - last_flush >= FLUSH_INTERVAL:
+                    self._flush(db, batch)
+                    batch = []
+                    last_flush = time.monotonic()
+            self._flush(db, batch)
+        finally:
+            db.close()
+
+    def _prepare(self, item: tuple, now: datetime) -> Optional[tuple]:
+        """把一条探测结果转换为 (写入类型, 参数, 计数名)，不需要写入时返回None
+
+        写入类型为 rows / backfills / moves，对应 write_batch 的参数；计数名为写入成功后加一的计数。
+        """
+        kind, rel_path, (file_size, file_mtime, file_inode), existing_id, media, content_hash = item
+        fingerprint = {"file_size": file_size, "file_mtime": file_mtime,
+                       "file_inode": file_inode, "content_hash": content_hash}
+        fingerprint["last_scan_job_id"] = self.state.job_id
+        if kind == "backfill":
+            return "backfills", {"id": existing_id, **fingerprint}, None
+        if kind == "move":
+            return "moves", {
+                "id": existing_id,
+                "root_id": self.root_id,
+                "filename": os.path.basename(rel_path),
+                "filepath": rel_path,
+                "updated_at": now,
+                **fingerprint
+            }, "moved"
+        if not media:
+            return None
+        # kind 为 media 时是未变化的文件补写媒体信息，已计入未变化数
+        counter = None
+        if kind == "probe":
+            counter = "changed" if existing_id else "added"
+        return "rows", {
+            "root_id": self.root_id,
+            "filename": os.path.basename(rel_path),
+            "filepath": rel_path,
+            "size": round(file_size / (1024 * 1024), 2),
+            "thumbnail_path": None,  # 扫描时不生成缩略图
+            "thumbnail_generated": False,
+            "created_at": now,
+            "updated_at": now,
+            **media,
+            **fingerprint
+        }, counter
+
+    @staticmethod
+    def _write(db: Session, entries: list):
+        params = {"rows": [], "backfills": [], "moves": []}
+        for target, values, _ in entries:
+            params[target].append(values)
+        ScanService.write_batch(db, **params)
+
+    def _checkpoint(self, db: Session, processed: int, increments: dict):
+        """在当前事务中把本批次计入后的计数写入扫描任务"""
+        if self.state.job_id is None:
+            return
+        checkpoint = self.state.snapshot()
+        checkpoint["processed_files"] += processed
+        for key, value in increments.items():
+            checkpoint[key] += value
+        ScanService.checkpoint(db, self.state.job_id, phase=self.state.phase, **checkpoint)
+
+    @staticmethod
+    def _increments(entries: list) -> dict:
+        increments = {"added": 0, "changed": 0, "moved": 0}
+        for _, _, counter in entries:
+            if counter:
+                increments[counter] += 1
+        return increments
+
+    def _flush(self, db: Session, batch: list):
+        if not batch:
+            return
+        now = datetime.now()
+        entries = [entry for entry in (self._prepare(item, now) for item in batch) if entry]
+        increments = self._increments(entries)
+        try:
+            self._write(db, entries)
+            self._checkpoint(db, len(batch), increments)
+            db.commit()
+        except Exception as e:
+            # 写库线程不能退出，否则上游队列会被阻塞
+            db.rollback()
+            print(f"Error committing batch, retrying {len(entries)} rows one by one: {str(e)}")
+            increments = self._flush_one_by_one(db, len(batch), entries)
+        self._count(processed_files=len(batch), **increments)
+
+    def _flush_one_by_one(self, db: Session, processed: int, entries: list) -> dict:
+        """整批写入失败后逐条写入，只有出错的记录被跳过，计入 failed_files"""
+        written = []
+        failed = 0
+        for entry in entries:
+            try:
+                self._write(db, [entry])
+                db.commit()
+                written.append(entry)
+            except Exception as e:
+                db.rollback()
+                failed += 1
+                print(f"Error writing {entry[1].get('filepath', entry[1].get('id'))}: {str(e)}")
+        increments = {**self._increments(written), "failed_files": failed}
+        try:
+            self._checkpoint(db, processed, increments)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Error saving scan checkpoint: {str(e)}")
+        return increments
+
+
+class ScanService:
+    @staticmethod
+    def file_fingerprint(st: os.stat_result) -> tuple:
+        """根据stat结果生成文件指纹 (大小, 修改时间, inode)"""
+        return st.st_size, st.st_mtime, st.st_ino
+
+    @staticmethod
+    def content_fingerprint(filepath: str, size: int) -> Optional[str]:
+        """计算内容指纹：文件大小 + 开头和结尾各 CONTENT_HASH_CHUNK 字节的哈希
+
+        只读取首尾数据块，开销与文件大小无关；读取失败时返回None。
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        try:
+            with open(filepath, 'rb') as f:
+                if size <= 2 * CONTENT_HASH_CHUNK:
+                    digest.update(f.read())
+                else:
+                    digest.update(f.read(CONTENT_HASH_CHUNK))
+                    f.seek(size - CONTENT_HASH_CHUNK)
+                    digest.update(f.read(CONTENT_HASH_CHUNK))
+        except OSError as e:
+            print(f"Error hashing {filepath}: {str(e)}")
+            return None
+        return f"{size}-{digest.hexdigest()}"
+
+    @staticmethod
+    def load_fingerprints(db: Session, root_id: Optional[int], root_path: str) -> dict:
+        """一次查询加载根目录下所有视频的文件指纹
+
+        Returns:
+            {相对路径: (id, file_size, file_mtime, file_inode, updated_at, content_hash, 是否已有媒体信息, last_scan_job_id)}
+        """
+        rows = db.query(
+            Video.id, Video.filepath, Video.file_size, Video.file_mtime, Video.file_inode,
+            Video.updated_at, Video.content_hash, Video.container, Video.last_scan_job_id
+        ).filter(Video.root_id == root_id).all()
+        fingerprints = {}
+        for (video_id, filepath, file_size, file_mtime, file_inode, updated_at, content_hash, container,
+             last_scan_job_id) in rows:
+            # 兼容早期以绝对路径存储的记录
+            rel_path = os.path.relpath(filepath, root_path) if os.path.isabs(filepath) else filepath
+            fingerprints[rel_path] = (
+                video_id, file_size, file_mtime, file_inode, updated_at, content_hash, container is not None,
+                last_scan_job_id
+            )
+        return fingerprints
+
+    @staticmethod
+    def classify_file(record: Optional[tuple], fingerprint: tuple, incremental: bool) -> str:
+        """对比文件指纹 (大小, 修改时间, inode)，返回 added / changed / unchanged / backfill"""
+        if record is None:
+            return "added"
+        if not incremental:
+            return "changed"
+        file_size, file_mtime, file_inode, updated_at = record[1:5]
+        size, mtime, inode = fingerprint
+        if file_size is None:
+            # 旧记录没有指纹：沿用修改时间判断，未变化时只补写指纹
+            if updated_at and updated_at >= datetime.fromtimestamp(mtime):
+                return "backfill"
+            return "changed"
+        if file_size != size or file_mtime != mtime:
+            return "changed"
+        # 部分网络文件系统不提供稳定的inode，为0时不参与比较
+        if file_inode and inode and file_inode != inode:
+            return "changed"
+        return "unchanged"
+
+    @staticmethod
+    def write_batch(db: Session, rows: list, backfills: list, moves: list = ()):
+        """在当前事务中写入一批扫描结果
+
+        新增和变化的文件统一用一条 INSERT ... ON CONFLICT(root_id, filepath) DO UPDATE 批量执行，
+        已存在的记录只更新文件信息，保留标签、收藏、缩略图和播放进度。
+        移动的文件按ID改写路径和指纹。
+        所有写入的记录都带上 last_scan_job_id，续扫时据此识别本任务已处理的文件。
+        """
+        if rows:
+            stmt = sqlite_insert(Video.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Video.root_id, Video.filepath],
+                set_={column: stmt.excluded[column] for column in UPSERT_COLUMNS}
+            )
+            db.execute(stmt, rows)
+        if backfills:
+            db.execute(text(
+                "UPDATE videos SET file_size = :file_size, file_mtime = :file_mtime, "
+                "file_inode = :file_inode, content_hash = :content_hash, "
+                "last_scan_job_id = :last_scan_job_id WHERE id = :id"
+            ), backfills)
+        if moves:
+            db.execute(text(
+                "UPDATE videos SET root_id = :root_id, filename = :filename, filepath = :filepath, file_size = :file_size, "
+                "file_mtime = :file_mtime, file_inode = :file_inode, content_hash = :content_hash, "
+                "last_scan_job_id = :last_scan_job_id, updated_at = :updated_at WHERE id = :id"
+            ), moves)
+
+    @staticmethod
+    def delete_videos(db: Session, video_ids: list) -> int:
+        """在当前事务中批量删除视频记录及其标签关联，返回删除的记录数
+
+        缩略图文件不在这里删除，由随后的孤立缩略图清理统一处理。
+        """
+        deleted = 0
+        for start in range(0, len(video_ids), DELETE_CHUNK_SIZE):
+            chunk = video_ids[start:start + DELETE_CHUNK_SIZE]
+            db.execute(video_tag.delete().where(video_tag.c.video_id.in_(chunk)))
+            deleted += db.query(Video).filter(Video.id.in_(chunk)).delete(synchronize_session=False)
+        return deleted
+
+    @staticmethod
+    def normalize_legacy_paths(db: Session, root_id: Optional[int], root_path: str):
+        """把早期以绝对路径存储的记录改为相对路径，使批量写入能按filepath匹配"""
+        rows = db.query(Video.id, Video.filepath).filter(Video.root_id == root_id).all()
+        existing = {filepath for _, filepath in rows}
+        updates = []
+        for video_id, filepath in rows:
+            if not os.path.isabs(filepath):
+                continue
+            rel_path = os.path.relpath(filepath, root_path)
+            # 已有同路径的相对路径记录时保留原样，交由清理阶段处理
+            if rel_path not in existing:
+                existing.add(rel_path)
+                updates.append({"id": video_id, "filepath": rel_path})
+        if updates:
+            db.execute(text("UPDATE videos SET filepath = :filepath WHERE id = :id"), updates)
+            db.commit()
+
+    @staticmethod
+    def checkpoint(db: Session, job_id: int, **fields):
+        """在当前事务中更新扫描任务的阶段和计数"""
+        fields["updated_at"] = datetime.now()
+        db.query(ScanJob).filter(ScanJob.id == job_id).update(fields, synchronize_session=False)
+
+    @staticmethod
+    def run_job(job_id: int, cancel_event: threading.Event, resume: bool = False) -> None:
+        """执行扫描任务，结束时写入最终状态
+
+        Args:
+            resume: 是否为中断后的续扫，续扫时跳过本任务已写入的记录并沿用检查点中的计数
+        """
+        db = SessionLocal()
+        try:
+            job = db.query(ScanJob).filter(ScanJob.id == job_id).first()
+            update_scan_counters(job_id=job_id, state="running")
+            try:
+                state, message = ScanService._scan(db, job, cancel_event, resume)
+            except Exception as e:
+                db.rollback()
+                print(f"Scan error: {str(e)}")
+                state, message = "failed", f"扫描出错: {str(e)}"
+            ScanService.checkpoint(
+                db, job_id, state=state, phase="done", message=message, finished_at=datetime.now()
+            )
+            db.commit()
+            update_scan_counters(state=state, phase="done")
+            update_scan_progress(1, message, True)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _scan(db: Session, job: ScanJob, cancel_event: threading.Event, resume: bool) -> tuple:
+        """返回 (任务状态, 状态描述)"""
+        query = db.query(LibraryRoot).order_by(LibraryRoot.id)
+        if job.root_id is not None:
+            query = query.filter(LibraryRoot.id == job.root_id)
+        roots = query.all()
+        if not roots:
+            return "failed", "未设置根目录"
+        # 续扫时沿用检查点中的计数；写库失败的文件没有标记本任务ID，续扫时会重新处理，不沿用失败数
+        initial = {"added": job.added, "changed": job.changed, "removed": job.removed,
+                   "moved": job.moved or 0} if resume else {}
+        update_scan_counters(**initial)
+
+        # 网络共享未挂载等情况下不能把其中的记录当作已删除，跳过该根目录
+        root_paths = {}
+        unavailable = []
+        for root in roots:
+            root_path = os.path.abspath(root.path)
+            if os.path.isdir(root_path):
+                root_paths[root.id] = root_path
+            else:
+                unavailable.append(root.name)
+                print(f"Root directory not found, skipped: {root_path}")
+        if not root_paths:
+            return "failed", f"根目录不存在: {'、'.join(unavailable)}"
+
+        probe_workers = SettingService.get_int_setting(db, "scan_probe_workers", os.cpu_count() or 4)
+        probe_timeout = SettingService.get_int_setting(db, "scan_probe_timeout", 30)
+        batch_size = SettingService.get_int_setting(db, "scan_batch_size", 500)
+        walk_workers = SettingService.get_int_setting(db, "scan_walk_workers", 8)
+
+        update_scan_progress(0, "正在加载文件指纹...")
+        state = ScanState(job.id, initial)
+        pipelines = []
+        for root_id, root_path in root_paths.items():
+            ScanService.normalize_legacy_paths(db, root_id, root_path)
+            fingerprints = ScanService.load_fingerprints(db, root_id, root_path)
+            state.add_fingerprints(root_path, fingerprints)
+            pipelines.append(ScanPipeline(
+                root_id,
+                root_path,
+                fingerprints,
+                state,
+                incremental=job.incremental,
+                # 探测进程总数保持在 scan_probe_workers 左右，遍历线程各根目录独立
+                probe_workers=-(-probe_workers // len(root_paths)),
+                probe_timeout=probe_timeout,
+                batch_size=batch_size,
+                walk_workers=walk_workers,
+                cancel_event=cancel_event,
+                resume_job_id=job.id if resume else None
+            ))
+        ScanService.checkpoint(db, job.id, phase="walking")
+        update_scan_counters(phase="walking")
+        # 指纹已加载到内存，结束读事务，避免与写库线程争用
+        db.commit()
+
+        # 每个根目录在独立的线程中扫描，慢速磁盘不会阻塞其他根目录
+        state.walking = len(pipelines)
+        threads = [
+            threading.Thread(target=ScanService._run_pipeline, args=(pipeline,),
+                             name=f"scan-root-{pipeline.root_id}", daemon=True)
+            for pipeline in pipelines
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counters = state.snapshot()
+        ScanService.checkpoint(db, job.id, **counters)
+        db.commit()
+
+        if not cancel_event.is_set():
+            # 指纹与遍历结果做差集，一次性删除文件已不存在的记录；
+            # 需要在所有根目录扫描结束后进行，跨根目录移动的记录才不会被误删
+            ScanService.checkpoint(db, job.id, phase="cleanup")
+            update_scan_counters(phase="cleanup")
+            update_scan_progress(0.95, "正在清理不存在的视频记录...")
+            missing = [video_id for pipeline in pipelines for video_id in pipeline.missing_ids()]
+            deleted_count = ScanService.delete_videos(db, missing)
+            counters["removed"] += deleted_count
+            ScanService.checkpoint(db, job.id, removed=counters["removed"])
+            db.commit()
+            update_scan_counters(removed=counters["removed"])
+            if deleted_count > 0:
+                print(f"Removed {deleted_count} video records for missing files")
+
+        summary = (f"新增 {counters['added']}，变化 {counters['changed']}，移动 {counters['moved']}，"
+                   f"删除 {counters['removed']}，未变化 {counters['unchanged']}")
+        if cancel_event.is_set():
+            return "cancelled", f"扫描已取消（{summary}）"
+        if counters["failed_files"]:
+            summary += f"，{counters['failed_files']} 个文件写入数据库失败"
+        walk_errors = sum(len(pipeline.walk_errors) for pipeline in pipelines)
+        if walk_errors:
+            summary += f"，{walk_errors} 个目录无法读取"
+        if unavailable:
+            summary += f"，跳过不存在的根目录：{'、'.join(unavailable)}"
+
+        # 扫描完成后清理孤立的缩略图文件
+        ScanService.checkpoint(db, job.id, phase="thumbnails")
+        db.commit()
+        update_scan_counters(phase="thumbnails")
+        update_scan_progress(0.95, "正在清理孤立的缩略图文件...")
+        try:
+            cleanup_result = VideoService.cleanup_orphaned_thumbnails(db)
+            if cleanup_result["success"] and cleanup_result["cleaned_count"] > 0:
+                print(f"Cleaned {cleanup_result['cleaned_count']} orphaned thumbnails during scan")
+                return "completed", f"扫描完成（{summary}），清理了 {cleanup_result['cleaned_count']} 个孤立缩略图"
+            if counters["total_files"] == 0:
+                return "completed", "未找到视频文件"
+            return "completed", f"扫描完成（{summary}）"
+        except Exception as e:
+            print(f"Error cleaning thumbnails during scan: {str(e)}")
+            return "completed", f"扫描完成（{summary}，缩略图清理失败）"
+
+    @staticmethod
+    def _run_pipeline(pipeline: ScanPipeline):
+        try:
+            pipeline.run()
+        except Exception as e:
+            # 单个根目录出错不影响其他根目录；walk_completed 为False，其记录不会被清理
+            print(f"Error scanning root {pipeline.root_path}: {str(e)}")
@@ -51,4 +51,13 @@ class SettingService:
     @staticmethod
     def get_all_settings(db: Session) -> List[Dict[str, str]]:
         settings = db.query(Setting).all()
-        return [{'key': setting.key, 'value': setting.value} for setting in settings]
\ No newline at end of file
+        return [{'key': setting.key, 'value': setting.value} for setting in settings]
+
+    @staticmethod
+    def get_int_setting(db: Session, key: str, default: int) -> int:
+        """获取整数类型的设置，未设置或格式错误时返回默认值"""
+        value = SettingService.get_setting(db, key)
+        try:
+            return int(value) if value is not None else default
+        except ValueError:
+            return default
@@ -0,0 +1,232 @@
+import hashlib
+import math
+import os
+import re
+import shutil
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+import ffmpeg
+from sqlalchemy.orm import Session
+from ..core.database import SessionLocal
+from ..models.video import Video
+from .library_service import LibraryService
+from .setting_service import SettingService
+from .video_service import VideoService
+
+# 预览图与缩略图放在一起：thumbnails/storyboards/{视频ID}_{版本}/
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+STORYBOARD_DIR = os.path.join(PROJECT_ROOT, 'thumbnails', 'storyboards')
+
+# 每帧预览图的宽度，高度按视频宽高比计算
+TILE_WIDTH = 160
+DEFAULT_TILE_HEIGHT = 90
+# 每张拼图 10x10 帧
+TILE_COLUMNS = 10
+TILE_ROWS = 10
+# 相邻两帧的最小间隔（秒），短视频不需要太多帧
+MIN_INTERVAL = 1.0
+# 排队等待生成的视频数上限
+MAX_QUEUE = 100
+# 生成失败的视频多久后才允许重试（秒）
+FAILURE_RETRY = 600.0
+
+SPRITE_PATTERN = re.compile(r"^sprite_\d{3}\.jpg$")
+VERSION_PATTERN = re.compile(r"^[0-9a-f]{8}$")
+
+_lock = threading.Lock()
+_queue = deque()
+_queued = set()
+_failed: Dict[int, float] = {}
+_worker: Optional[threading.Thread] = None
+
+
+class StoryboardService:
+    @staticmethod
+    def version(video: Video, frames: int) -> str:
+        """预览图版本：文件变化或帧数设置变化时随之变化"""
+        key = f"{video.file_size}-{video.file_mtime}-{video.duration}-{frames}-{TILE_WIDTH}"
+        return hashlib.blake2b(key.encode(), digest_size=4).hexdigest()
+
+    @staticmethod
+    def _frames(db: Session) -> int:
+        return max(1, SettingService.get_int_setting(db, "storyboard_frames", 100))
+
+    @staticmethod
+    def get_vtt_path(db: Session, video: Video) -> Optional[str]:
+        """已生成的 WebVTT 文件路径，尚未生成或视频文件已变化时返回None"""
+        version = StoryboardService.version(video, StoryboardService._frames(db))
+        path = os.path.join(STORYBOARD_DIR, f"{video.id}_{version}", "storyboard.vtt")
+        return path if os.path.exists(path) else None
+
+    @staticmethod
+    def get_sprite_path(video_id: int, version: str, filename: str) -> Optional[str]:
+        """拼图文件路径，只接受生成时使用的文件名"""
+        if not VERSION_PATTERN.match(version) or not SPRITE_PATTERN.match(filename):
+            return None
+        path = os.path.join(STORYBOARD_DIR, f"{video_id}_{version}", filename)
+        return path if os.path.exists(path) else None
+
+    @staticmethod
+    def has_failed(video_id: int) -> bool:
+        with _lock:
+            failed_at = _failed.get(video_id)
+        return failed_at is not None and time.monotonic() - failed_at < FAILURE_RETRY
+
+    @staticmethod
+    def enqueue(video_id: int) -> bool:
+        """加入后台生成队列，同一视频只排队一次；队列已满时返回False"""
+        global _worker
+        with _lock:
+            if video_id in _queued:
+                return True
+            if len(_queue) >= MAX_QUEUE:
+                return False
+            _queue.append(video_id)
+            _queued.add(video_id)
+            # 预览图生成需要读取整个文件，只用一个线程依次生成
+            if _worker is None:
+                _worker = threading.Thread(target=StoryboardService._run, name="storyboard", daemon=True)
+                _worker.start()
+            return True
+
+    @staticmethod
+    def _run():
+        global _worker
+        while True:
+            with _lock:
+                if not _queue:
+                    _worker = None
+                    return
+                video_id = _queue.popleft()
+            try:
+                StoryboardService.generate(video_id)
+            except Exception as e:
+                print(f"Error generating storyboard for video {video_id}: {str(e)}")
+                with _lock:
+                    _failed[video_id] = time.monotonic()
+            finally:
+                with _lock:
+                    _queued.discard(video_id)
+
+    @staticmethod
+    def generate(video_id: int) -> Optional[str]:
+        """生成预览拼图和 WebVTT 索引，返回 WebVTT 文件路径"""
+        db = SessionLocal()
+        try:
+            video = VideoService.get_video_by_id(db, video_id)
+            if not video:
+                return None
+            frames = StoryboardService._frames(db)
+            existing = StoryboardService.get_vtt_path(db, video)
+            if existing:
+                return existing
+            video_path = LibraryService.get_video_path(db, video)
+            if not video_path or not os.path.exists(video_path):
+                raise FileNotFoundError(f"Video file not found: {video_path}")
+            if not video.duration or video.duration <= 0:
+                raise ValueError(f"Unknown duration: {video_path}")
+            version = StoryboardService.version(video, frames)
+            duration = video.duration
+            tile_height = DEFAULT_TILE_HEIGHT
+            if video.width and video.height:
+                tile_height = max(2, round(TILE_WIDTH * video.height / video.width / 2) * 2)
+        finally:
+            db.close()
+
+        interval = max(duration / frames, MIN_INTERVAL)
+        count = max(1, math.ceil(duration / interval))
+        output_dir = os.path.join(STORYBOARD_DIR, f"{video_id}_{version}")
+        tmp_dir = output_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        try:
+            StoryboardService._extract(video_path, tmp_dir, interval, tile_height, count)
+            with open(os.path.join(tmp_dir, "storyboard.vtt"), "w", encoding="utf-8") as f:
+                f.write(StoryboardService.build_vtt(video_id, version, count, interval, duration, tile_height))
+            # 生成完成后再替换，读取方不会看到不完整的结果
+            shutil.rmtree(output_dir, ignore_errors=True)
+            os.replace(tmp_dir, output_dir)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        StoryboardService._remove_old_versions(video_id, version)
+        with _lock:
+            _failed.pop(video_id, None)
+        print(f"Generated storyboard for video {video_id}: {count} frames")
+        return os.path.join(output_dir, "storyboard.vtt")
+
+    @staticmethod
+    def _extract(video_path: str, output_dir: str, interval: float, tile_height: int, count: int):
+        """一次解码完成抽帧、缩放和拼图
+
+        -skip_frame nokey 让解码器只解码关键帧，fps 滤镜按固定间隔取最近的关键帧，
+        解码量与关键帧数量成正比，长视频也能在数秒内完成。
+        """
+        stream = ffmpeg.input(video_path, skip_frame='nokey').video
+        stream = stream.filter('fps', fps=f"1/{interval:.3f}")
+        stream = stream.filter('scale', TILE_WIDTH, tile_height)
+        stream = stream.filter('tile', f"{TILE_COLUMNS}x{TILE_ROWS}")
+        sheets = math.ceil(count / (TILE_COLUMNS * TILE_ROWS))
+        stream = ffmpeg.output(
+            stream, os.path.join(output_dir, "sprite_%03d.jpg"),
+            start_number=0, vsync='vfr', **{'frames:v': sheets, 'q:v': 5}
+        )
+        ffmpeg.run(stream, overwrite_output=True, capture_stdout=True, capture_stderr=True)
+        if not os.path.exists(os.path.join(output_dir, "sprite_000.jpg")):
+            raise Exception("Storyboard sprite was not generated")
+
+    @staticmethod
+    def _timestamp(seconds: float) -> str:
+        millis = int(round(seconds * 1000))
+        hours, millis = divmod(millis, 3600000)
+        minutes, millis = divmod(millis, 60000)
+        secs, millis = divmod(millis, 1000)
+        return f"{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}"
+
+    @staticmethod
+    def build_vtt(video_id: int, version: str, count: int, interval: float, duration: float,
+                  tile_height: int) -> str:
+        """每帧一条 cue，指向拼图中的对应区域（#xywh 媒体片段）"""
+        per_sheet = TILE_COLUMNS * TILE_ROWS
+        lines = ["WEBVTT", ""]
+        for i in range(count):
+            start = i * interval
+            end = min((i + 1) * interval, duration)
+            sheet, index = divmod(i, per_sheet)
+            row, column = divmod(index, TILE_COLUMNS)
+            lines.append(f"{StoryboardService._timestamp(start)} --> {StoryboardService._timestamp(end)}")
+            lines.append(
+                f"/api/videos/{video_id}/storyboard/{version}/sprite_{sheet:03d}.jpg"
+                f"#xywh={column * TILE_WIDTH},{row * tile_height},{TILE_WIDTH},{tile_height}"
+            )
+            lines.append("")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _remove_old_versions(video_id: int, version: str):
+        prefix = f"{video_id}_"
+        try:
+            names = os.listdir(STORYBOARD_DIR)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.startswith(prefix) and name != f"{video_id}_{version}":
+                shutil.rmtree(os.path.join(STORYBOARD_DIR, name), ignore_errors=True)
+
+    @staticmethod
+    def cleanup_orphaned(db: Session) -> int:
+        """删除已不存在的视频的预览图目录，返回删除的目录数"""
+        try:
+            names = os.listdir(STORYBOARD_DIR)
+        except FileNotFoundError:
+            return 0
+        video_ids = {video_id for (video_id,) in db.query(Video.id)}
+        cleaned = 0
+        for name in names:
+            video_id = name.split("_", 1)[0]
+            if not video_id.isdigit() or int(video_id) not in video_ids:
+                shutil.rmtree(os.path.join(STORYBOARD_DIR, name), ignore_errors=True)
+                cleaned += 1
+        return cleaned
@@ -0,0 +1,474 @@
+import itertools
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from ..core import thumbnail_store
+from ..core.database import SessionLocal
+from ..core.scan_status import get_scan_status
+from ..models.video import Video
+from .library_service import LibraryService
+from .setting_service import SettingService
+from .video_service import VideoService, THUMBNAIL_WIDTHS, THUMBNAIL_DEFAULT_WIDTH, THUMBNAIL_FILE_PATTERN
+
+# 项目根目录，缩略图路径相对于该目录存储，也是打包存储中的键
+PROJECT_ROOT = thumbnail_store.PROJECT_ROOT
+THUMBNAILS_DIR = os.path.join(PROJECT_ROOT, 'thumbnails')
+
+# 队列优先级，数值越小越先处理
+PRIORITY_REQUEST = 0  # 浏览器正在请求的缩略图
+PRIORITY_PAGE = 1  # 当前列表页
+PRIORITY_PREFETCH = 2  # 下一列表页
+PRIORITY_BACKFILL = 3  # 空闲时补全整个视频库
+
+# 工作线程空闲多久后开始补全（秒）
+IDLE_DELAY = 5.0
+# 每次补全加入队列的视频数
+BACKFILL_BATCH = 20
+# 补全到视频库末尾后，隔多久重新从头检查（秒）
+BACKFILL_RESCAN = 300.0
+# 生成失败的视频多久后才允许重试（秒），避免损坏的文件反复占用 ffmpeg
+FAILURE_RETRY = 600.0
+# 迁移旧缩略图文件时每个事务写入的文件数
+MIGRATE_BATCH = 200
+
+# 缩略图尚未生成时返回的占位图
+PLACEHOLDER_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="320" height="180" viewBox="0 0 320 180">'
+    '<rect width="320" height="180" fill="#e4e7ed"/>'
+    '<path d="M140 65v50l40-25z" fill="#c0c4cc"/>'
+    '</svg>'
+).encode()
+
+# 队列状态，均由 _lock 保护
+_lock = threading.Lock()
+_queue: Optional[queue.PriorityQueue] = None
+_seq = itertools.count()
+_pending: Dict[int, int] = {}  # {视频ID: 队列中的最高优先级}
+_inflight: Dict[int, "_Flight"] = {}  # {视频ID: 正在进行的生成}
+_failed: Dict[int, float] = {}  # {视频ID: 失败时间}
+_workers: List[threading.Thread] = []
+_stopped = threading.Event()
+_backfill_lock = threading.Lock()
+_backfill = {"cursor": 0, "next_at": 0.0}
+_migration = {"state": "idle", "migrated": 0}
+_migration_thread: Optional[threading.Thread] = None
+
+
+class _Flight:
+    """一次正在进行的缩略图生成，同一视频的并发调用方等待它完成并共享结果"""
+
+    def __init__(self, force: bool):
+        self.force = force
+        self.done = threading.Event()
+        self.result: Optional[str] = None
+
+
+class ThumbnailService:
+    @staticmethod
+    def abs_path(thumbnail_path: str) -> str:
+        return os.path.join(PROJECT_ROOT, thumbnail_path)
+
+    @staticmethod
+    def read(thumbnail_path: str) -> Optional[bytes]:
+        """从打包存储读取缩略图，尚未迁移的旧文件在首次读取时导入"""
+        data = thumbnail_store.get(thumbnail_path)
+        if data is None:
+            data = ThumbnailService._import_file(thumbnail_path)
+        return data
+
+    @staticmethod
+    def _import_file(thumbnail_path: str) -> Optional[bytes]:
+        path = ThumbnailService.abs_path(thumbnail_path)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        thumbnail_store.put(thumbnail_path, data)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return data
+
+    @staticmethod
+    def file_hash(thumbnail_path: str) -> Optional[str]:
+        data = ThumbnailService.read(thumbnail_path)
+        return VideoService.thumbnail_hash(data) if data is not None else None
+
+    @staticmethod
+    def ensure_hash(db: Session, video: Video) -> Optional[str]:
+        """早期生成的缩略图没有内容哈希，首次访问时补算"""
+        if not video.thumbnail_hash:
+            video.thumbnail_hash = ThumbnailService.file_hash(video.thumbnail_path)
+            db.commit()
+        return video.thumbnail_hash
+
+    @staticmethod
+    def select_width(width: Optional[int]) -> int:
+        """不小于期望宽度的最小档位，超过最大档位时返回最大档位"""
+        if not width:
+            return THUMBNAIL_DEFAULT_WIDTH
+        for candidate in THUMBNAIL_WIDTHS:
+            if candidate >= width:
+                return candidate
+        return THUMBNAIL_WIDTHS[-1]
+
+    @staticmethod
+    def select_format(accept: str) -> str:
+        """按 Accept 头在 ffmpeg 支持的格式中选择，优先 AVIF，其次 WebP，默认 JPEG"""
+        accepted = set()
+        for item in accept.split(","):
+            media_type, *params = [part.strip() for part in item.split(";")]
+            quality = 1.0
+            for param in params:
+                if param.startswith("q="):
+                    try:
+                        quality = float(param[2:])
+                    except ValueError:
+                        pass
+            # q=0 表示明确不接受；*/* 不代表浏览器能解码 AVIF/WebP
+            if quality > 0:
+                accepted.add(media_type.lower())
+        for fmt in VideoService.thumbnail_formats():
+            if fmt == "jpg" or f"image/{fmt}" in accepted:
+                return fmt
+        return "jpg"
+
+    @staticmethod
+    def resolve_variant(thumbnail_path: str, width: int, fmt: str) -> tuple:
+        """返回实际存在的 (缩略图数据, 宽度, 格式)，缺少时依次回退到同宽度的 JPEG 和主文件"""
+        for candidate_width, candidate_fmt in ((width, fmt), (width, "jpg")):
+            path = VideoService.thumbnail_variant_path(thumbnail_path, candidate_width, candidate_fmt)
+            data = ThumbnailService.read(path)
+            if data is not None:
+                return data, candidate_width, candidate_fmt
+        return ThumbnailService.read(thumbnail_path), THUMBNAIL_DEFAULT_WIDTH, "jpg"
+
+    @staticmethod
+    def resolve_variants(videos: List[Video], width: int, fmt: str) -> Dict[int, tuple]:
+        """批量版本的 resolve_variant，一次查询读出所有视频的候选档位
+
+        返回 {视频ID: (缩略图数据, 宽度, 格式)}，只包含已生成缩略图的视频。
+        """
+        candidates = {}
+        for video in videos:
+            if video.thumbnail_generated and video.thumbnail_path:
+                candidates[video.id] = [
+                    (VideoService.thumbnail_variant_path(video.thumbnail_path, candidate_width, candidate_fmt),
+                     candidate_width, candidate_fmt)
+                    for candidate_width, candidate_fmt in
+                    ((width, fmt), (width, "jpg"), (THUMBNAIL_DEFAULT_WIDTH, "jpg"))
+                ]
+        found = thumbnail_store.get_many([key for keys in candidates.values() for key, _, _ in keys])
+        result = {}
+        for video in videos:
+            keys = candidates.get(video.id)
+            if not keys:
+                continue
+            for key, candidate_width, candidate_fmt in keys:
+                if key in found:
+                    result[video.id] = (found[key], candidate_width, candidate_fmt)
+                    break
+            else:
+                # 尚未迁移的旧文件逐个读取并导入
+                data, candidate_width, candidate_fmt = ThumbnailService.resolve_variant(video.thumbnail_path, width, fmt)
+                if data is not None:
+                    result[video.id] = (data, candidate_width, candidate_fmt)
+        return result
+
+    @staticmethod
+    def variant_etag(thumbnail_hash: str, width: int, fmt: str) -> str:
+        if width == THUMBNAIL_DEFAULT_WIDTH and fmt == "jpg":
+            return f'"{thumbnail_hash}"'
+        return f'"{thumbnail_hash}-{width}.{fmt}"'
+
+    @staticmethod
+    def is_ready(video: Video) -> bool:
+        """缩略图已生成且存在于打包存储中（或尚未迁移的旧文件中）"""
+        return bool(video.thumbnail_generated and video.thumbnail_path
+                    and (thumbnail_store.exists(video.thumbnail_path)
+                         or os.path.exists(ThumbnailService.abs_path(video.thumbnail_path))))
+
+    @staticmethod
+    def has_failed(video_id: int) -> bool:
+        """最近一次生成失败，在 FAILURE_RETRY 秒内不再重试"""
+        with _lock:
+            failed_at = _failed.get(video_id)
+        return failed_at is not None and time.monotonic() - failed_at < FAILURE_RETRY
+
+    @staticmethod
+    def start():
+        """启动缩略图工作线程"""
+        global _queue
+        with _lock:
+            if _workers:
+                return
+            db = SessionLocal()
+            try:
+                workers = SettingService.get_int_setting(db, "thumbnail_workers", 2)
+                queue_size = SettingService.get_int_setting(db, "thumbnail_queue_size", 500)
+            finally:
+                db.close()
+            _stopped.clear()
+            _queue = queue.PriorityQueue(maxsize=max(1, queue_size))
+            _pending.clear()
+            for i in range(max(1, workers)):
+                worker = threading.Thread(target=ThumbnailService._worker, name=f"thumbnail-{i}", daemon=True)
+                _workers.append(worker)
+                worker.start()
+        ThumbnailService.start_migration()
+
+    @staticmethod
+    def stop():
+        with _lock:
+            workers = list(_workers)
+            _workers.clear()
+        _stopped.set()
+        for worker in workers:
+            worker.join()
+
+    @staticmethod
+    def enqueue(video_id: int, priority: int = PRIORITY_REQUEST) -> bool:
+        """把视频加入生成队列
+
+        已在队列中时只会提升优先级；队列已满或最近生成失败时返回False。
+        """
+        if ThumbnailService.has_failed(video_id):
+            return False
+        with _lock:
+            if _queue is None:
+                return False
+            if video_id in _inflight:
+                return True
+            current = _pending.get(video_id)
+            if current is not None and current <= priority:
+                return True
+            try:
+                _queue.put_nowait((priority, next(_seq), video_id))
+            except queue.Full:
+                return False
+            # 原先较低优先级的条目留在队列中，出队时发现优先级不符会被跳过
+            _pending[video_id] = priority
+            return True
+
+    @staticmethod
+    def prefetch(videos: Iterable[Video], priority: int) -> int:
+        """为一组视频中缺少缩略图的加入队列，返回加入的数量"""
+        count = 0
+        for video in videos:
+            if not video.thumbnail_generated and ThumbnailService.enqueue(video.id, priority):
+                count += 1
+        return count
+
+    @staticmethod
+    def get_status() -> Dict:
+        with _lock:
+            return {
+                "workers": len(_workers),
+                "queued": len(_pending),
+                "running": len(_inflight),
+                "failed": len(_failed),
+                "migration": dict(_migration),
+            }
+
+    @staticmethod
+    def get_store_stats() -> Dict:
+        """打包存储的条目数、数据量、文件大小和可回收的空闲空间"""
+        return thumbnail_store.stats()
+
+    @staticmethod
+    def compact(full: bool = False) -> int:
+        """回收打包存储中删除缩略图留下的空间，返回回收的字节数"""
+        return thumbnail_store.compact(full)
+
+    @staticmethod
+    def start_migration():
+        """在后台把缩略图目录中的旧文件导入打包存储"""
+        global _migration_thread
+        with _lock:
+            if _migration_thread is not None and _migration_thread.is_alive():
+                return
+            _migration_thread = threading.Thread(
+                target=ThumbnailService.migrate_files, name="thumbnail-migrate", daemon=True
+            )
+            _migration_thread.start()
+
+    @staticmethod
+    def migrate_files() -> int:
+        """把缩略图目录中的 *_thumb* 文件分批导入打包存储，每批提交后删除原文件
+
+        中途退出不会丢失数据：未删除的文件下次启动时重新导入，已导入的键会被覆盖。
+        返回导入的文件数。
+        """
+        try:
+            names = [name for name in os.listdir(THUMBNAILS_DIR) if THUMBNAIL_FILE_PATTERN.match(name)]
+        except FileNotFoundError:
+            names = []
+        if not names:
+            return 0
+        print(f"Migrating {len(names)} thumbnail files into {thumbnail_store.STORE_PATH}")
+        _migration.update(state="running", migrated=0)
+        migrated = 0
+        try:
+            for start in range(0, len(names), MIGRATE_BATCH):
+                if _stopped.is_set():
+                    break
+                batch = []
+                for name in names[start:start + MIGRATE_BATCH]:
+                    path = os.path.join(THUMBNAILS_DIR, name)
+                    try:
+                        with open(path, 'rb') as f:
+                            batch.append((os.path.relpath(path, PROJECT_ROOT), path, f.read()))
+                    except OSError:
+                        # 已被删除或已在读取时导入
+                        continue
+                thumbnail_store.put_many((key, data) for key, _, data in batch)
+                for _, path, _ in batch:
+                    try:
+                        os.remove(path)
+                    except OSError as e:
+                        print(f"Failed to remove migrated thumbnail {path}: {str(e)}")
+                migrated += len(batch)
+                _migration["migrated"] = migrated
+        except Exception as e:
+            print(f"Error migrating thumbnail files: {str(e)}")
+            _migration["state"] = "failed"
+            return migrated
+        _migration["state"] = "done"
+        print(f"Migrated {migrated} thumbnail files")
+        return migrated
+
+    @staticmethod
+    def _worker():
+        while not _stopped.is_set():
+            try:
+                priority, _, video_id = _queue.get(timeout=IDLE_DELAY)
+            except queue.Empty:
+                ThumbnailService._backfill()
+                continue
+            with _lock:
+                if _pending.get(video_id) != priority:
+                    # 已被更高优先级的条目处理过
+                    continue
+                del _pending[video_id]
+            try:
+                ThumbnailService.generate(video_id)
+            except Exception as e:
+                print(f"Error generating thumbnail for video {video_id}: {str(e)}")
+
+    @staticmethod
+    def generate(video_id: int, force: bool = False) -> Optional[str]:
+        """为视频生成缩略图并写库，返回缩略图相对路径，失败时返回None
+
+        同一视频同时只有一次生成在进行（single-flight），并发调用方等待并共享其结果，
+        不会同时运行多个 ffmpeg 写同一个文件。force 为True时重新生成已有的缩略图；
+        若此时进行中的是普通生成，等它结束后再重新生成。
+        """
+        while True:
+            with _lock:
+                flight = _inflight.get(video_id)
+                leader = flight is None
+                if leader:
+                    flight = _inflight[video_id] = _Flight(force)
+            if leader:
+                break
+            flight.done.wait()
+            if flight.force or not force:
+                return flight.result
+        try:
+            flight.result = ThumbnailService._run(video_id, force)
+        finally:
+            with _lock:
+                del _inflight[video_id]
+            flight.done.set()
+        return flight.result
+
+    @staticmethod
+    def regenerate(video_id: int) -> Optional[str]:
+        """强制重新生成缩略图，清理旧文件"""
+        return ThumbnailService.generate(video_id, force=True)
+
+    @staticmethod
+    def _run(video_id: int, force: bool) -> Optional[str]:
+        db = SessionLocal()
+        try:
+            video = VideoService.get_video_by_id(db, video_id)
+            if not video:
+                return None
+            if not force and ThumbnailService.is_ready(video):
+                return video.thumbnail_path
+            return ThumbnailService._generate(db, video, force)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _generate(db: Session, video: Video, force: bool) -> Optional[str]:
+        video_path = LibraryService.get_video_path(db, video)
+        thumbnail_path = None
+        if video_path and os.path.exists(video_path):
+            thumbnail_path = VideoService.generate_thumbnail(
+                video_path,
+                force_regenerate=force,
+                old_thumbnail_path=video.thumbnail_path if force else None,
+                duration=video.duration,
+                position=ThumbnailService._position(db)
+            ) or None
+        if thumbnail_path:
+            video.thumbnail_path = thumbnail_path
+            video.thumbnail_generated = True
+            video.thumbnail_hash = ThumbnailService.file_hash(thumbnail_path)
+            video.updated_at = datetime.now()
+            with _lock:
+                _failed.pop(video.id, None)
+        else:
+            video.thumbnail_generated = False
+            with _lock:
+                _failed[video.id] = time.monotonic()
+        db.commit()
+        return thumbnail_path
+
+    @staticmethod
+    def _position(db: Session) -> Optional[float]:
+        """关键帧模式的取帧位置（时长的比例），关闭关键帧模式时返回None，沿用第1秒完整解码"""
+        if not SettingService.get_int_setting(db, "thumbnail_keyframe_only", 1):
+            return None
+        percent = SettingService.get_int_setting(db, "thumbnail_position", 10)
+        return min(max(percent, 0), 95) / 100
+
+    @staticmethod
+    def _backfill():
+        """工作线程空闲时，按ID顺序把缺少缩略图的视频以最低优先级加入队列"""
+        if not _backfill_lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() < _backfill["next_at"] or not _queue.empty():
+                return
+            # 扫描期间磁盘和数据库都很繁忙，暂不补全
+            if get_scan_status().get("state") == "running":
+                return
+            db = SessionLocal()
+            try:
+                if not SettingService.get_int_setting(db, "thumbnail_backfill", 1):
+                    _backfill["next_at"] = time.monotonic() + BACKFILL_RESCAN
+                    return
+                ids = [video_id for (video_id,) in db.query(Video.id).filter(
+                    Video.id > _backfill["cursor"],
+                    or_(Video.thumbnail_generated.is_(None), Video.thumbnail_generated.is_(False))
+                ).order_by(Video.id).limit(BACKFILL_BATCH)]
+            finally:
+                db.close()
+            if not ids:
+                # 已到末尾，稍后从头检查新加入的视频和可重试的失败视频
+                _backfill.update(cursor=0, next_at=time.monotonic() + BACKFILL_RESCAN)
+                return
+            _backfill["cursor"] = ids[-1]
+            for video_id in ids:
+                ThumbnailService.enqueue(video_id, PRIORITY_BACKFILL)
+        finally:
+            _backfill_lock.release()
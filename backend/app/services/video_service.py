@@ -1,5 +1,10 @@
 import os
+import re
+import json
 import time
+import shutil
+import tempfile
+import subprocess
 import ffmpeg
 from sqlalchemy.orm import Session
 from typing import List, Optional
@@ -7,23 +12,111 @@ from datetime import datetime
 from ..models.video import Video
 from ..models.setting import Setting
 from ..models.tag import Tag
+from ..core import thumbnail_store
+from .library_service import LibraryService
 from fastapi import HTTPException, UploadFile
 from sqlalchemy import func
 
+# 探测时写入videos表的媒体信息列
+MEDIA_COLUMNS = ("container", "video_codec", "audio_codec", "width", "height",
+                 "bit_rate", "frame_rate", "moov_at_start", "web_playable")
+
+# 浏览器可直接播放的容器及其支持的编码
+WEB_CONTAINERS = {
+    "mp4": {
+        "extensions": (".mp4", ".m4v", ".mov"),
+        "video": ("h264", "av1", "vp9"),
+        "audio": ("aac", "mp3", "opus", "flac"),
+    },
+    "webm": {
+        "extensions": (".webm",),
+        "video": ("vp8", "vp9", "av1"),
+        "audio": ("opus", "vorbis"),
+    },
+}
+
+# 列表接口按分辨率过滤时各档位的高度范围 [下限, 上限)
+RESOLUTION_RANGES = {
+    "2160p": (2160, None),
+    "1440p": (1440, 2160),
+    "1080p": (1080, 1440),
+    "720p": (720, 1080),
+    "sd": (None, 720),
+}
+
+# 缩略图宽度档位，一次 ffmpeg 调用生成全部档位
+THUMBNAIL_WIDTHS = (160, 320, 640)
+# 默认宽度的 JPEG 即 thumbnail_path 指向的主文件，其他档位和格式按文件名后缀区分
+THUMBNAIL_DEFAULT_WIDTH = 320
+# 缩略图格式的 MIME 类型，按优先级排列
+THUMBNAIL_MIME_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpg": "image/jpeg"}
+# 各格式的编码参数
+THUMBNAIL_ENCODE_ARGS = {
+    "avif": {"vcodec": "libaom-av1", "still-picture": 1, "crf": 35, "cpu-used": 6},
+    "webp": {"vcodec": "libwebp", "quality": 75},
+    "jpg": {"q:v": 5},
+}
+# 缩略图文件名：主文件 xxx_thumb.jpg，其他档位 xxx_thumb_160.webp
+THUMBNAIL_FILE_PATTERN = re.compile(r"^(.*_thumb)(?:_\d+)?\.(?:jpg|webp|avif)$")
+
+# 关键帧模式下，设置的位置是黑帧时依次尝试的位置（时长的比例）
+THUMBNAIL_FALLBACK_POSITIONS = (0.25, 0.5, 0.75)
+# 亮度（Y 分量，0-255）低于该值的像素视为黑色
+THUMBNAIL_BLACK_LEVEL = 32
+# 黑色像素占比（百分比）不低于该值的帧视为黑帧
+THUMBNAIL_BLACK_AMOUNT = 98
+
+# 当前 ffmpeg 支持的缩略图格式，首次使用时检测
+_thumbnail_formats: Optional[tuple] = None
+
 
 class VideoService:
     @staticmethod
-    def get_video_duration(filepath: str) -> float:
-        """获取视频时长（秒）"""
+    def probe(filepath: str, timeout: Optional[float] = None) -> dict:
+        """调用ffprobe获取媒体信息，超时后终止ffprobe进程
+
+        与 ffmpeg.probe 不同，超时时子进程会被杀死，不会残留在后台。
+        """
+        args = ['ffprobe', '-show_format', '-show_streams', '-of', 'json', filepath]
+        result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+        if result.returncode != 0:
+            raise ffmpeg.Error('ffprobe', result.stdout, result.stderr)
+        return json.loads(result.stdout.decode('utf-8'))
+
+    @staticmethod
+    def probe_media(filepath: str, timeout: Optional[float] = None) -> Optional[dict]:
+        """一次ffprobe调用获取时长和媒体信息
+
+        Returns:
+            包含 duration 和 MEDIA_COLUMNS 各字段的字典，无法获取有效时长时返回None
+        """
+        try:
+            probe = VideoService.probe(filepath, timeout=timeout)
+        except ffmpeg.Error as e:
+            print(f"FFmpeg error getting duration for {filepath}: {str(e)}")
+            return None
+        except subprocess.TimeoutExpired:
+            print(f"FFprobe timed out after {timeout}s for {filepath}")
+            return None
+        except Exception as e:
+            print(f"Error getting duration for {filepath}: {str(e)}")
+            return None
+
+        duration = VideoService._parse_duration(probe)
+        if duration <= 0:
+            print(f"No valid duration found for {filepath}")
+            return None
+        return {"duration": duration, **VideoService.parse_media_info(probe, filepath)}
+
+    @staticmethod
+    def _parse_duration(probe: dict) -> float:
+        # 首先尝试从format中获取时长
         try:
-            probe = ffmpeg.probe(filepath)
-            
-            # 首先尝试从format中获取时长
             if 'format' in probe and 'duration' in probe['format']:
                 duration = float(probe['format']['duration'])
                 if duration > 0:
                     return duration
-            
+
             # 如果format中没有时长信息，尝试从视频流中获取
             video_streams = [s for s in probe.get('streams', []) if s.get('codec_type') == 'video']
             if video_streams:
@@ -32,17 +125,106 @@ class VideoService:
                     duration = float(video_info['duration'])
                     if duration > 0:
                         return duration
-            
-            # 如果都没有找到有效时长，返回错误值
-            print(f"No valid duration found for {filepath}")
-            return -1.0
-            
-        except ffmpeg.Error as e:
-            print(f"FFmpeg error getting duration for {filepath}: {str(e)}")
-            return -1.0
-        except Exception as e:
-            print(f"Error getting duration for {filepath}: {str(e)}")
-            return -1.0
+        except (TypeError, ValueError):
+            pass
+        return -1.0
+
+    @staticmethod
+    def parse_media_info(probe: dict, filepath: str) -> dict:
+        """从ffprobe结果中提取容器、编码、分辨率、码率、帧率和moov位置，并判断能否在网页播放"""
+        fmt = probe.get('format', {})
+        streams = probe.get('streams', [])
+        # 跳过封面图片等附加的视频流
+        video = next((s for s in streams if s.get('codec_type') == 'video'
+                      and not s.get('disposition', {}).get('attached_pic')), {})
+        audio = next((s for s in streams if s.get('codec_type') == 'audio'), {})
+
+        bit_rate = fmt.get('bit_rate') or video.get('bit_rate')
+        container = fmt.get('format_name')
+        info = {
+            "container": container,
+            "video_codec": video.get('codec_name'),
+            "audio_codec": audio.get('codec_name'),
+            "width": video.get('width'),
+            "height": video.get('height'),
+            "bit_rate": int(bit_rate) if bit_rate and str(bit_rate).isdigit() else None,
+            "frame_rate": VideoService._parse_frame_rate(video.get('avg_frame_rate'))
+                          or VideoService._parse_frame_rate(video.get('r_frame_rate')),
+            "moov_at_start": VideoService.moov_at_start(filepath) if container and 'mp4' in container else None,
+        }
+        info["web_playable"] = VideoService.is_web_playable(
+            filepath, container, info["video_codec"], info["audio_codec"], video.get('pix_fmt')
+        )
+        return info
+
+    @staticmethod
+    def _parse_frame_rate(value: Optional[str]) -> Optional[float]:
+        """解析 "30000/1001" 形式的帧率"""
+        if not value:
+            return None
+        try:
+            num, _, den = value.partition('/')
+            rate = float(num) / float(den or 1)
+        except (ValueError, ZeroDivisionError):
+            return None
+        return round(rate, 3) if rate > 0 else None
+
+    @staticmethod
+    def moov_at_start(filepath: str) -> Optional[bool]:
+        """读取MP4顶层box头，判断moov是否位于mdat之前（faststart）
+
+        moov在文件末尾时浏览器需要先请求文件末尾才能开始播放。无法判断时返回None。
+        """
+        try:
+            with open(filepath, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                file_size = f.tell()
+                pos = 0
+                while pos + 8 <= file_size:
+                    f.seek(pos)
+                    header = f.read(8)
+                    box_size = int.from_bytes(header[:4], 'big')
+                    box_type = header[4:8]
+                    if box_type == b'moov':
+                        return True
+                    if box_type == b'mdat':
+                        return False
+                    if box_size == 1:
+                        # 64位扩展大小
+                        box_size = int.from_bytes(f.read(8), 'big')
+                    if box_size < 8:
+                        # 大小为0表示延续到文件末尾，或文件已损坏
+                        return None
+                    pos += box_size
+        except OSError as e:
+            print(f"Error reading boxes of {filepath}: {str(e)}")
+        return None
+
+    @staticmethod
+    def is_web_playable(filepath: str, container: Optional[str], video_codec: Optional[str],
+                        audio_codec: Optional[str], pix_fmt: Optional[str] = None) -> bool:
+        """根据容器和编码判断主流浏览器能否直接播放"""
+        if not container or not video_codec:
+            return False
+        ext = os.path.splitext(filepath)[1].lower()
+        if ext in WEB_CONTAINERS['mp4']['extensions'] and 'mp4' in container:
+            rules = WEB_CONTAINERS['mp4']
+        elif ext in WEB_CONTAINERS['webm']['extensions'] and 'webm' in container:
+            rules = WEB_CONTAINERS['webm']
+        else:
+            return False
+        if video_codec not in rules['video'] or (audio_codec and audio_codec not in rules['audio']):
+            return False
+        # 浏览器只能解码8位4:2:0的H.264
+        if video_codec == 'h264' and pix_fmt and pix_fmt not in ('yuv420p', 'yuvj420p'):
+            return False
+        return True
+
+    @staticmethod
+    def get_video_duration(filepath: str, timeout: Optional[float] = None) -> float:
+        """获取视频时长（秒）"""
+        media = VideoService.probe_media(filepath, timeout=timeout)
+        return media["duration"] if media else -1.0
 
     @staticmethod
     def _get_abs_path(root_dir, path):
@@ -82,183 +264,6 @@ class VideoService:
         progress = processed / total if total > 0 else 0
         update_scan_progress(progress, msg)
 
-    @staticmethod
-    def scan_videos(db: Session) -> None:
-        import concurrent.futures
-        from datetime import datetime
-        from ..core.scan_status import update_scan_progress
-        root_dir = db.query(Setting).filter(Setting.key == "root_directory").first()
-        if not root_dir or not root_dir.value:
-            update_scan_progress(0, "未设置根目录", True)
-            return
-        root_path = os.path.abspath(root_dir.value)
-        update_scan_progress(0, "正在清理不存在的视频记录...")
-        all_videos = db.query(Video).all()
-        deleted_count = 0
-        cleaned_thumbnails = 0
-        project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-        
-        for video in all_videos:
-            abs_path = VideoService._get_abs_path(root_path, video.filepath)
-            if not os.path.exists(abs_path) or not abs_path.startswith(root_path):
-                # 删除对应的缩略图文件
-                if video.thumbnail_path:
-                    thumbnail_abs_path = os.path.join(project_root, video.thumbnail_path)
-                    if os.path.exists(thumbnail_abs_path):
-                        try:
-                            os.remove(thumbnail_abs_path)
-                            cleaned_thumbnails += 1
-                            print(f"Deleted orphaned thumbnail: {thumbnail_abs_path}")
-                        except Exception as e:
-                            print(f"Failed to delete thumbnail {thumbnail_abs_path}: {str(e)}")
-                
-                db.delete(video)
-                deleted_count += 1
-        
-        if deleted_count > 0:
-            db.commit()
-            message = f"已清理 {deleted_count} 个无效的视频记录"
-            if cleaned_thumbnails > 0:
-                message += f"和 {cleaned_thumbnails} 个对应的缩略图文件"
-            update_scan_progress(0, message + "...")
-        video_extensions = ('.mp4', '.avi', '.mkv', '.mov', '.wmv', '.3gp', '.ts', '.flv', '.webm', '.m3u8', '.mpeg')
-        def process_video_file(file_info):
-            filepath, rel_path = file_info
-            try:
-                # 使用原生SQL查询避免ORM问题
-                from sqlalchemy import text
-                result = db.execute(text(
-                    "SELECT id FROM videos WHERE filepath = :rel_path OR filepath = :full_path LIMIT 1"
-                ), {"rel_path": rel_path, "full_path": filepath})
-                existing_id = result.scalar()
-                
-                # 检查文件修改时间，如果数据库记录较新则跳过
-                file_mtime = datetime.fromtimestamp(os.path.getmtime(filepath))
-                if existing_id:
-                    video = db.query(Video).filter(Video.id == existing_id).first()
-                    if video and video.updated_at and video.updated_at >= file_mtime:
-                        return None
-                
-                # 获取文件信息
-                size = os.path.getsize(filepath) / (1024 * 1024)
-                duration = VideoService.get_video_duration(filepath)
-                
-                if duration > 0:
-                    # 扫描时不生成缩略图，只保存基本信息
-                    if existing_id:
-                        # 使用原生SQL更新现有记录
-                        db.execute(text(
-                            "UPDATE videos SET filepath = :rel_path, size = :size, duration = :duration, updated_at = :updated_at WHERE id = :id"
-                        ), {
-                            "rel_path": rel_path,
-                            "size": round(size, 2),
-                            "duration": duration,
-                            "updated_at": datetime.now(),
-                            "id": existing_id
-                        })
-                        # 返回更新后的视频对象
-                        return db.query(Video).filter(Video.id == existing_id).first()
-                    else:
-                        # 创建新记录
-                        video = Video(
-                            filename=os.path.basename(filepath),
-                            filepath=rel_path,  # 使用相对路径存储
-                            size=round(size, 2),
-                            duration=duration,
-                            thumbnail_path=None,  # 扫描时不生成缩略图
-                            thumbnail_generated=False,  # 标记缩略图未生成
-                            updated_at=datetime.now()
-                        )
-                        db.add(video)
-                        return video
-            except Exception as e:
-                import traceback
-                print(f"Error processing {filepath}: {str(e)}")
-                print(f"Traceback: {traceback.format_exc()}")
-                
-                # 如果是数据库约束错误，尝试查找已存在的记录并更新
-                if "UNIQUE constraint failed" in str(e):
-                    try:
-                        existing_video = db.query(Video).filter(
-                            (Video.filepath == rel_path) | (Video.filepath == filepath)
-                        ).first()
-                        if existing_video:
-                            existing_video.filepath = rel_path
-                            try:
-                                existing_video.size = round(os.path.getsize(filepath) / (1024 * 1024), 2)
-                                existing_video.duration = VideoService.get_video_duration(filepath)
-                                existing_video.updated_at = datetime.now()
-                                return existing_video
-                            except Exception as size_e:
-                                print(f"Error updating file info for {filepath}: {str(size_e)}")
-                                return existing_video
-                    except Exception as inner_e:
-                        print(f"Error handling duplicate record for {filepath}: {str(inner_e)}")
-            return None
-        try:
-            video_files = []
-            update_scan_progress(0, "正在扫描视频文件...")
-            for root, _, files in os.walk(root_path):
-                for file in files:
-                    if file.lower().endswith(video_extensions):
-                        filepath = os.path.abspath(os.path.join(root, file))
-                        rel_path = os.path.relpath(filepath, root_path)
-                        video_files.append((filepath, rel_path))
-            if not video_files:
-                update_scan_progress(1, "未找到视频文件", True)
-                return
-            total_files = len(video_files)
-            processed_files = 0
-            def update_progress():
-                nonlocal processed_files
-                VideoService._update_progress(processed_files, total_files, f"正在处理第 {processed_files}/{total_files} 个文件...")
-            # 使用批量处理来减少数据库锁定时间
-            batch_size = 10
-            for i in range(0, len(video_files), batch_size):
-                batch = video_files[i:i + batch_size]
-                
-                with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-                    futures = [executor.submit(process_video_file, file_info) for file_info in batch]
-                    for future in concurrent.futures.as_completed(futures):
-                        try:
-                            result = future.result()
-                            processed_files += 1
-                            update_progress()
-                        except Exception as e:
-                            print(f"Error processing video: {str(e)}")
-                            processed_files += 1  # 即使出错也要增加计数
-                            update_progress()
-                
-                # 每个批次提交一次
-                try:
-                    db.commit()
-                except Exception as e:
-                    print(f"Error committing batch: {str(e)}")
-                    db.rollback()
-            
-            # 最终提交
-            try:
-                db.commit()
-            except Exception as e:
-                print(f"Error in final commit: {str(e)}")
-                db.rollback()
-            
-            # 扫描完成后清理孤立的缩略图文件
-            update_scan_progress(0.95, "正在清理孤立的缩略图文件...")
-            try:
-                cleanup_result = VideoService.cleanup_orphaned_thumbnails(db)
-                if cleanup_result["success"] and cleanup_result["cleaned_count"] > 0:
-                    print(f"Cleaned {cleanup_result['cleaned_count']} orphaned thumbnails during scan")
-                    update_scan_progress(1, f"扫描完成，清理了 {cleanup_result['cleaned_count']} 个孤立缩略图", True)
-                else:
-                    update_scan_progress(1, "扫描完成", True)
-            except Exception as e:
-                print(f"Error cleaning thumbnails during scan: {str(e)}")
-                update_scan_progress(1, "扫描完成（缩略图清理失败）", True)
-        except Exception as e:
-            print(f"Scan error: {str(e)}")
-            update_scan_progress(1, f"扫描出错: {str(e)}", True)
-
     @staticmethod
     def get_total_videos(db: Session) -> int:
         """获取视频总数"""
@@ -270,19 +275,118 @@ class VideoService:
         return db.query(Video).filter(Video.id == video_id).first()
 
     @staticmethod
-    def generate_thumbnail(video_path: str, force_regenerate: bool = False, old_thumbnail_path: str = None) -> str:
+    def thumbnail_formats() -> tuple:
+        """当前 ffmpeg 支持的缩略图格式，JPEG 始终可用"""
+        global _thumbnail_formats
+        if _thumbnail_formats is None:
+            formats = []
+            try:
+                encoders = subprocess.run(
+                    ["ffmpeg", "-hide_banner", "-encoders"], capture_output=True, text=True, timeout=10
+                ).stdout
+                muxers = subprocess.run(
+                    ["ffmpeg", "-hide_banner", "-muxers"], capture_output=True, text=True, timeout=10
+                ).stdout
+                if "libaom-av1" in encoders and re.search(r"\bavif\b", muxers):
+                    formats.append("avif")
+                if "libwebp" in encoders:
+                    formats.append("webp")
+            except (OSError, subprocess.SubprocessError) as e:
+                print(f"Error detecting ffmpeg encoders: {str(e)}")
+            formats.append("jpg")
+            _thumbnail_formats = tuple(formats)
+        return _thumbnail_formats
+
+    @staticmethod
+    def _disable_thumbnail_format(fmt: str) -> tuple:
+        global _thumbnail_formats
+        _thumbnail_formats = tuple(f for f in VideoService.thumbnail_formats() if f != fmt)
+        return _thumbnail_formats
+
+    @staticmethod
+    def thumbnail_variant_path(thumbnail_path: str, width: int, fmt: str) -> str:
+        """缩略图指定宽度和格式的文件路径"""
+        if width == THUMBNAIL_DEFAULT_WIDTH and fmt == "jpg":
+            return thumbnail_path
+        return f"{os.path.splitext(thumbnail_path)[0]}_{width}.{fmt}"
+
+    @staticmethod
+    def thumbnail_keys(thumbnail_path: str) -> List[str]:
+        """缩略图主文件及其所有档位和格式在打包存储中的键"""
+        return [
+            VideoService.thumbnail_variant_path(thumbnail_path, width, fmt)
+            for width in THUMBNAIL_WIDTHS for fmt in THUMBNAIL_MIME_TYPES
+        ]
+
+    @staticmethod
+    def remove_thumbnail_files(thumbnail_abs_path: str):
+        """删除缩略图主文件及其所有档位和格式，包括打包存储中的条目和尚未迁移的文件"""
+        key = os.path.relpath(thumbnail_abs_path, thumbnail_store.PROJECT_ROOT)
+        try:
+            thumbnail_store.delete(VideoService.thumbnail_keys(key))
+        except Exception as e:
+            print(f"Failed to delete thumbnail {key} from store: {str(e)}")
+        for path in VideoService.thumbnail_keys(thumbnail_abs_path):
+            ok, msg = VideoService._safe_remove(path)
+            if not ok:
+                print(msg)
+
+    @staticmethod
+    def _thumbnail_frame(video_path: str, duration: Optional[float] = None, position: Optional[float] = None):
+        """缩略图所用的一帧
+
+        position 为None时沿用固定的第1秒并完整解码。否则把 position 和 THUMBNAIL_FALLBACK_POSITIONS 处
+        作为同一个 ffmpeg 进程的多个输入，每个输入跳到该位置之后的第一个关键帧，只解码这一个关键帧；
+        按顺序拼接后由 blackframe 统计黑色像素占比，metadata 丢弃黑帧，取第一个不是黑帧的候选帧。
+        全部是黑帧时取 position 处的帧。
+        """
+        if position is None or not duration or duration <= 0:
+            return ffmpeg.input(video_path, ss='00:00:01').video
+        positions = [position] + [p for p in THUMBNAIL_FALLBACK_POSITIONS if p != position]
+        candidates = [
+            ffmpeg.input(video_path, ss=f"{duration * p:.3f}", skip_frame='nokey').video.filter('trim', end_frame=1)
+            for p in positions
+        ]
+        first = candidates[0].filter_multi_output('split')
+        candidates[0] = first.stream(0)
+        # amount=0 使每一帧都带上 pblack，再按占比筛选
+        bright = (
+            ffmpeg.concat(*candidates, v=1, a=0)
+            .filter('blackframe', amount=0, threshold=THUMBNAIL_BLACK_LEVEL)
+            .filter('metadata', mode='select', key='lavfi.blackframe.pblack', value=THUMBNAIL_BLACK_AMOUNT,
+                    function='less')
+        )
+        return ffmpeg.concat(bright, first.stream(1), v=1, a=0).filter('trim', end_frame=1)
+
+    @staticmethod
+    def _run_thumbnail_ffmpeg(video_path: str, thumbnail_path: str, formats: tuple,
+                              duration: Optional[float] = None, position: Optional[float] = None):
+        """在一次 ffmpeg 调用中选取一帧（跳过黑帧），缩放为各档位宽度并编码为各格式"""
+        source = VideoService._thumbnail_frame(video_path, duration, position).filter_multi_output('split')
+        outputs = []
+        for i, width in enumerate(THUMBNAIL_WIDTHS):
+            scaled = source.stream(i).filter('scale', width, -2).filter_multi_output('split')
+            for j, fmt in enumerate(formats):
+                path = VideoService.thumbnail_variant_path(thumbnail_path, width, fmt)
+                outputs.append(ffmpeg.output(scaled.stream(j), path, vframes=1, **THUMBNAIL_ENCODE_ARGS[fmt]))
+        ffmpeg.run(ffmpeg.merge_outputs(*outputs), overwrite_output=True, capture_stdout=True, capture_stderr=True)
+
+    @staticmethod
+    def generate_thumbnail(video_path: str, force_regenerate: bool = False, old_thumbnail_path: str = None,
+                           duration: float = None, position: float = None) -> str:
         """生成视频缩略图
         
         Args:
             video_path: 视频文件路径
             force_regenerate: 是否强制重新生成缩略图
             old_thumbnail_path: 旧的缩略图路径，如果提供则在生成新缩略图前删除
+            duration: 视频时长（秒），关键帧模式需要
+            position: 取帧位置占时长的比例，提供时只解码关键帧并跳过黑帧；为None时取第1秒的帧
         """
         try:
-            # 使用项目根目录下的thumbnails目录，而不是视频文件所在目录
-            project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+            # 缩略图保存在打包存储中，键为项目根目录下 thumbnails 目录中的相对路径
+            project_root = thumbnail_store.PROJECT_ROOT
             thumbnails_dir = os.path.join(project_root, 'thumbnails')
-            os.makedirs(thumbnails_dir, exist_ok=True)
 
             # 生成缩略图文件名，使用视频文件的完整路径hash来避免重名
             import hashlib
@@ -290,45 +394,66 @@ class VideoService:
             video_name = os.path.splitext(os.path.basename(video_path))[0]
             thumbnail_filename = f"{video_name}_{path_hash}_thumb.jpg"
             thumbnail_path = os.path.join(thumbnails_dir, thumbnail_filename)
+            thumbnail_key = os.path.relpath(thumbnail_path, project_root)
 
-            # 如果提供了旧缩略图路径，先删除旧文件
+            # 如果提供了旧缩略图路径，先删除旧缩略图
             if old_thumbnail_path:
                 old_thumbnail_abs_path = os.path.join(project_root, old_thumbnail_path) if not os.path.isabs(old_thumbnail_path) else old_thumbnail_path
-                if os.path.exists(old_thumbnail_abs_path) and old_thumbnail_abs_path != thumbnail_path:
-                    try:
-                        os.remove(old_thumbnail_abs_path)
-                        print(f"Deleted old thumbnail: {old_thumbnail_abs_path}")
-                    except Exception as e:
-                        print(f"Failed to delete old thumbnail {old_thumbnail_abs_path}: {str(e)}")
-
-            # 检查是否已经存在同名的缩略图文件
-            if os.path.exists(thumbnail_path) and not force_regenerate:
-                return os.path.relpath(thumbnail_path, project_root)
-
-            # 如果强制重新生成，删除现有文件
-            if force_regenerate and os.path.exists(thumbnail_path):
+                if old_thumbnail_abs_path != thumbnail_path:
+                    VideoService.remove_thumbnail_files(old_thumbnail_abs_path)
+                    print(f"Deleted old thumbnail: {old_thumbnail_abs_path}")
+
+            # 检查是否已经存在同名的缩略图
+            if not force_regenerate and thumbnail_store.exists(thumbnail_key):
+                return thumbnail_key
+
+            # 如果强制重新生成，删除现有缩略图
+            if force_regenerate:
+                VideoService.remove_thumbnail_files(thumbnail_path)
+                print(f"Deleted existing thumbnail for regeneration: {thumbnail_key}")
+
+            # 使用ffmpeg在临时目录中生成各档位宽度和格式的缩略图，再一次写入打包存储
+            tmp_dir = tempfile.mkdtemp(prefix="thumb_")
+            try:
+                tmp_path = os.path.join(tmp_dir, thumbnail_filename)
+                formats = VideoService.thumbnail_formats()
                 try:
-                    os.remove(thumbnail_path)
-                    print(f"Deleted existing thumbnail for regeneration: {thumbnail_path}")
-                except Exception as e:
-                    print(f"Failed to delete existing thumbnail {thumbnail_path}: {str(e)}")
-
-            # 使用ffmpeg生成缩略图
-            stream = ffmpeg.input(video_path, ss='00:00:01')
-            stream = ffmpeg.filter(stream, 'scale', 320, -1)
-            stream = ffmpeg.output(stream, thumbnail_path, vframes=1)
-            ffmpeg.run(stream, overwrite_output=True, capture_stdout=True, capture_stderr=True)
-            
-            # 验证缩略图文件是否成功生成
-            if not os.path.exists(thumbnail_path) or os.path.getsize(thumbnail_path) == 0:
-                raise Exception("Generated thumbnail file is empty or does not exist")
-            
-            # 返回相对路径
-            return os.path.relpath(thumbnail_path, project_root)
+                    VideoService._run_thumbnail_ffmpeg(video_path, tmp_path, formats, duration, position)
+                except ffmpeg.Error:
+                    if "avif" not in formats:
+                        raise
+                    # 部分 ffmpeg 构建的 AVIF 编码不可用，去掉 AVIF 后重试
+                    print("AVIF thumbnail encoding failed, falling back to WebP/JPEG")
+                    formats = VideoService._disable_thumbnail_format("avif")
+                    VideoService._run_thumbnail_ffmpeg(video_path, tmp_path, formats, duration, position)
+
+                # 验证缩略图文件是否成功生成
+                if not os.path.exists(tmp_path) or os.path.getsize(tmp_path) == 0:
+                    raise Exception("Generated thumbnail file is empty or does not exist")
+
+                items = []
+                for width in THUMBNAIL_WIDTHS:
+                    for fmt in formats:
+                        path = VideoService.thumbnail_variant_path(tmp_path, width, fmt)
+                        if os.path.exists(path):
+                            with open(path, 'rb') as f:
+                                items.append((VideoService.thumbnail_variant_path(thumbnail_key, width, fmt), f.read()))
+                thumbnail_store.put_many(items)
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+            # 返回相对路径（即打包存储中的键）
+            return thumbnail_key
         except Exception as e:
             print(f"Error generating thumbnail for {video_path}: {str(e)}")
             return ""
 
+    @staticmethod
+    def thumbnail_hash(data: bytes) -> str:
+        """缩略图内容哈希，用作缩略图URL的版本号和ETag"""
+        import hashlib
+        return hashlib.blake2b(data, digest_size=8).hexdigest()
+
     @staticmethod
     def get_thumbnail(db: Session, video_id: int) -> str:
         """获取视频缩略图路径"""
@@ -366,20 +491,14 @@ class VideoService:
             if not video:
                 raise HTTPException(status_code=404, detail="Video not found")
 
-            # 使用项目根目录下的thumbnails目录，而不是视频文件所在目录
-            project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+            project_root = thumbnail_store.PROJECT_ROOT
             thumbnails_dir = os.path.join(project_root, 'thumbnails')
-            os.makedirs(thumbnails_dir, exist_ok=True)
 
-            # 如果已有缩略图，先删除旧文件
+            # 如果已有缩略图，先删除旧缩略图及其各档位，上传的缩略图只有默认宽度的 JPEG
             if video.thumbnail_path:
                 old_thumbnail_abs_path = os.path.join(project_root, video.thumbnail_path)
-                if os.path.exists(old_thumbnail_abs_path):
-                    try:
-                        os.remove(old_thumbnail_abs_path)
-                        print(f"Deleted old thumbnail: {old_thumbnail_abs_path}")
-                    except Exception as e:
-                        print(f"Failed to delete old thumbnail {old_thumbnail_abs_path}: {str(e)}")
+                VideoService.remove_thumbnail_files(old_thumbnail_abs_path)
+                print(f"Deleted old thumbnail: {old_thumbnail_abs_path}")
 
             # 生成缩略图文件名，使用视频文件的完整路径hash来避免重名
             import hashlib
@@ -388,15 +507,16 @@ class VideoService:
             thumbnail_filename = f"{video_name}_{path_hash}_thumb.jpg"
             thumbnail_path = os.path.join(thumbnails_dir, thumbnail_filename)
             
-            # 读取并保存文件
+            VideoService.remove_thumbnail_files(thumbnail_path)
+
+            # 读取并写入打包存储
             content = await thumbnail_file.read()
-            with open(thumbnail_path, "wb") as f:
-                f.write(content)
+            thumbnail_store.put(os.path.relpath(thumbnail_path, project_root), content)
             
             # 更新数据库中的缩略图路径（存储相对路径）
-            project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
             video.thumbnail_path = os.path.relpath(thumbnail_path, project_root)
             video.thumbnail_generated = True
+            video.thumbnail_hash = VideoService.thumbnail_hash(content)
             video.updated_at = datetime.now()
             db.commit()
             
@@ -407,70 +527,54 @@ class VideoService:
 
     @staticmethod
     def cleanup_orphaned_thumbnails(db: Session) -> dict:
-        """清理孤立的缩略图文件"""
+        """清理孤立的缩略图
+
+        读取一次打包存储的键（不读取图片数据），与数据库中记录的缩略图文件名做差集，
+        不需要为每个视频重新计算期望的文件名。
+        """
         try:
-            project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-            thumbnails_dir = os.path.join(project_root, 'thumbnails')
-            
-            if not os.path.exists(thumbnails_dir):
-                return {"success": True, "message": "缩略图目录不存在", "cleaned_count": 0, "cleaned_size": 0}
-            
-            # 获取所有缩略图文件
-            thumbnail_files = []
-            for file in os.listdir(thumbnails_dir):
-                if file.endswith('_thumb.jpg'):
-                    thumbnail_files.append(file)
-            
-            if not thumbnail_files:
-                return {"success": True, "message": "没有找到缩略图文件", "cleaned_count": 0, "cleaned_size": 0}
-            
-            # 获取数据库中的所有视频记录
-            videos = db.query(Video).all()
-            
-            # 生成所有期望的缩略图文件名
-            expected_thumbnails = set()
-            db_thumbnail_paths = set()
-            
-            for video in videos:
-                # 根据视频信息生成期望的缩略图文件名
-                import hashlib
-                path_hash = hashlib.md5(video.filepath.encode()).hexdigest()[:8]
-                video_name = os.path.splitext(video.filename)[0]
-                expected_name = f"{video_name}_{path_hash}_thumb.jpg"
-                expected_thumbnails.add(expected_name)
-                
-                # 如果数据库中有缩略图路径，也加入到期望列表中
-                if video.thumbnail_path:
-                    db_thumbnail_name = os.path.basename(video.thumbnail_path)
-                    db_thumbnail_paths.add(db_thumbnail_name)
-            
-            # 合并期望的缩略图文件名
-            all_expected = expected_thumbnails.union(db_thumbnail_paths)
-            
-            # 找出并删除孤立的缩略图文件
-            cleaned_count = 0
-            cleaned_size = 0
-            
-            for thumbnail_file in thumbnail_files:
-                if thumbnail_file not in all_expected:
-                    file_path = os.path.join(thumbnails_dir, thumbnail_file)
-                    if os.path.exists(file_path):
-                        try:
-                            file_size = os.path.getsize(file_path)
-                            os.remove(file_path)
-                            cleaned_count += 1
-                            cleaned_size += file_size
-                            print(f"Deleted orphaned thumbnail: {thumbnail_file}")
-                        except Exception as e:
-                            print(f"Failed to delete orphaned thumbnail {thumbnail_file}: {str(e)}")
-            
+            thumbnail_sizes = {
+                key: size for key, size in thumbnail_store.sizes().items()
+                if THUMBNAIL_FILE_PATTERN.match(os.path.basename(key))
+            }
+
+            # 数据库中仍被引用的缩略图文件名
+            referenced = {
+                os.path.basename(thumbnail_path)
+                for (thumbnail_path,) in db.query(Video.thumbnail_path).filter(Video.thumbnail_path.isnot(None))
+            }
+
+            # 其他档位和格式随主文件一起保留
+            orphaned = [
+                key for key in thumbnail_sizes
+                if THUMBNAIL_FILE_PATTERN.match(os.path.basename(key)).group(1) + '.jpg' not in referenced
+            ]
+            cleaned_count = thumbnail_store.delete(orphaned)
+            cleaned_size = sum(thumbnail_sizes[key] for key in orphaned)
+            if cleaned_count:
+                print(f"Deleted {cleaned_count} orphaned thumbnails")
+                # 回收删除留下的空闲页
+                thumbnail_store.compact()
+
+            # 已删除视频的预览图目录
+            from .storyboard_service import StoryboardService
+            storyboard_count = StoryboardService.cleanup_orphaned(db)
+            if storyboard_count:
+                print(f"Deleted {storyboard_count} orphaned storyboards")
+
+            # 已删除视频的 HLS 片段目录
+            from .hls_service import HlsService
+            hls_count = HlsService.cleanup_orphaned(db)
+            if hls_count:
+                print(f"Deleted {hls_count} orphaned HLS segment directories")
+
             return {
                 "success": True,
-                "message": f"清理完成，删除了 {cleaned_count} 个孤立的缩略图文件",
+                "message": f"清理完成，删除了 {cleaned_count} 个孤立的缩略图",
                 "cleaned_count": cleaned_count,
                 "cleaned_size": cleaned_size
             }
-            
+
         except Exception as e:
             return {
                 "success": False,
@@ -485,8 +589,7 @@ class VideoService:
         if not video:
             return False
         try:
-            root_dir_setting = db.query(Setting).filter(Setting.key == "root_directory").first()
-            root_dir = os.path.abspath(root_dir_setting.value) if root_dir_setting else None
+            root_dir = LibraryService.get_root_path(db, video.root_id)
             video_filepath = VideoService._get_abs_path(root_dir, video.filepath)
             ok, msg = VideoService._safe_remove(video_filepath)
             if not ok:
@@ -497,10 +600,7 @@ class VideoService:
                 # 构建缩略图的绝对路径
                 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
                 thumbnail_abs_path = os.path.join(project_root, thumbnail_path)
-                ok, msg = VideoService._safe_remove(thumbnail_abs_path)
-                if not ok:
-                    print(msg)
-                    return False
+                VideoService.remove_thumbnail_files(thumbnail_abs_path)
             db.delete(video)
             db.commit()
             return True
@@ -515,8 +615,10 @@ class VideoService:
                     tags: List[int] = None,
                     duration: str = None,
                     sort_by: str = 'filename',
-                    seed: int = None) -> tuple[List[Video], int]:
-        """按条件过滤视频列表，支持关键字搜索、收藏状态和标签ID过滤"""
+                    seed: int = None,
+                    resolution: str = None,
+                    video_codec: str = None) -> tuple[List[Video], int]:
+        """按条件过滤视频列表，支持关键字搜索、收藏状态、标签ID、分辨率和视频编码过滤"""
         query = db.query(Video).distinct()
         
         # 添加关键字过滤
@@ -544,6 +646,18 @@ class VideoService:
             elif duration == "long":
                 query = query.filter(Video.duration > short_duration * 60)
 
+        # 添加分辨率过滤（height 列带索引）
+        if resolution in RESOLUTION_RANGES:
+            low, high = RESOLUTION_RANGES[resolution]
+            if low is not None:
+                query = query.filter(Video.height >= low)
+            if high is not None:
+                query = query.filter(Video.height < high)
+
+        # 添加视频编码过滤（video_codec 列带索引）
+        if video_codec:
+            query = query.filter(Video.video_codec == video_codec)
+
         # 排序
         if sort_by:
             if sort_by == 'filename':
@@ -0,0 +1,338 @@
+import os
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+from ..core.database import SessionLocal
+from ..models.video import Video
+from .library_service import LibraryService
+from .scan_service import ScanService, VIDEO_EXTENSIONS
+from .video_service import VideoService
+
+
+class LibraryEventHandler(FileSystemEventHandler):
+    """收集文件系统事件，去抖后按路径合并为增删改操作写入数据库
+
+    - 创建/修改 -> upsert：指纹变化时重新探测并写库
+    - 删除 -> delete：删除对应记录
+    - 移动 -> move：只改写路径，保留标签、收藏和播放进度
+
+    操作按发生顺序回放：相邻的文件事件按路径合并在同一个字典中，目录的移动/删除把前后的文件操作分开。
+    回放 upsert 和 move 时会读取目标文件，而文件可能已随之后的目录操作移走或删除，
+    因此记录目录操作时会把此前的文件操作改写为目录操作之后的路径。
+    """
+
+    def __init__(self, root_id: int, root_path: str, debounce: float = 2.0, max_delay: float = 10.0):
+        self.root_id = root_id
+        self.root_path = root_path
+        self.debounce = debounce  # 无新事件多久后执行
+        self.max_delay = max_delay  # 持续有事件时的最长等待时间
+        self.lock = threading.Lock()
+        # 按发生顺序排列的操作：文件操作合并为 {相对路径: ("upsert",) / ("delete",) / ("move", 原路径)}，
+        # 目录操作为 ("move", 原路径, 新路径) / ("delete", 路径, None)
+        self.ops = []
+        self.first_event_at = None
+        self.last_event_at = None
+        self.stopped = threading.Event()
+        self.flusher = threading.Thread(target=self._flush_loop, name=f"library-watcher-{root_id}", daemon=True)
+        self.flusher.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.flusher.join()
+
+    def _rel(self, path: str) -> str:
+        return os.path.relpath(os.path.abspath(path), self.root_path)
+
+    @staticmethod
+    def _is_video(path: str) -> bool:
+        return path.lower().endswith(VIDEO_EXTENSIONS)
+
+    def _file_ops(self) -> dict:
+        """当前可以合并文件事件的字典，上一个操作是目录操作时新开一个"""
+        if not self.ops or not isinstance(self.ops[-1], dict):
+            self.ops.append({})
+        return self.ops[-1]
+
+    def _add_dir_op(self, op: str, src_rel: str, dest_rel: Optional[str]):
+        """记录目录操作，并把此前记录的、目录下文件的 upsert 和 move 改写为目录操作之后的路径
+
+        - 目录移动：目标路径改为新目录下的路径，回放时仍能读到文件；
+          move 的原路径是回放到该操作时数据库中的路径，不需要改写
+        - 目录删除：文件已不存在，丢弃 upsert；已有记录由目录删除一并清除
+        """
+        prefix = src_rel + os.sep
+        for i, item in enumerate(self.ops):
+            if not isinstance(item, dict):
+                continue
+            resolved = {}
+            for rel_path, file_op in item.items():
+                if rel_path.startswith(prefix) and file_op[0] != "delete":
+                    if op == "move":
+                        rel_path = dest_rel + os.sep + rel_path[len(prefix):]
+                    elif file_op[0] == "upsert":
+                        continue
+                resolved[rel_path] = file_op
+            self.ops[i] = resolved
+        self.ops.append((op, src_rel, dest_rel))
+
+    def _touch(self):
+        now = time.monotonic()
+        if self.first_event_at is None:
+            self.first_event_at = now
+        self.last_event_at = now
+
+    def on_created(self, event):
+        self.on_modified(event)
+
+    def on_modified(self, event):
+        if event.is_directory or not self._is_video(event.src_path):
+            return
+        rel_path = self._rel(event.src_path)
+        with self.lock:
+            pending = self._file_ops()
+            # 移动后又被修改时仍按移动处理，写库时会一并刷新文件信息
+            if pending.get(rel_path, ("",))[0] != "move":
+                pending[rel_path] = ("upsert",)
+            self._touch()
+
+    def on_deleted(self, event):
+        rel_path = self._rel(event.src_path)
+        with self.lock:
+            if event.is_directory:
+                self._add_dir_op("delete", rel_path, None)
+            elif self._is_video(event.src_path):
+                self._file_ops()[rel_path] = ("delete",)
+            else:
+                return
+            self._touch()
+
+    def on_moved(self, event):
+        src_rel = self._rel(event.src_path)
+        dest_rel = self._rel(event.dest_path)
+        with self.lock:
+            if event.is_directory:
+                self._add_dir_op("move", src_rel, dest_rel)
+                self._touch()
+                return
+            src_is_video = self._is_video(event.src_path)
+            dest_is_video = self._is_video(event.dest_path)
+            if not src_is_video and not dest_is_video:
+                return
+            pending = self._file_ops()
+            previous = pending.pop(src_rel, None) if src_is_video else None
+            if not dest_is_video:
+                # 扩展名改成了非视频文件，等同删除
+                pending[src_rel] = ("delete",)
+            elif not src_is_video or (previous and previous[0] == "upsert"):
+                # 从非视频改名而来，或者尚未入库的新文件被移动
+                pending[dest_rel] = ("upsert",)
+            elif previous and previous[0] == "move":
+                # 连续移动，合并为从最初路径移动
+                pending[dest_rel] = previous
+            else:
+                pending[dest_rel] = ("move", src_rel)
+            self._touch()
+
+    def _flush_loop(self):
+        while not self.stopped.wait(0.5):
+            with self.lock:
+                if self.last_event_at is None:
+                    continue
+                now = time.monotonic()
+                if now - self.last_event_at < self.debounce and now - self.first_event_at < self.max_delay:
+                    continue
+                ops, self.ops = self.ops, []
+                self.first_event_at = self.last_event_at = None
+            try:
+                self._apply(ops)
+            except Exception as e:
+                print(f"Error applying file changes: {str(e)}")
+
+    def _apply(self, ops: list):
+        db = SessionLocal()
+        try:
+            for item in ops:
+                if not isinstance(item, dict):
+                    op, src_rel, dest_rel = item
+                    if op == "move":
+                        WatcherService.move_directory(db, self.root_id, src_rel, dest_rel)
+                    else:
+                        WatcherService.delete_directory(db, self.root_id, src_rel)
+                    # 目录移动是批量 UPDATE，已加载的记录需要重新读取，之后的文件操作才能看到改写后的路径
+                    db.flush()
+                    db.expire_all()
+                    continue
+                for rel_path, op in item.items():
+                    if op[0] == "move":
+                        WatcherService.move_file(db, self.root_id, self.root_path, op[1], rel_path)
+                    elif op[0] == "delete":
+                        WatcherService.delete_file(db, self.root_id, rel_path)
+                    else:
+                        WatcherService.upsert_file(db, self.root_id, self.root_path, rel_path)
+                db.flush()
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+_observer: Optional[Observer] = None
+_handlers: List[LibraryEventHandler] = []
+_watch_lock = threading.Lock()
+
+
+class WatcherService:
+    @staticmethod
+    def start():
+        """监控所有根目录，实时同步视频文件变化；每个根目录一个事件处理器，共用一个 Observer"""
+        global _observer
+        with _watch_lock:
+            if _observer is not None:
+                return
+            db = SessionLocal()
+            try:
+                root_paths = LibraryService.get_root_paths(db)
+            finally:
+                db.close()
+            root_paths = {root_id: path for root_id, path in root_paths.items() if os.path.isdir(path)}
+            if not root_paths:
+                print("Root directory not set or not found, file watcher not started")
+                return
+            _observer = Observer()
+            for root_id, root_path in root_paths.items():
+                handler = LibraryEventHandler(root_id, root_path)
+                _handlers.append(handler)
+                _observer.schedule(handler, root_path, recursive=True)
+                print(f"Watching {root_path} for changes")
+            _observer.daemon = True
+            _observer.start()
+
+    @staticmethod
+    def stop():
+        global _observer, _handlers
+        with _watch_lock:
+            if _observer is None:
+                return
+            _observer.stop()
+            _observer.join()
+            for handler in _handlers:
+                handler.stop()
+            _observer = None
+            _handlers = []
+
+    @staticmethod
+    def restart():
+        """根目录变更后重新监控"""
+        WatcherService.stop()
+        WatcherService.start()
+
+    @staticmethod
+    def _get_by_path(db: Session, root_id: int, rel_path: str) -> Optional[Video]:
+        return db.query(Video).filter(Video.root_id == root_id, Video.filepath == rel_path).first()
+
+    @staticmethod
+    def _delete_video(db: Session, video: Video):
+        if video.thumbnail_path:
+            project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+            VideoService.remove_thumbnail_files(os.path.join(project_root, video.thumbnail_path))
+        db.delete(video)
+
+    @staticmethod
+    def upsert_file(db: Session, root_id: int, root_path: str, rel_path: str):
+        """新增或更新单个文件，指纹未变化时跳过"""
+        filepath = os.path.join(root_path, rel_path)
+        video = WatcherService._get_by_path(db, root_id, rel_path)
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            # 文件已不存在（例如临时文件）
+            if video:
+                WatcherService._delete_video(db, video)
+            return
+        record = None
+        if video:
+            record = (video.id, video.file_size, video.file_mtime, video.file_inode, video.updated_at)
+        fingerprint = ScanService.file_fingerprint(st)
+        if ScanService.classify_file(record, fingerprint, incremental=True) in ("unchanged", "backfill"):
+            return
+        # 文件仍在复制时可能探测失败，复制完成后的修改事件会再次触发
+        media = VideoService.probe_media(filepath, timeout=30)
+        if media is None:
+            return
+        file_size, file_mtime, file_inode = fingerprint
+        if video is None:
+            video = Video(root_id=root_id, filename=os.path.basename(rel_path), filepath=rel_path,
+                          thumbnail_generated=False)
+            db.add(video)
+        video.size = round(file_size / (1024 * 1024), 2)
+        for column, value in media.items():
+            setattr(video, column, value)
+        video.file_size = file_size
+        video.file_mtime = file_mtime
+        video.file_inode = file_inode
+        video.content_hash = ScanService.content_fingerprint(filepath, file_size)
+        video.updated_at = datetime.now()
+        print(f"Synced video file: {rel_path}")
+
+    @staticmethod
+    def delete_file(db: Session, root_id: int, rel_path: str):
+        video = WatcherService._get_by_path(db, root_id, rel_path)
+        if video:
+            WatcherService._delete_video(db, video)
+            print(f"Removed video record: {rel_path}")
+
+    @staticmethod
+    def move_file(db: Session, root_id: int, root_path: str, src_rel: str, dest_rel: str):
+        """改写移动文件的路径，保留标签、收藏和播放进度"""
+        video = WatcherService._get_by_path(db, root_id, src_rel)
+        if video is None:
+            WatcherService.upsert_file(db, root_id, root_path, dest_rel)
+            return
+        # 目标路径已有记录说明旧文件被覆盖
+        overwritten = WatcherService._get_by_path(db, root_id, dest_rel)
+        if overwritten:
+            WatcherService._delete_video(db, overwritten)
+            db.flush()
+        video.filepath = dest_rel
+        video.filename = os.path.basename(dest_rel)
+        try:
+            st = os.stat(os.path.join(root_path, dest_rel))
+            video.file_size, video.file_mtime, video.file_inode = ScanService.file_fingerprint(st)
+        except OSError:
+            pass
+        print(f"Moved video record: {src_rel} -> {dest_rel}")
+
+    @staticmethod
+    def _prefix_filter(prefix: str):
+        # 用substr比较前缀，避免路径中的 % 和 _ 被LIKE当作通配符
+        return func.substr(Video.filepath, 1, len(prefix)) == prefix
+
+    @staticmethod
+    def move_directory(db: Session, root_id: int, src_rel: str, dest_rel: str):
+        """目录移动时批量改写目录下所有记录的路径"""
+        src_prefix = src_rel + os.sep
+        dest_prefix = dest_rel + os.sep
+        moved = db.query(Video).filter(
+            Video.root_id == root_id, WatcherService._prefix_filter(src_prefix)
+        ).update({
+            Video.filepath: dest_prefix + func.substr(Video.filepath, len(src_prefix) + 1)
+        }, synchronize_session=False)
+        if moved:
+            print(f"Moved {moved} video records: {src_rel} -> {dest_rel}")
+
+    @staticmethod
+    def delete_directory(db: Session, root_id: int, rel_path: str):
+        videos = db.query(Video).filter(
+            Video.root_id == root_id, WatcherService._prefix_filter(rel_path + os.sep)
+        ).all()
+        for video in videos:
+            WatcherService._delete_video(db, video)
+        if videos:
+            print(f"Removed {len(videos)} video records under {rel_path}")
@@ -0,0 +1,120 @@
+"""对比缩略图取帧的耗时和黑帧率
+
+- 原实现：固定取第 1 秒的帧，从前一个关键帧开始完整解码到该位置
+- 关键帧模式：跳到时长的指定比例之后的第一个关键帧，只解码关键帧，
+  同一个 ffmpeg 进程中依次检查备选位置，跳过黑帧
+
+两种方式都只编码一张 JPEG，只比较取帧本身。按视频编码分组输出平均耗时和黑帧数（按生成的缩略图判断）。
+
+用法（在 backend 目录下执行，需要 ffmpeg）：
+    python benchmarks/bench_thumbnail_extract.py
+    python benchmarks/bench_thumbnail_extract.py --position 10 --videos D:\\videos\\a.mp4 D:\\videos\\b.mkv
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ffmpeg  # noqa: E402
+from app.services.video_service import VideoService, THUMBNAIL_BLACK_AMOUNT, THUMBNAIL_BLACK_LEVEL  # noqa: E402
+
+# 合成视频使用的编码器，ffmpeg 不支持的会被跳过
+SAMPLE_ENCODERS = {
+    "h264": ["-c:v", "libx264", "-preset", "veryfast"],
+    "hevc": ["-c:v", "libx265", "-preset", "veryfast", "-x265-params", "log-level=error"],
+    "vp9": ["-c:v", "libvpx-vp9", "-deadline", "realtime", "-cpu-used", "8"],
+}
+
+
+def available_encoders() -> set:
+    result = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    return {line.split()[1] for line in result.stdout.decode(errors="ignore").splitlines() if len(line.split()) > 1}
+
+
+def make_sample(path: str, codec_args: list, size: str = "1920x1080", duration: int = 30):
+    """生成片头 3 秒为黑场、关键帧间隔 10 秒的合成视频"""
+    subprocess.run([
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=25", "-t", str(duration),
+        "-vf", "fade=t=in:st=3:d=0.5", "-g", "250", "-pix_fmt", "yuv420p", *codec_args, path
+    ], check=True)
+
+
+def is_black(image_path: str) -> bool:
+    """按缩略图取帧时的同一标准判断生成的缩略图是否为黑帧"""
+    stream = ffmpeg.input(image_path).video.filter(
+        'blackframe', amount=THUMBNAIL_BLACK_AMOUNT, threshold=THUMBNAIL_BLACK_LEVEL
+    )
+    _, err = ffmpeg.run(ffmpeg.output(stream, '-', format='null'), capture_stdout=True, capture_stderr=True)
+    return b"pblack:" in err
+
+
+def main():
+    parser = argparse.ArgumentParser(description="缩略图取帧耗时对比")
+    parser.add_argument("--videos", nargs="*", help="用于测量的视频文件，不指定时按编码生成合成视频")
+    parser.add_argument("--position", type=int, default=10, help="关键帧模式的取帧位置（时长的百分比）")
+    parser.add_argument("--repeat", type=int, default=3, help="每个视频重复测量的次数")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_extract_")
+    try:
+        videos = args.videos
+        if not videos:
+            encoders = available_encoders()
+            videos = []
+            for codec, codec_args in SAMPLE_ENCODERS.items():
+                if codec_args[1] not in encoders:
+                    print(f"跳过 {codec}：ffmpeg 不支持 {codec_args[1]}")
+                    continue
+                path = os.path.join(workdir, f"sample_{codec}.mkv")
+                make_sample(path, codec_args)
+                videos.append(path)
+
+        stats = defaultdict(lambda: {"count": 0, "legacy": 0.0, "keyframe": 0.0, "legacy_black": 0, "keyframe_black": 0})
+        legacy_output = os.path.join(workdir, "legacy.jpg")
+        keyframe_output = os.path.join(workdir, "keyframe.jpg")
+        for video in videos:
+            info = VideoService.probe_media(video)
+            if not info:
+                print(f"跳过 {video}：无法获取时长")
+                continue
+            entry = stats[info["video_codec"] or "unknown"]
+            entry["count"] += 1
+
+            legacy_time = keyframe_time = 0.0
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                VideoService._run_thumbnail_ffmpeg(video, legacy_output, ("jpg",))
+                legacy_time += time.perf_counter() - start
+
+                start = time.perf_counter()
+                VideoService._run_thumbnail_ffmpeg(video, keyframe_output, ("jpg",), info["duration"],
+                                                   args.position / 100)
+                keyframe_time += time.perf_counter() - start
+            entry["legacy"] += legacy_time / args.repeat
+            entry["keyframe"] += keyframe_time / args.repeat
+
+            if is_black(legacy_output):
+                entry["legacy_black"] += 1
+            if is_black(keyframe_output):
+                entry["keyframe_black"] += 1
+
+        print(f"\n{'codec':<10}{'videos':>8}{'legacy ms':>12}{'keyframe ms':>14}{'speedup':>10}{'black (legacy/keyframe)':>26}")
+        for codec, entry in sorted(stats.items()):
+            count = entry["count"]
+            legacy_ms = entry["legacy"] / count * 1000
+            keyframe_ms = entry["keyframe"] / count * 1000
+            print(f"{codec:<10}{count:>8}{legacy_ms:>12.0f}{keyframe_ms:>14.0f}{legacy_ms / keyframe_ms:>9.2f}x"
+                  f"{entry['legacy_black']:>20}/{entry['keyframe_black']}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
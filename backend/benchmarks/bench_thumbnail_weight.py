@@ -0,0 +1,95 @@
+"""对比缩略图的体积（页面重量）
+
+对给定视频（或用 ffmpeg 生成的合成视频）分别生成：
+- 原实现：320px 宽的 JPEG（ffmpeg 默认质量）
+- 当前实现：VideoService 一次调用生成的各宽度档位 × 各格式
+
+按 50 张卡片的列表页换算页面重量并输出对比。
+
+用法（在 backend 目录下执行，需要 ffmpeg）：
+    python benchmarks/bench_thumbnail_weight.py
+    python benchmarks/bench_thumbnail_weight.py --videos D:\\videos\\a.mp4 D:\\videos\\b.mkv
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ffmpeg  # noqa: E402
+from app.services.video_service import VideoService, THUMBNAIL_WIDTHS  # noqa: E402
+
+CARDS_PER_PAGE = 50
+
+
+def make_sample(path: str, size: str = "1920x1080"):
+    """生成带运动画面的合成视频"""
+    subprocess.run([
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30", "-t", "3",
+        "-pix_fmt", "yuv420p", path
+    ], check=True)
+
+
+def legacy_thumbnail(video_path: str, output: str):
+    """原实现：单个 320px JPEG"""
+    stream = ffmpeg.input(video_path, ss='00:00:01')
+    stream = ffmpeg.filter(stream, 'scale', 320, -1)
+    stream = ffmpeg.output(stream, output, vframes=1)
+    ffmpeg.run(stream, overwrite_output=True, capture_stdout=True, capture_stderr=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="缩略图体积对比")
+    parser.add_argument("--videos", nargs="*", help="用于测量的视频文件，不指定时生成合成视频")
+    args = parser.parse_args()
+
+    formats = VideoService.thumbnail_formats()
+    print(f"ffmpeg 支持的缩略图格式: {', '.join(formats)}")
+
+    workdir = tempfile.mkdtemp(prefix="bench_thumb_")
+    try:
+        videos = args.videos
+        if not videos:
+            videos = [os.path.join(workdir, "sample.mp4")]
+            make_sample(videos[0])
+
+        legacy_total = 0
+        totals = {}
+        legacy_time = current_time = 0.0
+        for i, video in enumerate(videos):
+            legacy_path = os.path.join(workdir, f"legacy_{i}.jpg")
+            start = time.perf_counter()
+            legacy_thumbnail(video, legacy_path)
+            legacy_time += time.perf_counter() - start
+            legacy_total += os.path.getsize(legacy_path)
+
+            thumbnail_path = os.path.join(workdir, f"v{i}_thumb.jpg")
+            start = time.perf_counter()
+            VideoService._run_thumbnail_ffmpeg(video, thumbnail_path, formats)
+            current_time += time.perf_counter() - start
+            for width in THUMBNAIL_WIDTHS:
+                for fmt in formats:
+                    path = VideoService.thumbnail_variant_path(thumbnail_path, width, fmt)
+                    totals[(width, fmt)] = totals.get((width, fmt), 0) + os.path.getsize(path)
+
+        count = len(videos)
+        legacy_page = legacy_total / count * CARDS_PER_PAGE
+        print(f"\n{count} 个视频，按每页 {CARDS_PER_PAGE} 张卡片换算")
+        print(f"{'variant':<16}{'avg bytes':>12}{'page KiB':>12}{'vs legacy':>12}")
+        print(f"{'legacy 320 jpg':<16}{legacy_total / count:>12.0f}{legacy_page / 1024:>12.1f}{1.0:>11.2f}x")
+        for (width, fmt), total in sorted(totals.items()):
+            page = total / count * CARDS_PER_PAGE
+            print(f"{f'{width} {fmt}':<16}{total / count:>12.0f}{page / 1024:>12.1f}{legacy_page / page:>11.2f}x")
+        print(f"\n生成耗时：原实现 {legacy_time / count * 1000:.0f} ms/个，"
+              f"当前实现（全部档位和格式）{current_time / count * 1000:.0f} ms/个")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
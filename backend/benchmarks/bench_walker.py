@@ -0,0 +1,109 @@
+"""对比扫描时的文件遍历方式
+
+在临时目录中生成合成目录树（默认 100k 个文件），分别测量：
+- os.walk + os.path.getmtime/getsize（原扫描实现）
+- app.core.file_walker.walk_files（os.scandir + 多线程遍历）
+
+用法（在 backend 目录下执行）：
+    python benchmarks/bench_walker.py
+    python benchmarks/bench_walker.py --files 20000 --workers 1 4 16
+    python benchmarks/bench_walker.py --root Z:\\videos   # 直接测量已有目录（如网络共享）
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.file_walker import walk_files  # noqa: E402
+
+EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.wmv', '.3gp', '.ts', '.flv', '.webm', '.m3u8', '.mpeg')
+
+
+def build_tree(root: str, total_files: int, files_per_dir: int = 100, fanout: int = 10):
+    """生成 total_files 个空视频文件，每个目录 files_per_dir 个，目录按 fanout 分层"""
+    for i in range(total_files):
+        dir_index = i // files_per_dir
+        parts = []
+        while True:
+            parts.append(f"d{dir_index % fanout}")
+            dir_index //= fanout
+            if dir_index == 0:
+                break
+        directory = os.path.join(root, *reversed(parts))
+        if i % files_per_dir == 0:
+            os.makedirs(directory, exist_ok=True)
+        ext = EXTENSIONS[i % 3]
+        with open(os.path.join(directory, f"video_{i}{ext}"), "wb"):
+            pass
+
+
+def walk_legacy(root: str) -> int:
+    """原 scan_videos 的遍历方式"""
+    count = 0
+    for dirpath, _, files in os.walk(root):
+        for file in files:
+            if file.lower().endswith(EXTENSIONS):
+                filepath = os.path.abspath(os.path.join(dirpath, file))
+                os.path.relpath(filepath, root)
+                os.path.getmtime(filepath)
+                os.path.getsize(filepath)
+                count += 1
+    return count
+
+
+def walk_fast(root: str, workers: int) -> int:
+    count = 0
+    for entry in walk_files(root, EXTENSIONS, workers=workers):
+        os.path.relpath(entry.path, root)
+        count += 1
+    return count
+
+
+def measure(label: str, func, *args):
+    start = time.perf_counter()
+    count = func(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {count:>8} files  {elapsed:8.3f}s  {count / elapsed if elapsed else 0:>10.0f} files/s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=100000, help="合成目录树的文件数")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16], help="walk_files 的线程数")
+    parser.add_argument("--root", help="测量已有目录，不生成合成目录树")
+    parser.add_argument("--repeat", type=int, default=3, help="每种方式重复次数，取最快一次")
+    args = parser.parse_args()
+
+    temp_root = None
+    root = args.root
+    if not root:
+        temp_root = tempfile.mkdtemp(prefix="bench_walker_")
+        root = temp_root
+        print(f"Building synthetic tree with {args.files} files in {root} ...")
+        build_tree(root, args.files)
+
+    try:
+        results = {}
+        results["os.walk + getmtime/getsize"] = min(
+            measure("os.walk + getmtime/getsize", walk_legacy, root) for _ in range(args.repeat)
+        )
+        for workers in args.workers:
+            label = f"walk_files (workers={workers})"
+            results[label] = min(measure(label, walk_fast, root, workers) for _ in range(args.repeat))
+
+        baseline = results["os.walk + getmtime/getsize"]
+        print("\nBest of each (speedup vs os.walk):")
+        for label, elapsed in results.items():
+            print(f"  {label:<28} {elapsed:8.3f}s  x{baseline / elapsed if elapsed else 0:.2f}")
+    finally:
+        if temp_root:
+            shutil.rmtree(temp_root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
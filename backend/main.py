@@ -5,6 +5,10 @@ from app.api.settings import settingsRouter
 from app.api.videos import videosRouter
 from app.api.tags import tagsRouter
 from app.api.tag_categories import tagCategoriesRouter
+from app.api.library_roots import libraryRootsRouter
+from app.services.watcher_service import WatcherService
+from app.services.scan_job_service import ScanJobService
+from app.services.thumbnail_service import ThumbnailService
 
 app = FastAPI(
     title="Video Manager",
@@ -15,6 +19,35 @@ app.include_router(settingsRouter, prefix="/api/settings", tags=["Settings"])
 app.include_router(videosRouter, prefix="/api/videos", tags=["Videos"])
 app.include_router(tagsRouter, prefix="/api/tags", tags=["Tags"])
 app.include_router(tagCategoriesRouter, prefix="/api/tag-categories", tags=["Tag Categories"])
+app.include_router(libraryRootsRouter, prefix="/api/library-roots", tags=["Library Roots"])
+
+
+@app.on_event("startup")
+def start_file_watcher():
+    # 实时同步各根目录下的视频文件变化
+    WatcherService.start()
+
+
+@app.on_event("startup")
+def resume_scan_jobs():
+    # 续扫上次退出时未完成的扫描任务
+    ScanJobService.resume_interrupted()
+
+
+@app.on_event("startup")
+def start_thumbnail_workers():
+    # 后台生成缩略图，空闲时补全整个视频库
+    ThumbnailService.start()
+
+
+@app.on_event("shutdown")
+def stop_file_watcher():
+    WatcherService.stop()
+
+
+@app.on_event("shutdown")
+def stop_thumbnail_workers():
+    ThumbnailService.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,56 @@
+"""测试公共夹具
+
+app.core.database 导入时会在当前目录创建并迁移 video_manager.db，
+因此先切换到临时目录再导入 app，测试不会改动真实的数据库和缩略图目录。
+每个测试使用各自的临时 SQLite 数据库，通过 dependency_overrides 替换 get_db。
+
+运行（在 backend 目录下）：
+    python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+os.chdir(tempfile.mkdtemp(prefix="video-manager-tests-"))
+
+from fastapi import FastAPI  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from app.api.videos import videosRouter  # noqa: E402
+from app.core.database import get_db  # noqa: E402
+from app.models.setting import Base  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def app(session_factory):
+    """只挂载视频接口的应用，不启动文件监控和缩略图后台任务"""
+    app = FastAPI()
+    app.include_router(videosRouter, prefix="/api/videos")
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    return app
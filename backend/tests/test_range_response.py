@@ -0,0 +1,216 @@
+"""HTTP Range / 条件请求一致性测试（RFC 7232 / RFC 7233）
+
+parse_range 直接测试；serve_file 挂在一个只有单个接口的 Starlette 应用上，
+通过 TestClient 对临时文件发送请求，校验状态码、响应头和内容。
+"""
+from email.utils import formatdate, parsedate_to_datetime
+
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.core.range_response import RangeNotSatisfiable, parse_range, serve_file
+
+SIZE = 10000
+CONTENT = bytes(i * 7 % 256 for i in range(SIZE))
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", [(0, 99)]),
+    ("bytes=9900-", [(9900, 9999)]),
+    ("bytes=-500", [(9500, 9999)]),
+    # 后缀超过文件大小时返回整个文件
+    ("bytes=-20000", [(0, 9999)]),
+    # 结束位置越界时截断到文件末尾
+    ("bytes=9990-11000", [(9990, 9999)]),
+    ("bytes=20-29,0-9", [(0, 9), (20, 29)]),
+    # 重叠的区间合并
+    ("bytes=0-10,5-20", [(0, 20)]),
+    # 相邻的区间合并
+    ("bytes=0-10,11-20", [(0, 20)]),
+    ("bytes=0-9, 20-29, -5", [(0, 9), (20, 29), (9995, 9999)]),
+    # 落在文件外的区间被丢弃，只要还有一个可以满足
+    ("bytes=0-9,20000-20010", [(0, 9)]),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, SIZE) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=abc", "bytes=10-5", "items=0-10", "bytes=", "bytes=5", "bytes=--5"])
+def test_parse_range_ignores_invalid(header):
+    assert parse_range(header, SIZE) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=10000-", "bytes=10010-10020", "bytes=-0"])
+def test_parse_range_not_satisfiable(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, SIZE)
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(CONTENT)
+
+    def stream(request):
+        return serve_file(request, str(path), "video/mp4", {"Cache-Control": "no-cache"})
+
+    app = Starlette(routes=[Route("/stream", stream, methods=["GET", "HEAD"])])
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def validators(client):
+    response = client.head("/stream")
+    return response.headers["etag"], response.headers["last-modified"]
+
+
+def parse_multipart(content_type: str, body: bytes) -> list:
+    """解析 multipart/byteranges，返回 [(Content-Type, Content-Range, 数据)]"""
+    boundary = content_type.split("boundary=", 1)[1].encode()
+    parts = []
+    for chunk in body.split(b"--" + boundary)[1:]:
+        if chunk.startswith(b"--"):
+            break
+        head, _, data = chunk.lstrip(b"\r\n").partition(b"\r\n\r\n")
+        # 分隔符前的 CRLF 不属于数据
+        if data.endswith(b"\r\n"):
+            data = data[:-2]
+        fields = dict(line.split(b": ", 1) for line in head.split(b"\r\n"))
+        parts.append((fields[b"Content-Type"].decode(), fields[b"Content-Range"].decode(), data))
+    return parts
+
+
+def test_head(client):
+    response = client.head("/stream")
+    assert response.status_code == 200
+    assert response.headers["content-length"] == str(SIZE)
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-type"] == "video/mp4"
+    assert response.headers["cache-control"] == "no-cache"
+    assert "etag" in response.headers and "last-modified" in response.headers
+    assert "content-range" not in response.headers
+    assert response.content == b""
+
+
+def test_head_with_range(client):
+    response = client.head("/stream", headers={"Range": "bytes=0-99"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 0-99/{SIZE}"
+    assert response.headers["content-length"] == "100"
+    assert response.content == b""
+
+
+def test_full_file(client):
+    response = client.get("/stream")
+    assert response.status_code == 200
+    assert "content-range" not in response.headers
+    assert response.content == CONTENT
+
+
+@pytest.mark.parametrize("header, start, end", [
+    ("bytes=0-99", 0, 99),
+    ("bytes=9900-", 9900, 9999),
+    ("bytes=-500", 9500, 9999),
+    ("bytes=-20000", 0, 9999),
+    ("bytes=9990-11000", 9990, 9999),
+    ("bytes=0-10,5-20", 0, 20),
+    ("bytes=0-10,11-20", 0, 20),
+])
+def test_single_range(client, header, start, end):
+    response = client.get("/stream", headers={"Range": header})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes {start}-{end}/{SIZE}"
+    assert response.headers["content-length"] == str(end - start + 1)
+    assert response.content == CONTENT[start:end + 1]
+
+
+def test_multiple_ranges(client):
+    response = client.get("/stream", headers={"Range": "bytes=20-29,0-9,-5"})
+    assert response.status_code == 206
+    content_type = response.headers["content-type"]
+    assert content_type.startswith("multipart/byteranges; boundary=")
+    assert "content-range" not in response.headers
+    assert response.headers["content-length"] == str(len(response.content))
+    assert parse_multipart(content_type, response.content) == [
+        ("video/mp4", f"bytes 0-9/{SIZE}", CONTENT[0:10]),
+        ("video/mp4", f"bytes 20-29/{SIZE}", CONTENT[20:30]),
+        ("video/mp4", f"bytes 9995-9999/{SIZE}", CONTENT[-5:]),
+    ]
+    assert response.content.endswith(f"\r\n--{content_type.split('boundary=', 1)[1]}--\r\n".encode())
+
+
+def test_multiple_ranges_head(client):
+    get = client.get("/stream", headers={"Range": "bytes=0-9,20-29"})
+    head = client.head("/stream", headers={"Range": "bytes=0-9,20-29"})
+    assert head.status_code == 206
+    assert head.content == b""
+    # 分隔符是随机的，但长度固定，HEAD 与 GET 的 Content-Length 一致
+    assert head.headers["content-length"] == get.headers["content-length"]
+
+
+@pytest.mark.parametrize("header", ["bytes=10000-", "bytes=10010-10020", "bytes=-0"])
+def test_range_not_satisfiable(client, header):
+    response = client.get("/stream", headers={"Range": header})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{SIZE}"
+
+
+@pytest.mark.parametrize("header", ["bytes=abc", "bytes=10-5", "items=0-10", "bytes="])
+def test_invalid_range_is_ignored(client, header):
+    response = client.get("/stream", headers={"Range": header})
+    assert response.status_code == 200
+    assert "content-range" not in response.headers
+    assert response.content == CONTENT
+
+
+def test_if_range_strong_etag(client, validators):
+    etag, _ = validators
+    response = client.get("/stream", headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert response.status_code == 206
+    assert response.content == CONTENT[:10]
+
+    response = client.get("/stream", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_if_range_weak_etag_never_matches(client, validators):
+    etag, _ = validators
+    response = client.get("/stream", headers={"Range": "bytes=0-9", "If-Range": f"W/{etag}"})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_if_range_date(client, validators):
+    _, last_modified = validators
+    response = client.get("/stream", headers={"Range": "bytes=0-9", "If-Range": last_modified})
+    assert response.status_code == 206
+    assert response.content == CONTENT[:10]
+
+    older = formatdate(parsedate_to_datetime(last_modified).timestamp() - 3600, usegmt=True)
+    response = client.get("/stream", headers={"Range": "bytes=0-9", "If-Range": older})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_if_none_match(client, validators):
+    etag, _ = validators
+    for value in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        response = client.get("/stream", headers={"If-None-Match": value})
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+        assert response.content == b""
+    assert client.get("/stream", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_if_modified_since(client, validators):
+    _, last_modified = validators
+    assert client.get("/stream", headers={"If-Modified-Since": last_modified}).status_code == 304
+    older = formatdate(parsedate_to_datetime(last_modified).timestamp() - 3600, usegmt=True)
+    assert client.get("/stream", headers={"If-Modified-Since": older}).status_code == 200
+    # If-None-Match 存在时忽略 If-Modified-Since
+    response = client.get("/stream", headers={"If-None-Match": '"other"', "If-Modified-Since": last_modified})
+    assert response.status_code == 200
@@ -0,0 +1,90 @@
+"""转封装接口：数据库查询、文件检查和启动 ffmpeg 都不在事件循环线程中进行
+
+用输出固定数据的 Python 进程代替 ffmpeg，记录各个阻塞调用所在的线程。
+"""
+import os
+import subprocess
+import sys
+import threading
+
+import httpx
+import pytest
+
+from app.models.library_root import LibraryRoot
+from app.models.video import Video
+from app.services import remux_service
+from app.services.library_service import LibraryService
+from app.services.remux_service import RemuxService
+
+OUTPUT = b"fragmented mp4" * 1000
+
+
+@pytest.fixture
+def video_id(tmp_path, session_factory):
+    library = tmp_path / "library"
+    library.mkdir()
+    (library / "video.mkv").write_bytes(b"matroska")
+    db = session_factory()
+    try:
+        root = LibraryRoot(name="library", path=str(library))
+        db.add(root)
+        db.flush()
+        video = Video(root_id=root.id, filename="video.mkv", filepath="video.mkv", duration=60,
+                      video_codec="h264", audio_codec="aac")
+        db.add(video)
+        db.commit()
+        return video.id
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def blocking_calls(monkeypatch):
+    """记录 get_video_path、os.path.isfile 和 subprocess.Popen 的调用线程"""
+    calls = []
+    get_video_path = LibraryService.get_video_path
+    isfile = os.path.isfile
+    popen = subprocess.Popen
+
+    def recording_get_video_path(db, video):
+        calls.append(("get_video_path", threading.get_ident()))
+        return get_video_path(db, video)
+
+    def recording_isfile(path):
+        calls.append(("isfile", threading.get_ident()))
+        return isfile(path)
+
+    def recording_popen(args, *rest, **kwargs):
+        calls.append(("popen", threading.get_ident()))
+        return popen(args, *rest, **kwargs)
+
+    monkeypatch.setattr(LibraryService, "get_video_path", staticmethod(recording_get_video_path))
+    monkeypatch.setattr(os.path, "isfile", recording_isfile)
+    monkeypatch.setattr(remux_service.subprocess, "Popen", recording_popen)
+    monkeypatch.setattr(RemuxService, "build_command", staticmethod(
+        lambda video_path, start=0.0, audio_codec=None:
+        [sys.executable, "-c", f"import sys; sys.stdout.buffer.write({OUTPUT!r})"]
+    ))
+    return calls
+
+
+@pytest.mark.anyio
+async def test_remux_blocking_calls_run_off_the_event_loop(app, video_id, blocking_calls):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get(f"/api/videos/{video_id}/remux", params={"start": 10})
+    assert response.status_code == 200
+    assert response.headers["x-content-duration"] == "50.000"
+    assert response.content == OUTPUT
+    assert {name for name, _ in blocking_calls} == {"get_video_path", "isfile", "popen"}
+    loop_thread = threading.get_ident()
+    assert all(thread != loop_thread for _, thread in blocking_calls)
+
+
+@pytest.mark.anyio
+async def test_remux_errors(app, video_id, blocking_calls):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        assert (await client.get(f"/api/videos/{video_id + 1}/remux")).status_code == 404
+        assert (await client.get(f"/api/videos/{video_id}/remux", params={"start": 60})).status_code == 400
+    assert not any(name == "popen" for name, _ in blocking_calls)
@@ -0,0 +1,62 @@
+"""扫描写库：整批写入失败时逐条重试，只跳过出错的记录并计入 failed_files"""
+import pytest
+
+from app.models.library_root import LibraryRoot
+from app.models.scan_job import ScanJob
+from app.models.video import Video
+from app.services.scan_service import ScanPipeline, ScanService, ScanState
+
+
+def probe_result(rel_path: str) -> tuple:
+    return ("probe", rel_path, (1024, 1700000000.0, 1), None, {"duration": 60.0}, f"hash-{rel_path}")
+
+
+@pytest.fixture
+def pipeline(tmp_path, session_factory):
+    db = session_factory()
+    try:
+        root = LibraryRoot(name="library", path=str(tmp_path))
+        job = ScanJob(state="running", phase="probing", incremental=True)
+        db.add_all([root, job])
+        db.commit()
+        root_id, job_id = root.id, job.id
+    finally:
+        db.close()
+    return ScanPipeline(root_id, str(tmp_path), {}, ScanState(job_id))
+
+
+@pytest.fixture
+def failing_write(monkeypatch):
+    """写入包含 bad.mp4 的批次时抛出异常"""
+    write_batch = ScanService.write_batch
+
+    def fail_on_bad_row(db, rows, backfills, moves=()):
+        if any(row["filepath"] == "bad.mp4" for row in rows):
+            raise ValueError("cannot write bad.mp4")
+        write_batch(db, rows, backfills, moves)
+
+    monkeypatch.setattr(ScanService, "write_batch", staticmethod(fail_on_bad_row))
+
+
+def test_flush_writes_batch(pipeline, session_factory):
+    db = session_factory()
+    try:
+        pipeline._flush(db, [probe_result("a.mp4"), probe_result("b.mp4")])
+        assert sorted(filepath for filepath, in db.query(Video.filepath)) == ["a.mp4", "b.mp4"]
+        job = db.query(ScanJob).one()
+        assert (job.processed_files, job.added, job.failed_files) == (2, 2, 0)
+    finally:
+        db.close()
+
+
+def test_failed_batch_is_retried_row_by_row(pipeline, session_factory, failing_write):
+    db = session_factory()
+    try:
+        pipeline._flush(db, [probe_result("a.mp4"), probe_result("bad.mp4"), probe_result("c.mp4")])
+        assert sorted(filepath for filepath, in db.query(Video.filepath)) == ["a.mp4", "c.mp4"]
+        counters = pipeline.state.snapshot()
+        assert (counters["processed_files"], counters["added"], counters["failed_files"]) == (3, 2, 1)
+        job = db.query(ScanJob).one()
+        assert (job.processed_files, job.added, job.failed_files) == (3, 2, 1)
+    finally:
+        db.close()
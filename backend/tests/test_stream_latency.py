@@ -0,0 +1,130 @@
+"""磁盘很慢时，视频流不能阻塞事件循环上的其他请求
+
+把 range_response 中的 stat、打开和读取文件替换为带固定延迟的版本，模拟冷读取的机械硬盘；
+10 个客户端持续按区间请求 /stream，同时依次请求 /api/videos/list，列表接口的 p95 延迟应保持在固定上限以内。
+只要有一步磁盘访问在事件循环中进行（例如 stream_video 定义为 async def 时的 os.stat），
+每次访问都会让所有请求一起等待，p95 会远超上限。
+"""
+import asyncio
+import os
+import time
+
+import httpx
+import pytest
+
+from app.core import range_response
+from app.models.library_root import LibraryRoot
+from app.models.video import Video
+
+# 每次 stat、打开和读取文件的延迟（秒）
+DISK_LATENCY = 0.05
+STREAMS = 10
+SAMPLES = 30
+FILE_SIZE = 4 * 1024 * 1024
+# 每个客户端每次请求的区间大小，与播放器边播放边请求后续区间的方式一致
+RANGE_SIZE = 128 * 1024
+CHUNK_SIZE = 64 * 1024
+# 列表接口 p95 延迟的上限（秒）
+MAX_P95 = 0.2
+
+
+class SlowFile:
+    """每次读取前等待 DISK_LATENCY 的文件"""
+
+    def __init__(self, file):
+        self._file = file
+
+    def read(self, size=-1):
+        time.sleep(DISK_LATENCY)
+        return self._file.read(size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._file.close()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+@pytest.fixture
+def video_id(tmp_path, session_factory):
+    library = tmp_path / "library"
+    library.mkdir()
+    (library / "video.mp4").write_bytes(bytes(range(256)) * (FILE_SIZE // 256))
+    db = session_factory()
+    try:
+        root = LibraryRoot(name="library", path=str(library))
+        db.add(root)
+        db.flush()
+        video = Video(root_id=root.id, filename="video.mp4", filepath="video.mp4", size=4, duration=60)
+        db.add(video)
+        db.add_all(
+            Video(root_id=root.id, filename=f"other{i}.mp4", filepath=f"other{i}.mp4", size=1, duration=60)
+            for i in range(20)
+        )
+        db.commit()
+        return video.id
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def slow_disk(tmp_path, monkeypatch):
+    """视频库目录下文件的 stat、打开和读取都等待 DISK_LATENCY"""
+    library = str(tmp_path / "library")
+    real_stat = os.stat
+
+    def slow_stat(path, *args, **kwargs):
+        if isinstance(path, (str, os.PathLike)) and os.fspath(path).startswith(library):
+            time.sleep(DISK_LATENCY)
+        return real_stat(path, *args, **kwargs)
+
+    def slow_open(path, *args, **kwargs):
+        time.sleep(DISK_LATENCY)
+        return SlowFile(open(path, *args, **kwargs))
+
+    monkeypatch.setattr(os, "stat", slow_stat)
+    monkeypatch.setattr(range_response, "open", slow_open, raising=False)
+    monkeypatch.setattr(range_response, "CHUNK_SIZE", CHUNK_SIZE)
+
+
+def p95(latencies: list) -> float:
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+@pytest.mark.anyio
+async def test_list_latency_while_streaming_from_slow_disk(app, video_id, slow_disk):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        stop = asyncio.Event()
+
+        async def stream(offset: int):
+            while not stop.is_set():
+                start = offset % FILE_SIZE
+                response = await client.get(
+                    f"/api/videos/{video_id}/stream",
+                    headers={"Range": f"bytes={start}-{start + RANGE_SIZE - 1}"},
+                )
+                assert response.status_code == 206
+                assert len(response.content) == RANGE_SIZE
+                offset += RANGE_SIZE
+
+        streams = [asyncio.ensure_future(stream(i * RANGE_SIZE)) for i in range(STREAMS)]
+        latencies = []
+        try:
+            # 等所有视频流都开始读取
+            await asyncio.sleep(DISK_LATENCY * 5)
+            for _ in range(SAMPLES):
+                started = time.perf_counter()
+                response = await client.get("/api/videos/list", params={"page": 1, "page_size": 20})
+                latencies.append(time.perf_counter() - started)
+                assert response.status_code == 200
+                await asyncio.sleep(0.01)
+        finally:
+            stop.set()
+            await asyncio.gather(*streams)
+
+    assert p95(latencies) < MAX_P95, f"p95 {p95(latencies) * 1000:.0f} ms, max {max(latencies) * 1000:.0f} ms"
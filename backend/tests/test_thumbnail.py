@@ -0,0 +1,68 @@
+"""关键帧模式的缩略图：在同一个 ffmpeg 进程中跳过黑帧
+
+合成片头 12 秒为黑场、关键帧间隔 10 秒的视频，设置的位置和第一个备选位置都落在黑场的关键帧上，
+缩略图应取自后面的第一个不是黑帧的关键帧，且整个过程只启动一次 ffmpeg。需要 ffmpeg，找不到时跳过。
+"""
+import shutil
+import subprocess
+
+import ffmpeg
+import pytest
+
+from app.services.video_service import THUMBNAIL_BLACK_AMOUNT, THUMBNAIL_BLACK_LEVEL, VideoService
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="需要 ffmpeg")
+
+DURATION = 30
+
+
+def make_video(path: str, black: int):
+    """前 black 秒为黑场的测试视频，每 10 秒一个关键帧"""
+    subprocess.run([
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc2=size=320x180:rate=10,fade=t=in:st={black}:d=0.1",
+        "-t", str(DURATION), "-g", "100", "-c:v", "mpeg4", "-q:v", "5", path,
+    ], check=True)
+
+
+def is_black(image_path: str) -> bool:
+    stream = ffmpeg.input(image_path).video.filter(
+        'blackframe', amount=THUMBNAIL_BLACK_AMOUNT, threshold=THUMBNAIL_BLACK_LEVEL
+    )
+    _, err = ffmpeg.run(ffmpeg.output(stream, '-', format='null'), capture_stdout=True, capture_stderr=True)
+    return b"pblack:" in err
+
+
+@pytest.fixture
+def ffmpeg_runs(monkeypatch):
+    """记录启动的 ffmpeg 进程数"""
+    runs = []
+    popen = subprocess.Popen
+
+    def counting_popen(args, *rest, **kwargs):
+        runs.append(args)
+        return popen(args, *rest, **kwargs)
+
+    monkeypatch.setattr(subprocess, "Popen", counting_popen)
+    return runs
+
+
+def test_black_keyframes_are_skipped_in_one_run(tmp_path, ffmpeg_runs):
+    video = str(tmp_path / "intro.mp4")
+    make_video(video, black=12)
+    thumbnail = str(tmp_path / "thumb.jpg")
+    ffmpeg_runs.clear()
+    # 0.1 和 0.25 处之后的关键帧（10 秒）是黑帧，0.5 处之后的关键帧（20 秒）不是
+    VideoService._run_thumbnail_ffmpeg(video, thumbnail, ("jpg",), DURATION, 0.1)
+    assert len(ffmpeg_runs) == 1
+    assert not is_black(thumbnail)
+
+
+def test_all_black_falls_back_to_position(tmp_path, ffmpeg_runs):
+    video = str(tmp_path / "black.mp4")
+    make_video(video, black=DURATION)
+    thumbnail = str(tmp_path / "thumb.jpg")
+    ffmpeg_runs.clear()
+    VideoService._run_thumbnail_ffmpeg(video, thumbnail, ("jpg",), DURATION, 0.1)
+    assert len(ffmpeg_runs) == 1
+    assert is_black(thumbnail)
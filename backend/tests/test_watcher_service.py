@@ -0,0 +1,143 @@
+"""文件监控的事件合并与回放：同一个去抖窗口内的文件操作和目录操作按发生顺序生效
+
+直接向 LibraryEventHandler 发送 watchdog 事件（文件系统先做相应的改动），
+停止后台刷新线程后手动回放，检查数据库中的记录。
+"""
+import os
+
+import pytest
+from watchdog.events import DirDeletedEvent, DirMovedEvent, FileCreatedEvent, FileMovedEvent
+
+from app.models.library_root import LibraryRoot
+from app.models.video import Video
+from app.services import watcher_service
+from app.services.video_service import VideoService
+from app.services.watcher_service import LibraryEventHandler
+
+
+@pytest.fixture
+def library(tmp_path, session_factory, monkeypatch):
+    root = tmp_path / "library"
+    root.mkdir()
+    monkeypatch.setattr(watcher_service, "SessionLocal", session_factory)
+    monkeypatch.setattr(VideoService, "probe_media", staticmethod(lambda filepath, timeout=None: {"duration": 60.0}))
+    db = session_factory()
+    try:
+        library_root = LibraryRoot(name="library", path=str(root))
+        db.add(library_root)
+        db.commit()
+        root_id = library_root.id
+    finally:
+        db.close()
+    return root, root_id
+
+
+@pytest.fixture
+def handler(library):
+    root, root_id = library
+    handler = LibraryEventHandler(root_id, str(root), debounce=60, max_delay=60)
+    yield handler
+    handler.stop()
+
+
+def replay(handler):
+    handler.stop()
+    ops, handler.ops = handler.ops, []
+    handler._apply(ops)
+
+
+def videos(session_factory) -> dict:
+    db = session_factory()
+    try:
+        return {video.filepath: video.id for video in db.query(Video)}
+    finally:
+        db.close()
+
+
+def add_video(session_factory, root_id: int, rel_path: str) -> int:
+    db = session_factory()
+    try:
+        video = Video(root_id=root_id, filename=os.path.basename(rel_path), filepath=rel_path)
+        db.add(video)
+        db.commit()
+        return video.id
+    finally:
+        db.close()
+
+
+def test_file_created_then_directory_moved(library, handler, session_factory):
+    root, _ = library
+    (root / "a").mkdir()
+    (root / "a" / "new.mp4").write_bytes(b"video")
+    handler.on_created(FileCreatedEvent(str(root / "a" / "new.mp4")))
+    os.rename(root / "a", root / "b")
+    handler.on_moved(DirMovedEvent(str(root / "a"), str(root / "b")))
+    replay(handler)
+    assert list(videos(session_factory)) == [os.path.join("b", "new.mp4")]
+
+
+def test_file_created_then_directory_moved_twice(library, handler, session_factory):
+    root, _ = library
+    (root / "a").mkdir()
+    (root / "a" / "new.mp4").write_bytes(b"video")
+    handler.on_created(FileCreatedEvent(str(root / "a" / "new.mp4")))
+    os.rename(root / "a", root / "b")
+    handler.on_moved(DirMovedEvent(str(root / "a"), str(root / "b")))
+    os.rename(root / "b", root / "c")
+    handler.on_moved(DirMovedEvent(str(root / "b"), str(root / "c")))
+    replay(handler)
+    assert list(videos(session_factory)) == [os.path.join("c", "new.mp4")]
+
+
+def test_file_created_then_directory_deleted(library, handler, session_factory):
+    root, _ = library
+    (root / "a").mkdir()
+    (root / "a" / "new.mp4").write_bytes(b"video")
+    handler.on_created(FileCreatedEvent(str(root / "a" / "new.mp4")))
+    (root / "a" / "new.mp4").unlink()
+    (root / "a").rmdir()
+    handler.on_deleted(DirDeletedEvent(str(root / "a")))
+    replay(handler)
+    assert videos(session_factory) == {}
+
+
+def test_file_moved_into_directory_then_directory_moved(library, handler, session_factory):
+    root, root_id = library
+    video_id = add_video(session_factory, root_id, "old.mp4")
+    (root / "old.mp4").write_bytes(b"video")
+    (root / "a").mkdir()
+    os.rename(root / "old.mp4", root / "a" / "old.mp4")
+    handler.on_moved(FileMovedEvent(str(root / "old.mp4"), str(root / "a" / "old.mp4")))
+    os.rename(root / "a", root / "b")
+    handler.on_moved(DirMovedEvent(str(root / "a"), str(root / "b")))
+    replay(handler)
+    assert videos(session_factory) == {os.path.join("b", "old.mp4"): video_id}
+
+
+def test_file_moved_out_then_directory_deleted(library, handler, session_factory):
+    root, root_id = library
+    video_id = add_video(session_factory, root_id, os.path.join("a", "keep.mp4"))
+    (root / "a").mkdir()
+    (root / "a" / "keep.mp4").write_bytes(b"video")
+    os.rename(root / "a" / "keep.mp4", root / "keep.mp4")
+    handler.on_moved(FileMovedEvent(str(root / "a" / "keep.mp4"), str(root / "keep.mp4")))
+    (root / "a").rmdir()
+    handler.on_deleted(DirDeletedEvent(str(root / "a")))
+    replay(handler)
+    # 标签、收藏等随记录保留，记录ID不变
+    assert videos(session_factory) == {"keep.mp4": video_id}
+
+
+def test_directory_moved_then_file_created(library, handler, session_factory):
+    root, root_id = library
+    video_id = add_video(session_factory, root_id, os.path.join("a", "old.mp4"))
+    (root / "a").mkdir()
+    (root / "a" / "old.mp4").write_bytes(b"video")
+    os.rename(root / "a", root / "b")
+    handler.on_moved(DirMovedEvent(str(root / "a"), str(root / "b")))
+    (root / "b" / "new.mp4").write_bytes(b"video")
+    handler.on_created(FileCreatedEvent(str(root / "b" / "new.mp4")))
+    replay(handler)
+    result = videos(session_factory)
+    assert result[os.path.join("b", "old.mp4")] == video_id
+    assert set(result) == {os.path.join("b", "old.mp4"), os.path.join("b", "new.mp4")}
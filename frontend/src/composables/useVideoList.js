@@ -97,6 +97,7 @@ export function useVideoList(props = {}) {
       )
 
       const response = await VideoService.getVideos(cleanParams)
+      await attachThumbnails(response.items)
       videos.value = response.items
       total.value = response.total
       
@@ -110,6 +111,22 @@ export function useVideoList(props = {}) {
     }
   }
 
+  // 一次请求取回整页的缩略图，渲染前写入 thumbnail_src，避免每张卡片各发一次请求
+  // 尚未生成的缩略图不在结果中，对应卡片仍按 thumbnail_url 加载并重试
+  const attachThumbnails = async (items) => {
+    if (items.length === 0) return
+    const width = Math.round((isListView.value ? 160 : 320) * (window.devicePixelRatio || 1))
+    const result = await VideoService.getThumbnails(items.map(video => video.id), width)
+    if (!result) return
+    for (const video of items) {
+      const thumbnail = result.thumbnails[video.id]
+      if (thumbnail) {
+        video.thumbnail_src = thumbnail.src
+        video.thumbnail_generated = true
+      }
+    }
+  }
+
   // 加载标签列表
   const loadTags = async () => {
     try {
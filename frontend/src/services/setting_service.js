@@ -66,6 +66,26 @@ class SettingService {
     const response = await apiClient.get('/videos/scan/progress')
     return response.data
   }
+
+  // 订阅扫描进度推送（Server-Sent Events），返回 EventSource，调用方负责 close()
+  subscribeScanProgress(onProgress, onError) {
+    const source = new EventSource('/api/videos/scan/progress/stream')
+    source.addEventListener('progress', (event) => {
+      onProgress(JSON.parse(event.data))
+    })
+    source.onerror = (error) => {
+      if (onError) {
+        onError(error)
+      }
+    }
+    return source
+  }
+
+  // 取消扫描任务
+  async cancelScan(jobId) {
+    const response = await apiClient.post(`/videos/scan/jobs/${jobId}/cancel`)
+    return response.data
+  }
 }
 
 export default new SettingService()
\ No newline at end of file
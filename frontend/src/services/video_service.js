@@ -211,4 +211,54 @@ export default {
     }
   },
 
+  /**
+   * 批量获取一页视频的内联缩略图（data URI），失败时返回null，由各卡片按单张地址加载
+   * @param {number[]} videoIds - 视频ID列表
+   * @param {number} [width] - 期望的宽度（像素）
+   * @returns {Promise<{thumbnails: Object, pending: number[], failed: number[]}|null>}
+   */
+  async getThumbnails(videoIds, width) {
+    try {
+      const response = await apiClient.get('/videos/thumbnails/batch', {
+        params: { ids: videoIds.join(','), w: width }
+      });
+      return response.data;
+    } catch (error) {
+      return null;
+    }
+  },
+
+  /**
+   * 获取视频的播放方式，后端按 HLS 设置和视频编码决定
+   * 请求失败时退回直接读取文件
+   * @param {number} videoId - 视频ID
+   * @returns {Promise<{type: 'hls'|'file', src: string}>}
+   */
+  async getPlaybackSource(videoId) {
+    try {
+      const response = await apiClient.get(`/videos/${videoId}/playback`);
+      return response.data;
+    } catch (error) {
+      return { type: 'file', src: `/api/videos/${videoId}/stream` };
+    }
+  },
+
+  /**
+   * 获取拖动进度条时的预览图索引地址
+   * 尚未生成时后端会在后台生成并返回202，此时返回null
+   * @param {number} videoId - 视频ID
+   */
+  async getStoryboardUrl(videoId) {
+    const url = `/videos/${videoId}/storyboard`;
+    try {
+      // 202（生成中）和404（无法生成）都属于正常情况，不弹出错误提示
+      const response = await apiClient.get(url, {
+        validateStatus: (status) => [200, 202, 404].includes(status)
+      });
+      return response.status === 200 ? `/api${url}` : null;
+    } catch (error) {
+      return null;
+    }
+  },
+
 };
\ No newline at end of file